@@ -0,0 +1,151 @@
+import gzip
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+PRECOMPRESSED_KEY = 'compressed:{}:{}'
+ENCODED_HEADERS = ('content-length', 'content-encoding')
+
+
+def get_encodings():
+    """Поддерживаемые кодировки в порядке предпочтения."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def parse_accept_encoding(header):
+    """Заголовок Accept-Encoding в словарь {кодировка: q}."""
+    accepted = {}
+    for item in header.split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip().replace(' ', '')
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+
+def get_encoding(request):
+    """
+    Кодировка, которой сжимать ответ на request, или None, если клиент
+    не принимает сжатые ответы или сжатие выключено.
+    """
+    if not settings.RESPONSE_COMPRESSION:
+        return None
+    accepted = parse_accept_encoding(
+        request.META.get('HTTP_ACCEPT_ENCODING', '')
+    )
+    best, best_quality = None, 0.0
+    for encoding in get_encodings():
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(content, encoding, precompress=False):
+    """
+    Сжимает content. Для ответов, которые сжимаются один раз и лежат
+    в кэше (precompress), берётся максимальная степень сжатия.
+    """
+    if encoding == 'br':
+        return brotli.compress(
+            content, quality=11 if precompress else 5
+        )
+    return gzip.compress(content, compresslevel=9 if precompress else 6)
+
+
+def is_compressible(response):
+    content_type = response.get('Content-Type', '').partition(';')[0]
+    return (
+        not response.streaming
+        and not response.has_header('Content-Encoding')
+        and content_type.strip().lower() in settings.RESPONSE_COMPRESSION_TYPES
+    )
+
+
+def encode_response(response, content, encoding):
+    """Подменяет тело ответа сжатым content."""
+    response.content = content
+    response['Content-Length'] = str(len(content))
+    response['Content-Encoding'] = encoding
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response['ETag'] = 'W/' + etag
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def get_precompressed_key(request, etag, media_type):
+    """
+    Ключ кэша сжатого ответа с этим ETag в формате media_type или None,
+    если ответ клиенту сжимать не нужно.
+    """
+    encoding = get_encoding(request)
+    if encoding is None:
+        return None
+    digest = hashlib.md5(f'{media_type}\n{etag}'.encode()).hexdigest()
+    return PRECOMPRESSED_KEY.format(encoding, digest)
+
+
+def get_cached_headers(response):
+    """Заголовки ответа, которые не зависят от сжатия тела."""
+    return [
+        (header, value) for header, value in response.items()
+        if header.lower() not in ENCODED_HEADERS
+    ]
+
+
+class CompressionMiddleware:
+    """
+    Сжимает ответы gzip или brotli (если он установлен) по заголовку
+    Accept-Encoding.
+
+    Сжимаются только ответы типов RESPONSE_COMPRESSION_TYPES от
+    RESPONSE_COMPRESSION_MIN_SIZE байт; потоковые ответы отдаются как
+    есть. Если представление задало ответу precompressed_key, сжатое
+    тело кладётся в кэш вместе с заголовками ответа, и представление
+    может отдавать его, не сжимая заново. Включается настройкой
+    RESPONSE_COMPRESSION.
+    """
+
+    def __init__(self, get_response):
+        if not settings.RESPONSE_COMPRESSION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not is_compressible(response):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < settings.RESPONSE_COMPRESSION_MIN_SIZE:
+            return response
+        encoding = get_encoding(request)
+        if encoding is None:
+            return response
+        key = getattr(response, 'precompressed_key', None)
+        content = compress(response.content, encoding, key is not None)
+        if len(content) >= len(response.content):
+            return response
+        if key is not None:
+            cache.set(
+                key,
+                (encoding, get_cached_headers(response), content),
+                settings.PRECOMPRESSED_CACHE_TTL
+            )
+        return encode_response(response, content, encoding)
@@ -0,0 +1,236 @@
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.permissions import IsAdminUser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+METRICS = {
+    'request_duration_seconds': (
+        'Total request processing time.', DURATION_BUCKETS
+    ),
+    'request_db_duration_seconds': (
+        'Time spent in SQL queries per request.', DURATION_BUCKETS
+    ),
+    'request_serialize_duration_seconds': (
+        'Time spent rendering the response body.', DURATION_BUCKETS
+    ),
+    'request_db_queries': ('SQL queries per request.', QUERY_BUCKETS),
+}
+PREFIX = 'foodgram_'
+
+
+class Histogram:
+    """Гистограмма в духе Prometheus: счётчики не сбрасываются."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            total += count
+            yield bound, total
+
+
+class Registry:
+    """
+    Гистограммы метрик по представлениям и методам запросов.
+
+    Данные живут в памяти процесса: каждый воркер gunicorn отдаёт свои,
+    Prometheus собирает их с каждого и складывает.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._requests = {}
+
+    def observe(self, labels, status, values):
+        with self._lock:
+            for name, value in values.items():
+                histogram = self._histograms.get((name, labels))
+                if histogram is None:
+                    histogram = self._histograms[(name, labels)] = Histogram(
+                        METRICS[name][1]
+                    )
+                histogram.observe(value)
+            key = (*labels, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+    def export(self):
+        """Метрики в текстовом формате Prometheus."""
+        with self._lock:
+            histograms = {
+                key: (list(histogram.cumulative()), histogram.sum)
+                for key, histogram in self._histograms.items()
+            }
+            requests = dict(self._requests)
+        lines = [
+            f'# HELP {PREFIX}requests_total Requests by view and status.',
+            f'# TYPE {PREFIX}requests_total counter',
+        ]
+        for (view, method, status), count in sorted(requests.items()):
+            labels = format_labels(view=view, method=method, status=status)
+            lines.append(f'{PREFIX}requests_total{{{labels}}} {count}')
+        for name, (description, _) in METRICS.items():
+            lines.append(f'# HELP {PREFIX}{name} {description}')
+            lines.append(f'# TYPE {PREFIX}{name} histogram')
+            for (metric, (view, method)), (buckets, total) in sorted(
+                histograms.items()
+            ):
+                if metric != name:
+                    continue
+                labels = format_labels(view=view, method=method)
+                for bound, count in buckets:
+                    lines.append(
+                        f'{PREFIX}{name}_bucket{{{labels},le="{bound}"}} '
+                        f'{count}'
+                    )
+                lines.append(f'{PREFIX}{name}_sum{{{labels}}} {total}')
+                lines.append(
+                    f'{PREFIX}{name}_count{{{labels}}} {buckets[-1][1]}'
+                )
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(**labels):
+    return ','.join(
+        f'{key}="' + str(value).replace('\\', r'\\').replace(
+            '"', r'\"'
+        ).replace('\n', r'\n') + '"'
+        for key, value in labels.items()
+    )
+
+
+registry = Registry()
+
+
+class QueryTimer:
+    """Обёртка выполнения SQL: считает запросы и их суммарное время."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class RequestMetricsMiddleware:
+    """
+    Замеряет запросы к базе, рендер ответа и общее время запроса.
+
+    Результаты отдаются в заголовке Server-Timing, пишутся в лог
+    foodgram.metrics одной JSON-строкой и копятся в гистограммах для
+    /api/metrics/. Включается настройкой REQUEST_METRICS; когда она
+    выключена, Django исключает middleware из цепочки при старте.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        request.render_duration = 0.0
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+        render = request.render_duration
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={timer.duration * 1000:.1f};'
+            f'desc="{timer.count} queries"',
+            f'serialize;dur={render * 1000:.1f}',
+            f'app;dur={(total - timer.duration - render) * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ))
+        registry.observe(
+            (view, request.method),
+            response.status_code,
+            {
+                'request_duration_seconds': total,
+                'request_db_duration_seconds': timer.duration,
+                'request_serialize_duration_seconds': render,
+                'request_db_queries': timer.count,
+            }
+        )
+        logger.info(json.dumps({
+            'view': view,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': timer.count,
+            'db_ms': round(timer.duration * 1000, 2),
+            'serialize_ms': round(render * 1000, 2),
+            'total_ms': round(total * 1000, 2),
+        }))
+        return response
+
+    def process_template_response(self, request, response):
+        """Рендер ответов DRF идёт после представления, его меряем отдельно."""
+        start = time.perf_counter()
+
+        def rendered(response):
+            request.render_duration = time.perf_counter() - start
+        response.add_post_render_callback(rendered)
+        return response
+
+
+class PrometheusRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, str):
+            return data.encode(self.charset)
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = JSONRenderer.media_type
+        return JSONRenderer().render(data)
+
+
+class MetricsView(APIView):
+    """Метрики запросов для Prometheus, только для администраторов."""
+    permission_classes = (IsAdminUser,)
+    renderer_classes = (PrometheusRenderer,)
+
+    def get(self, request):
+        return Response(
+            registry.export(),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
@@ -0,0 +1,161 @@
+import logging
+import os
+import re
+import sys
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.serializers import BaseSerializer
+
+logger = logging.getLogger(__name__)
+
+MODES = ('off', 'log', 'raise')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_SPACES = re.compile(r'\s+')
+
+
+class NPlusOneError(AssertionError):
+    """Повторяющиеся запросы одной формы в строгом режиме."""
+
+
+def normalize(sql):
+    """
+    Форма запроса: литералы и списки IN заменены заглушками, поэтому
+    запросы, отличающиеся только параметрами, совпадают.
+    """
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def _is_project_file(filename):
+    return (
+        filename.startswith(settings.BASE_DIR)
+        and 'site-packages' not in filename
+        and filename != __file__
+    )
+
+
+def find_source():
+    """
+    Откуда выполняется запрос: поле сериализатора, которое его вызвало,
+    и ближайшая строка кода проекта.
+    """
+    field = line = None
+    frame = sys._getframe(1)
+    while frame is not None and (field is None or line is None):
+        code = frame.f_code
+        if field is None and code.co_name == 'to_representation':
+            serializer = frame.f_locals.get('self')
+            serializer_field = frame.f_locals.get('field')
+            if (
+                isinstance(serializer, BaseSerializer)
+                and serializer_field is not None
+            ):
+                field = (
+                    f'{type(serializer).__name__}.'
+                    f'{serializer_field.field_name}'
+                )
+        if line is None and _is_project_file(code.co_filename):
+            path = os.path.relpath(code.co_filename, settings.BASE_DIR)
+            line = f'{path}:{frame.f_lineno} in {code.co_name}'
+        frame = frame.f_back
+    return ', '.join(part for part in (field, line) if part) or 'неизвестно'
+
+
+class QueryPatternDetector:
+    """
+    Обёртка выполнения SQL, которая ищет N+1: одинаковые по форме
+    SELECT-запросы, повторённые больше threshold раз.
+
+    Источник запроса определяется один раз для каждой формы, когда она
+    превышает порог, поэтому обычные запросы почти ничего не стоят.
+    """
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.counts = Counter()
+        self.sources = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip()[:6].upper() == 'SELECT':
+            shape = normalize(sql)
+            if not any(
+                pattern in shape
+                for pattern in settings.NPLUSONE_IGNORE
+            ):
+                self.counts[shape] += 1
+                if self.counts[shape] == self.threshold + 1:
+                    self.sources[shape] = find_source()
+        return execute(sql, params, many, context)
+
+    def get_problems(self):
+        """Список (число повторов, форма запроса, источник)."""
+        return [
+            (self.counts[shape], shape, source)
+            for shape, source in self.sources.items()
+        ]
+
+    def report(self, label, mode):
+        problems = self.get_problems()
+        if not problems:
+            return
+        message = '\n'.join(
+            f'N+1 в {label}: {count} запросов вида {shape!r}, '
+            f'источник: {source}'
+            for count, shape, source in problems
+        )
+        if mode == 'raise':
+            raise NPlusOneError(message)
+        logger.warning(message)
+
+
+@contextmanager
+def detect_n_plus_one(label='блоке', mode='raise', threshold=None):
+    """
+    Ищет N+1 в запросах внутри блока, например в тесте:
+
+        with detect_n_plus_one():
+            client.get('/api/recipes/')
+    """
+    detector = QueryPatternDetector(
+        settings.NPLUSONE_THRESHOLD if threshold is None else threshold
+    )
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(detector))
+        yield detector
+    detector.report(label, mode)
+
+
+class NPlusOneMiddleware:
+    """
+    Проверяет каждый запрос на N+1. Режим задаётся настройкой
+    NPLUSONE_DETECTION: log пишет предупреждение в лог foodgram.nplusone
+    (для стенда), raise бросает NPlusOneError (для тестов), off
+    исключает middleware из цепочки.
+    """
+
+    def __init__(self, get_response):
+        self.mode = settings.NPLUSONE_DETECTION
+        if self.mode not in MODES:
+            raise ValueError(
+                f'NPLUSONE_DETECTION must be one of {", ".join(MODES)}'
+            )
+        if self.mode == 'off':
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with detect_n_plus_one(
+            f'{request.method} {request.path}', self.mode
+        ):
+            response = self.get_response(request)
+        return response
@@ -1,4 +1,5 @@
 import os
+from importlib.util import find_spec
 
 from dotenv import load_dotenv
 
@@ -23,6 +24,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'djoser',
@@ -32,6 +34,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.metrics.RequestMetricsMiddleware',
+    'foodgram.nplusone.NPlusOneMiddleware',
+    'foodgram.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,6 +87,58 @@ else:
         }
     }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
+    }
+}
+API_CACHE_TTL = int(os.getenv('API_CACHE_TTL', default=60))
+RECIPE_FAST_SERIALIZATION = (
+    os.getenv('RECIPE_FAST_SERIALIZATION', default='True') == 'True'
+)
+REQUEST_METRICS = (
+    os.getenv('REQUEST_METRICS', default='False') == 'True'
+)
+NPLUSONE_DETECTION = os.getenv('NPLUSONE_DETECTION', default='off')
+NPLUSONE_THRESHOLD = int(os.getenv('NPLUSONE_THRESHOLD', default=3))
+NPLUSONE_IGNORE = ()
+RESPONSE_COMPRESSION = (
+    os.getenv('RESPONSE_COMPRESSION', default='True') == 'True'
+)
+RESPONSE_COMPRESSION_MIN_SIZE = int(
+    os.getenv('RESPONSE_COMPRESSION_MIN_SIZE', default=1024)
+)
+RESPONSE_COMPRESSION_TYPES = (
+    'application/json',
+    'application/msgpack',
+    'text/plain',
+    'text/csv',
+)
+PRECOMPRESSED_CACHE_TTL = 60 * 60 * 24
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'foodgram.metrics': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'foodgram.nplusone': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -112,8 +169,24 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': ('recipes.pagination.' +
                                  'CustomPageNumberPagination'),
     'DEFAULT_FILTER_BACKENDS': [('django_filters.rest_framework.' +
-                                'DjangoFilterBackend')]
+                                'DjangoFilterBackend')],
+    'DEFAULT_RENDERER_CLASSES': [
+        'recipes.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
+if find_spec('msgpack'):
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append(
+        'recipes.renderers.MessagePackRenderer'
+    )
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].append(
+        'recipes.parsers.MessagePackParser'
+    )
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'HIDE_USERS': False,
@@ -166,3 +239,27 @@ PADDING_START_TEXT = 50
 PADDING_START_NUMBER = 550
 PADDING_BOTTOM_FIRST_ROW = 800
 PADDING_BOTTOM_ROWS = 750
+PAGINATION_COUNT_CACHE_TTL = 60
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 10000
+INGREDIENT_SEARCH_LIMIT = 50
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL', default=300))
+SHOPPING_LIST_FONT = os.path.join(BASE_DIR, 'FreeSans.ttf')
+SHOPPING_LIST_CACHE_DIR = os.getenv(
+    'SHOPPING_LIST_CACHE_DIR',
+    default=os.path.join(BASE_DIR, 'cache', 'shopping_lists')
+)
+SHOPPING_LIST_CACHE_TTL = int(
+    os.getenv('SHOPPING_LIST_CACHE_TTL', default=60 * 60 * 24)
+)
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', default=7 * 1024 * 1024)
+)
+RECIPE_IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+RECIPE_IMAGE_VARIANTS = {
+    'card': (480, 480),
+    'detail': (1280, 1280),
+}
+RECIPE_IMAGE_QUALITY = 80
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', default=2))
+RECIPE_IMAGE_GC_GRACE = 60 * 60
+COOKABLE_INDEX_TTL = int(os.getenv('COOKABLE_INDEX_TTL', default=300))
@@ -3,7 +3,10 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from foodgram.metrics import MetricsView
+
 urlpatterns = [
+    path('api/metrics/', MetricsView.as_view(), name='metrics'),
     path('api/', include('users.urls')),
     path('api/', include('recipes.urls')),
     path('admin/', admin.site.urls),
@@ -1,8 +1,65 @@
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
 from django.contrib.auth.models import Group
+from django.db.models import Prefetch
 
 from recipes.models import Ingredient, Recipe, Tag
-
+from recipes.pagination import EstimatedCountPaginator
+from recipes.search import search_recipes
+
+
+class AutocompleteFilter(admin.RelatedFieldListFilter):
+    """
+    Фильтр по внешнему ключу с полем автодополнения: вместо списка всех
+    значений из базы читается только выбранное.
+
+    Связанная модель должна быть зарегистрирована в админке с
+    search_fields.
+    """
+    template = 'admin/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin,
+                 field_path):
+        self.admin_site = model_admin.admin_site
+        super().__init__(
+            field, request, params, model, model_admin, field_path
+        )
+
+    def field_choices(self, field, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def queryset(self, request, queryset):
+        # Очищенное поле автодополнения приходит пустой строкой.
+        self.used_parameters = {
+            name: value for name, value in self.used_parameters.items()
+            if value != ''
+        }
+        return super().queryset(request, queryset)
+
+    def choices(self, changelist):
+        own = (self.lookup_kwarg, self.lookup_kwarg_isnull)
+        field = forms.ModelChoiceField(
+            queryset=self.field.remote_field.model._default_manager.all(),
+            widget=AutocompleteSelect(
+                self.field,
+                self.admin_site,
+                attrs={'data-width': '100%', 'onchange': 'this.form.submit()'}
+            ),
+            required=False
+        )
+        yield {
+            'selected': bool(self.lookup_val),
+            'widget': field.widget.render(self.lookup_kwarg, self.lookup_val),
+            'params': [
+                (name, value) for name, value in changelist.params.items()
+                if name not in own
+            ],
+            'reset_query_string': changelist.get_query_string(remove=own),
+        }
 
 
 class TabularInlineRecipeTag(admin.TabularInline):
@@ -15,6 +72,7 @@ class TabularInlineRecipeTag(admin.TabularInline):
 class TabularInlineRecipeIngredient(admin.TabularInline):
     """Класс для красивого отображения ингредиентов в рецепте."""
     model = Recipe.ingredients.through
+    autocomplete_fields = ('ingredient',)
     extra = 1
     min_num = 1
 
@@ -33,7 +91,13 @@ class IngredientAdmin(admin.ModelAdmin):
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    """Рецепты с поиском и фильтрами по названию, автору и тэгам."""
+    """
+    Рецепты с поиском и фильтрами по автору и тэгам.
+
+    Список рассчитан на большие таблицы: авторы и ингредиенты читаются
+    для всей страницы сразу, автор выбирается автодополнением, поиск
+    идёт по полнотекстовому индексу рецептов.
+    """
     list_display = (
         'name',
         'author',
@@ -41,18 +105,40 @@ class RecipeAdmin(admin.ModelAdmin):
         'get_favorite',
         'get_ingredients'
     )
-    search_fields = ('name', 'author', 'tags')
-    list_filter = ('author', 'name', 'tags')
+    list_select_related = ('author',)
+    search_fields = ('name',)
+    list_filter = (('author', AutocompleteFilter), 'tags')
+    autocomplete_fields = ('author',)
     inlines = (TabularInlineRecipeTag, TabularInlineRecipeIngredient)
-
-    @admin.display(description='В избранном')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    @property
+    def media(self):
+        return super().media + AutocompleteSelect(
+            Recipe._meta.get_field('author'), self.admin_site
+        ).media
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            Prefetch('ingredients', Ingredient.objects.only('name'))
+        )
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по названию, ингредиентам и описанию рецепта."""
+        if not search_term.strip():
+            return queryset, False
+        return search_recipes(queryset, search_term), False
+
+    @admin.display(description='В избранном', ordering='favorites_count')
     def get_favorite(self, obj):
-        return obj.favorite.count()
+        return obj.favorites_count
 
     @admin.display(description='Ингредиенты')
     def get_ingredients(self, obj):
-        ingredients = obj.ingredients.all().values_list('name', flat=True)
-        return ', '.join(ingredients)
+        return ', '.join(
+            ingredient.name for ingredient in obj.ingredients.all()
+        )
 
 
 admin.site.unregister(Group)
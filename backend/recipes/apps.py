@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class RecipesConfig(AppConfig):
     name = 'recipes'
+
+    def ready(self):
+        from recipes import signals  # noqa: F401
+        from recipes.shopping_list import register_fonts
+        register_fonts()
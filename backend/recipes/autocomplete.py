@@ -0,0 +1,92 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from recipes.models import Ingredient
+
+
+def normalize(value):
+    """Приводит строку к виду для поиска: регистр и ё/е не различаются."""
+    return value.casefold().replace('ё', 'е')
+
+
+class IngredientIndex:
+    """
+    Индекс ингредиентов в памяти для автодополнения.
+
+    Нормализованные названия хранятся отсортированными, совпадения
+    по началу названия ищутся бинарным поиском, остальные совпадения
+    по подстроке добираются линейным проходом.
+    """
+
+    def __init__(self, ingredients):
+        self.ingredients = sorted(
+            ingredients,
+            key=lambda ingredient: (
+                normalize(ingredient.name), ingredient.measurement_unit
+            )
+        )
+        self.keys = [
+            normalize(ingredient.name) for ingredient in self.ingredients
+        ]
+
+    def search(self, query, limit=None):
+        """
+        Возвращает ингредиенты, в названии которых есть query: сначала
+        начинающиеся с query, затем содержащие его.
+        """
+        query = normalize(query)
+        limit = limit or len(self.keys)
+        result = []
+        position = bisect_left(self.keys, query)
+        while (
+            position < len(self.keys)
+            and self.keys[position].startswith(query)
+            and len(result) < limit
+        ):
+            result.append(self.ingredients[position])
+            position += 1
+        if len(result) < limit:
+            for key, ingredient in zip(self.keys, self.ingredients):
+                if query in key and not key.startswith(query):
+                    result.append(ingredient)
+                    if len(result) >= limit:
+                        break
+        return result
+
+
+_lock = threading.Lock()
+_index = None
+_built_at = 0
+
+
+def get_index():
+    """
+    Возвращает индекс, при необходимости строит его заново.
+
+    Индекс сбрасывается сигналами при изменении ингредиентов в этом
+    процессе, изменения из других процессов подхватываются по истечении
+    INGREDIENT_INDEX_TTL.
+    """
+    global _index, _built_at
+    index = _index
+    if (
+        index is not None
+        and time.monotonic() - _built_at < settings.INGREDIENT_INDEX_TTL
+    ):
+        return index
+    with _lock:
+        if _index is index:
+            _index = IngredientIndex(
+                Ingredient.objects.only('id', 'name', 'measurement_unit')
+            )
+            _built_at = time.monotonic()
+        return _index
+
+
+def invalidate_index():
+    """Сбрасывает индекс, он будет построен при следующем запросе."""
+    global _index
+    _index = None
@@ -0,0 +1,172 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from foodgram.compression import encode_response, get_precompressed_key
+from recipes.models import CatalogVersion
+
+GENERATION_KEY = 'api-generation:{}'
+
+
+def get_generation(group):
+    """Текущее поколение группы кэша, при смене поколения кэш устаревает."""
+    key = GENERATION_KEY.format(group)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, 1, timeout=None)
+        generation = cache.get(key, 1)
+    return generation
+
+
+def bump_generation(*groups):
+    """Сбрасывает кэш групп после фиксации текущей транзакции."""
+    def bump():
+        for group in groups:
+            key = GENERATION_KEY.format(group)
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, 1, timeout=None)
+    transaction.on_commit(bump)
+
+
+def get_cache_key(request, group):
+    """
+    Ключ ответа: группа, её поколение и хэш адреса с упорядоченными
+    параметрами, чтобы в ключ не попадали пробелы и не-ASCII символы.
+    """
+    params = '&'.join(
+        f'{name}={value}'
+        for name in sorted(request.query_params)
+        for value in sorted(request.query_params.getlist(name))
+    )
+    url = f'{request.get_host()}{request.path}?{params}'
+    return (
+        f'api:{group}:{get_generation(group)}:'
+        f'{hashlib.md5(url.encode()).hexdigest()}'
+    )
+
+
+class CachedListMixin:
+    """
+    Кэширует данные ответа list.
+
+    cache_group задаёт группу, поколение которой сбрасывается сигналами
+    при изменении связанных моделей. При cache_anonymous_only кэшируются
+    только ответы анонимным пользователям.
+    """
+    cache_group = None
+    cache_anonymous_only = False
+
+    def list(self, request, *args, **kwargs):
+        if self.cache_anonymous_only and request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        key = get_cache_key(request, self.cache_group)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.API_CACHE_TTL)
+        return response
+
+
+def get_catalog_versions():
+    """Версии справочников: {название: (версия, дата изменения)}."""
+    return {
+        name: (version, updated_at)
+        for name, version, updated_at in CatalogVersion.objects.values_list(
+            'name', 'version', 'updated_at'
+        )
+    }
+
+
+def bump_catalog_version(name):
+    """Увеличивает версию справочника."""
+    if not CatalogVersion.objects.filter(name=name).update(
+        version=F('version') + 1, updated_at=timezone.now()
+    ):
+        CatalogVersion.objects.get_or_create(
+            name=name, defaults={'version': 1}
+        )
+
+
+def make_etag(request, *parts):
+    """ETag из частей состояния, адреса запроса и выбранного формата."""
+    digest = hashlib.md5(repr((
+        parts,
+        request.get_full_path(),
+        request.accepted_renderer.format,
+    )).encode()).hexdigest()
+    return quote_etag(digest)
+
+
+def _timestamp(value):
+    return int(value.timestamp()) if value is not None else None
+
+
+def set_validators(response, etag, last_modified=None):
+    """Выставляет ответу заголовки ETag и Last-Modified."""
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(_timestamp(last_modified))
+    return response
+
+
+def get_not_modified(request, etag, last_modified=None):
+    """Возвращает ответ 304, если у клиента актуальная версия, иначе None."""
+    response = get_conditional_response(
+        request, etag=etag, last_modified=_timestamp(last_modified)
+    )
+    if response is None:
+        return None
+    return set_validators(response, etag, last_modified)
+
+
+class ConditionalCatalogMixin:
+    """
+    Отвечает 304 на условные запросы list по версии справочника
+    catalog_name, не обращаясь к самим данным.
+
+    Сжатый ответ кэшируется с заголовками по ETag и выбранному формату,
+    то есть на версию справочника, и отдаётся из кэша без запросов
+    к базе и повторного сжатия.
+    """
+    catalog_name = None
+
+    def list(self, request, *args, **kwargs):
+        version, updated_at = get_catalog_versions().get(
+            self.catalog_name, (0, None)
+        )
+        etag = make_etag(request, self.catalog_name, version)
+        not_modified = get_not_modified(request, etag, updated_at)
+        if not_modified is not None:
+            return not_modified
+        key = get_precompressed_key(
+            request, etag, request.accepted_media_type
+        )
+        precompressed = cache.get(key) if key is not None else None
+        if precompressed is not None:
+            encoding, headers, content = precompressed
+            response = HttpResponse()
+            for header, value in headers:
+                response[header] = value
+            return encode_response(
+                set_validators(response, etag, updated_at),
+                content,
+                encoding
+            )
+        response = set_validators(
+            super().list(request, *args, **kwargs), etag, updated_at
+        )
+        if response.status_code == 200:
+            response.precompressed_key = key
+        return response
@@ -0,0 +1,133 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+
+from recipes.models import IngredientRecipe
+
+
+class CookableIndex:
+    """
+    Обратный индекс «ингредиент → рецепты» для поиска рецептов,
+    которые можно приготовить из имеющихся ингредиентов.
+
+    Для каждого ингредиента хранится отсортированный массив id рецептов,
+    для каждого рецепта — набор его ингредиентов. Запрос проходит только
+    по спискам переданных ингредиентов, а не по всем рецептам.
+    """
+
+    def __init__(self, pairs=()):
+        """pairs — пары (id рецепта, id ингредиента)."""
+        self.postings = {}
+        self.recipes = {}
+        for recipe_id, group in groupby(sorted(pairs), key=itemgetter(0)):
+            self.recipes[recipe_id] = frozenset(
+                ingredient_id for _, ingredient_id in group
+            )
+        for recipe_id, ingredient_ids in sorted(self.recipes.items()):
+            for ingredient_id in ingredient_ids:
+                self.postings.setdefault(
+                    ingredient_id, array('I')
+                ).append(recipe_id)
+
+    def set_recipe(self, recipe_id, ingredient_ids):
+        """Заменяет ингредиенты рецепта, пустой набор удаляет рецепт."""
+        old = self.recipes.pop(recipe_id, frozenset())
+        new = frozenset(ingredient_ids)
+        for ingredient_id in old - new:
+            postings = self.postings[ingredient_id]
+            del postings[bisect_left(postings, recipe_id)]
+            if not postings:
+                del self.postings[ingredient_id]
+        for ingredient_id in new - old:
+            insort(
+                self.postings.setdefault(ingredient_id, array('I')),
+                recipe_id
+            )
+        if new:
+            self.recipes[recipe_id] = new
+
+    def search(self, ingredient_ids, max_missing=None):
+        """
+        Возвращает [(не хватает ингредиентов, id рецепта)]: сначала
+        рецепты, для которых есть всё, затем те, где не хватает одного,
+        и так далее. Рецепты без единого совпадения не возвращаются.
+        """
+        covered = Counter()
+        for ingredient_id in set(ingredient_ids):
+            covered.update(self.postings.get(ingredient_id, ()))
+        recipes = self.recipes
+        result = [
+            (len(recipes[recipe_id]) - count, recipe_id)
+            for recipe_id, count in covered.items()
+        ]
+        if max_missing is not None:
+            result = [item for item in result if item[0] <= max_missing]
+        result.sort()
+        return result
+
+
+_lock = threading.Lock()
+_index = None
+_built_at = 0
+_pending = threading.local()
+
+
+def _build():
+    return CookableIndex(
+        IngredientRecipe.objects.values_list(
+            'recipe_id', 'ingredient_id'
+        ).order_by().iterator()
+    )
+
+
+def search_cookable(ingredient_ids, max_missing=None):
+    """
+    Ищет рецепты по индексу, при необходимости строит его заново.
+
+    Изменения из этого процесса вносятся в индекс сигналами, изменения
+    из других процессов подхватываются по истечении COOKABLE_INDEX_TTL.
+    """
+    global _index, _built_at
+    with _lock:
+        if (
+            _index is None
+            or time.monotonic() - _built_at >= settings.COOKABLE_INDEX_TTL
+        ):
+            _index = _build()
+            _built_at = time.monotonic()
+        return _index.search(ingredient_ids, max_missing)
+
+
+def _flush():
+    recipe_ids = getattr(_pending, 'ids', None)
+    _pending.ids = set()
+    if not recipe_ids or _index is None:
+        return
+    pairs = IngredientRecipe.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'ingredient_id').order_by()
+    ingredients = {recipe_id: set() for recipe_id in recipe_ids}
+    for recipe_id, ingredient_id in pairs:
+        ingredients[recipe_id].add(ingredient_id)
+    with _lock:
+        if _index is not None:
+            for recipe_id, ingredient_ids in ingredients.items():
+                _index.set_recipe(recipe_id, ingredient_ids)
+
+
+def schedule_cookable_update(recipe_ids):
+    """
+    Обновляет рецепты в индексе после фиксации транзакции, все
+    изменения за транзакцию вносятся одним запросом.
+    """
+    if not hasattr(_pending, 'ids'):
+        _pending.ids = set()
+    _pending.ids.update(recipe_ids)
+    transaction.on_commit(_flush)
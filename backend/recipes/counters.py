@@ -0,0 +1,71 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Follow, Recipe
+from users.models import CustomUser as User
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+)
+
+
+def change_counter(model, pk, field, delta):
+    """
+    Атомарно меняет счётчик field строки pk на delta. Счётчик не
+    уходит ниже нуля, даже если успел разойтись с данными.
+    """
+    if pk is None:
+        return
+    rows = model.objects.filter(pk=pk)
+    if delta < 0:
+        rows = rows.filter(**{f'{field}__gte': -delta})
+    rows.update(**{field: F(field) + delta})
+
+
+def count_related(related, related_field):
+    """Подзапрос: число строк related, ссылающихся на внешнюю строку."""
+    return Coalesce(
+        Subquery(
+            related.objects.filter(
+                **{related_field: OuterRef('pk')}
+            ).order_by().values(related_field).annotate(
+                count=Count('pk')
+            ).values('count')
+        ),
+        0
+    )
+
+
+def recount(model, ids=None, dry_run=False, batch_size=1000):
+    """
+    Пересчитывает счётчики model по связанным таблицам у строк ids
+    (у всех строк, если ids не заданы) и исправляет расхождения.
+
+    Возвращает {поле: число строк с расхождением}; при dry_run только
+    считает их.
+    """
+    if ids is not None:
+        ids = list(ids)
+    drift = {}
+    for counter_model, field, related, related_field in COUNTERS:
+        if counter_model is not model:
+            continue
+        actual = count_related(related, related_field)
+        rows = model.objects.all()
+        if ids is not None:
+            rows = rows.filter(pk__in=ids)
+        drifted = list(
+            rows.annotate(actual=actual).exclude(
+                **{field: F('actual')}
+            ).order_by().values_list('pk', flat=True)
+        )
+        drift[field] = len(drifted)
+        if dry_run:
+            continue
+        for start in range(0, len(drifted), batch_size):
+            model.objects.filter(
+                pk__in=drifted[start:start + batch_size]
+            ).update(**{field: actual})
+    return drift
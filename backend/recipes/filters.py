@@ -1,32 +1,100 @@
 from django_filters.rest_framework import (
+    CharFilter,
+    Filter,
     FilterSet,
-    ModelMultipleChoiceFilter,
     NumberFilter,
 )
 
-from rest_framework.filters import SearchFilter
+from django import forms
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from rest_framework.filters import BaseFilterBackend
 
-from recipes.models import Recipe, Tag
+from recipes.autocomplete import get_index
+from recipes.caching import get_generation
+from recipes.models import Recipe, Tag, TagRecipe
+from recipes.search import search_recipes
+
+
+def get_tag_ids(slugs):
+    """
+    id тэгов по слагам из закэшированного словаря «слаг → id»,
+    неизвестные слаги пропускаются.
+    """
+    key = f'tag-slugs:{get_generation("tags")}'
+    tag_ids = cache.get(key)
+    if tag_ids is None:
+        tag_ids = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(key, tag_ids, settings.API_CACHE_TTL)
+    return {tag_ids[slug] for slug in slugs if slug in tag_ids}
+
+
+def filter_by_tags(queryset, tag_ids, match_all=False):
+    """
+    Рецепты хотя бы с одним из тэгов tag_ids или, при match_all,
+    со всеми.
+
+    Один некоррелированный подзапрос id IN (SELECT recipe_id ...),
+    который читает только уникальный индекс (tag_id, recipe_id)
+    и не даёт дублей, поэтому DISTINCT не нужен.
+    """
+    if not tag_ids:
+        return queryset.none()
+    recipes = TagRecipe.objects.filter(tag_id__in=tag_ids).values('recipe')
+    if match_all and len(tag_ids) > 1:
+        recipes = recipes.annotate(
+            tags_count=Count('tag')
+        ).filter(tags_count=len(tag_ids)).values('recipe')
+    return queryset.filter(pk__in=recipes)
+
+
+class SlugListField(forms.Field):
+    """Поле со списком слагов из повторяющегося параметра запроса."""
+    widget = forms.MultipleHiddenInput
+
+    def to_python(self, value):
+        return [slug for slug in value or () if slug]
+
+
+class TagsFilter(Filter):
+    """
+    Фильтр рецептов по слагам тэгов одним подзапросом по TagRecipe,
+    без JOIN и DISTINCT.
+
+    По умолчанию подходят рецепты хотя бы с одним из тэгов, при
+    tags_mode=all — только со всеми.
+    """
+    field_class = SlugListField
+    mode_param = 'tags_mode'
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        tag_ids = get_tag_ids(value)
+        match_all = self.parent.data.get(self.mode_param) == 'all'
+        if match_all and len(tag_ids) < len(set(value)):
+            return qs.none()
+        return filter_by_tags(qs, tag_ids, match_all)
 
 
 class RecipesFilter(FilterSet):
     """Фильтр для рецептов."""
     author = NumberFilter(field_name='author__id')
-    tags = ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all()
-    )
+    tags = TagsFilter()
     is_favorited = NumberFilter(
         method='filter_is_favorited'
     )
     is_in_shopping_cart = NumberFilter(
         method='filter_is_in_shopping_cart'
     )
+    search = CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'author', 'tags', 'is_favorited', 'is_in_shopping_cart', 'search'
+        )
 
     def filter_is_favorited(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
@@ -38,7 +106,25 @@ class RecipesFilter(FilterSet):
             return queryset.filter(shopping_cart__user=self.request.user)
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        """Полнотекстовый поиск по названию, ингредиентам и описанию."""
+        if value.strip():
+            return search_recipes(queryset, value)
+        return queryset
+
 
-class IngredientsFilter(SearchFilter):
-    """Фильтр для игредиентов с поиском по названию."""
+class IngredientsFilter(BaseFilterBackend):
+    """
+    Фильтр для игредиентов с поиском по названию.
+
+    Поиск идёт по индексу в памяти: сначала ингредиенты, название которых
+    начинается с запроса, затем содержащие его, не больше
+    INGREDIENT_SEARCH_LIMIT штук.
+    """
     search_param = 'name'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query or view.action != 'list':
+            return queryset
+        return get_index().search(query, settings.INGREDIENT_SEARCH_LIMIT)
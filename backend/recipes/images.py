@@ -0,0 +1,434 @@
+import binascii
+import io
+import logging
+import os
+import threading
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import connections, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image, ImageOps
+from rest_framework.fields import ImageField
+from rest_framework.serializers import ValidationError
+
+from recipes.caching import bump_generation
+from recipes.models import ImageBlob, Recipe
+
+logger = logging.getLogger(__name__)
+
+VARIANT_DIR = 'recipes/images/variants/'
+SAVE_OPTIONS = {
+    'JPEG': {'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'method': 4},
+}
+
+
+class DecodedImageFile(TemporaryUploadedFile):
+    """
+    Временный файл декодированного изображения. Закрывается при сборке
+    мусора: после сохранения хранилище перемещает его, и закрыть его
+    так, как Django закрывает загруженные файлы запроса, некому.
+    """
+
+    def __del__(self):
+        self.close()
+
+
+class StreamingBase64ImageField(Base64ImageField):
+    """
+    Base64ImageField, который декодирует изображение частями во временный
+    файл на диске, а не в память целиком.
+
+    Слишком большие изображения отклоняются до декодирования: по длине
+    base64-строки и по размеру в пикселях из заголовка файла.
+    """
+    CHUNK_SIZE = 64 * 1024
+    TOO_LARGE_MESSAGE = 'Размер изображения не должен превышать {} МБ.'
+    TOO_MANY_PIXELS_MESSAGE = 'Изображение слишком большое: {}x{} пикселей.'
+
+    def to_internal_value(self, base64_data):
+        if base64_data in self.EMPTY_VALUES:
+            return None
+        if not isinstance(base64_data, str):
+            return super().to_internal_value(base64_data)
+        payload = base64_data.rpartition(';base64,')[2]
+        if len(payload) // 4 * 3 > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise ValidationError(self.TOO_LARGE_MESSAGE.format(
+                settings.RECIPE_IMAGE_MAX_SIZE // (1024 * 1024)
+            ))
+        file = DecodedImageFile(
+            str(uuid.uuid4()), content_type=None, size=None, charset=None
+        )
+        try:
+            extension = self.decode(payload, file)
+        except Exception:
+            file.close()
+            raise
+        file.name = f'{file.name}.{extension}'
+        return ImageField.to_internal_value(self, file)
+
+    def decode(self, payload, file):
+        """
+        Декодирует payload в file и возвращает расширение изображения.
+
+        Из частей удаляются пробелы и переводы строк (base64 в формате
+        MIME переносится каждые 76 символов), а символы сверх кратного
+        4 числа переносятся в следующую часть.
+        """
+        rest = ''
+        try:
+            for start in range(0, len(payload), self.CHUNK_SIZE):
+                chunk = rest + ''.join(
+                    payload[start:start + self.CHUNK_SIZE].split()
+                )
+                end = len(chunk) // 4 * 4
+                file.write(binascii.a2b_base64(chunk[:end]))
+                rest = chunk[end:]
+            if rest:
+                file.write(binascii.a2b_base64(rest))
+        except binascii.Error:
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        file.size = file.tell()
+        file.seek(0)
+        try:
+            with Image.open(file) as image:
+                image_format, (width, height) = image.format, image.size
+        except (OSError, Image.DecompressionBombError):
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        file.seek(0)
+        if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            raise ValidationError(
+                self.TOO_MANY_PIXELS_MESSAGE.format(width, height)
+            )
+        extension = 'jpg' if image_format == 'JPEG' else image_format.lower()
+        if extension not in self.ALLOWED_TYPES:
+            raise ValidationError(self.INVALID_TYPE_MESSAGE)
+        return extension
+
+
+def get_variant_name(name, variant, webp=False):
+    """Имя файла уменьшенной копии изображения name."""
+    stem, extension = os.path.splitext(os.path.basename(name))
+    if webp:
+        extension = '.webp'
+    return f'{VARIANT_DIR}{stem}_{variant}{extension}'
+
+
+def iter_variants(name):
+    """Пары (ключ, имя файла) всех копий изображения name."""
+    for variant in settings.RECIPE_IMAGE_VARIANTS:
+        yield variant, get_variant_name(name, variant)
+        yield f'{variant}_webp', get_variant_name(name, variant, webp=True)
+
+
+def _save_variant(image, size, image_format, storage, name):
+    variant = image.copy()
+    variant.thumbnail(size, Image.LANCZOS)
+    if image_format == 'JPEG' and variant.mode != 'RGB':
+        variant = variant.convert('RGB')
+    elif image_format == 'WEBP' and variant.mode not in ('RGB', 'RGBA'):
+        variant = variant.convert('RGBA')
+    buffer = io.BytesIO()
+    variant.save(
+        buffer,
+        image_format,
+        quality=settings.RECIPE_IMAGE_QUALITY,
+        **SAVE_OPTIONS.get(image_format, {})
+    )
+    save = getattr(storage, 'save_named', storage.save)
+    save(name, ContentFile(buffer.getvalue()))
+
+
+def make_variants(image_file):
+    """
+    Строит недостающие уменьшенные копии изображения и их WebP-варианты.
+
+    Имена копий выводятся из имени исходного файла, поэтому уже
+    построенные копии не пересоздаются. Когда все копии готовы,
+    рецепты с этим изображением отмечаются mark_variants_ready.
+    """
+    storage, name = image_file.storage, image_file.name
+    sizes = settings.RECIPE_IMAGE_VARIANTS
+    missing = [
+        (variant, webp, variant_name)
+        for variant in sizes
+        for webp in (False, True)
+        for variant_name in (get_variant_name(name, variant, webp),)
+        if not storage.exists(variant_name)
+    ]
+    if missing:
+        with storage.open(name) as file, Image.open(file) as image:
+            image_format = image.format
+            image.draft('RGB', max(sizes.values()))
+            image = ImageOps.exif_transpose(image)
+            for variant, webp, variant_name in missing:
+                _save_variant(
+                    image,
+                    sizes[variant],
+                    'WEBP' if webp else image_format,
+                    storage,
+                    variant_name
+                )
+    mark_variants_ready(name)
+
+
+def mark_variants_ready(name):
+    """
+    Отмечает, что копии изображения name построены. Дата изменения
+    рецептов обновляется, поэтому меняются их ETag, а кэш списков
+    сбрасывается: клиенты получают адреса копий вместо исходного.
+    """
+    if Recipe.objects.filter(
+        image=name, image_variants_ready=False
+    ).update(image_variants_ready=True, updated_at=timezone.now()):
+        bump_generation('recipes')
+
+
+def _make_variants_logged(image_file):
+    try:
+        make_variants(image_file)
+    except Exception:
+        logger.exception('Не удалось построить копии %s', image_file.name)
+
+
+def _make_variants_in_worker(image_file):
+    try:
+        _make_variants_logged(image_file)
+    finally:
+        # Соединения с базой у каждого потока свои, между задачами
+        # пула они не нужны.
+        connections.close_all()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Пул потоков для обработки изображений, создаётся при первом вызове."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix='recipe-images'
+            )
+        return _executor
+
+
+def schedule_variants(image_file):
+    """
+    Ставит построение копий в пул после фиксации транзакции.
+
+    При RECIPE_IMAGE_WORKERS = 0 копии строятся сразу.
+    """
+    if not image_file:
+        return
+
+    def submit():
+        if settings.RECIPE_IMAGE_WORKERS:
+            get_executor().submit(_make_variants_in_worker, image_file)
+        else:
+            _make_variants_logged(image_file)
+    transaction.on_commit(submit)
+
+
+def get_variant_urls(image_file, ready):
+    """
+    Адреса копий изображения. Пока копии не построены (ready ложно:
+    сборка ещё идёт или завершилась ошибкой), вместо них отдаётся
+    адрес исходного файла.
+    """
+    if not image_file:
+        return None
+    return get_variant_urls_by_name(
+        image_file.name, ready, image_file.storage
+    )
+
+
+def get_variant_urls_by_name(name, ready, storage=None):
+    """get_variant_urls по имени файла, без FieldFile."""
+    storage = storage or get_image_storage()
+    if not ready:
+        url = storage.url(name)
+        return {key: url for key, _ in iter_variants(name)}
+    return {
+        key: storage.url(variant) for key, variant in iter_variants(name)
+    }
+
+
+def acquire_image(name):
+    """Учитывает новую ссылку рецепта на файл изображения."""
+    if not name:
+        return
+    blobs = ImageBlob.objects.filter(name=name)
+    if blobs.update(
+        references=F('references') + 1, updated_at=timezone.now()
+    ):
+        return
+    _, created = ImageBlob.objects.get_or_create(
+        name=name, defaults={'references': 1}
+    )
+    if not created:
+        blobs.update(references=F('references') + 1)
+
+
+def acquire_images(names):
+    """
+    Учитывает ссылки на файлы изображений пачкой: для каждого имени
+    столько ссылок, сколько раз оно встречается в names.
+    """
+    counts = Counter(name for name in names if name)
+    if not counts:
+        return
+    now = timezone.now()
+    with transaction.atomic():
+        blobs = list(
+            ImageBlob.objects.select_for_update().filter(name__in=counts)
+        )
+        for blob in blobs:
+            blob.references += counts.pop(blob.name)
+            blob.updated_at = now
+        ImageBlob.objects.bulk_update(
+            blobs, ('references', 'updated_at'), batch_size=1000
+        )
+        ImageBlob.objects.bulk_create(
+            (
+                ImageBlob(name=name, references=count)
+                for name, count in counts.items()
+            ),
+            batch_size=1000
+        )
+
+
+def touch_image(name):
+    """
+    Продлевает жизнь файла name, который загружен повторно. Пока
+    collect_images удаляет этот файл, запрос ждёт блокировку строки,
+    а новая дата изменения исключает файл из ближайшей сборки.
+    """
+    ImageBlob.objects.filter(name=name).update(updated_at=timezone.now())
+
+
+def release_image(name):
+    """
+    Снимает ссылку на файл изображения. Файл без ссылок удаляется
+    командой collectimages.
+    """
+    if name:
+        ImageBlob.objects.filter(name=name, references__gt=0).update(
+            references=F('references') - 1, updated_at=timezone.now()
+        )
+
+
+def get_image_storage():
+    return Recipe._meta.get_field('image').storage
+
+
+def delete_image_files(name, storage=None):
+    """Удаляет файл изображения вместе с его копиями."""
+    storage = storage or get_image_storage()
+    storage.delete(name)
+    for _, variant_name in iter_variants(name):
+        storage.delete(variant_name)
+
+
+def recount_images():
+    """
+    Пересчитывает ссылки по таблице рецептов. Возвращает число
+    исправленных записей.
+    """
+    references = dict(
+        Recipe.objects.exclude(image='').values_list('image').annotate(
+            references=Count('id')
+        ).order_by()
+    )
+    now = timezone.now()
+    with transaction.atomic():
+        changed = []
+        for blob in ImageBlob.objects.select_for_update():
+            count = references.pop(blob.name, 0)
+            if blob.references != count:
+                blob.references, blob.updated_at = count, now
+                changed.append(blob)
+        ImageBlob.objects.bulk_update(
+            changed, ('references', 'updated_at'), batch_size=1000
+        )
+        ImageBlob.objects.bulk_create(
+            (
+                ImageBlob(name=name, references=count)
+                for name, count in references.items()
+            ),
+            batch_size=1000
+        )
+    return len(changed) + len(references)
+
+
+def collect_images(grace, dry_run=False):
+    """
+    Удаляет файлы, на которые рецепты не ссылаются дольше grace секунд,
+    и возвращает их имена. Задержка защищает файлы, которые только что
+    загружены повторно и ещё не учтены.
+
+    Строка файла блокируется, и файлы удаляются до её удаления в той же
+    транзакции: повторная загрузка того же содержимого (touch_image) и
+    новая ссылка на него (acquire_image) ждут конца удаления, а не
+    получают файл, который вот-вот исчезнет.
+    """
+    storage = get_image_storage()
+    deadline = timezone.now() - timedelta(seconds=grace)
+    unused = ImageBlob.objects.filter(references=0, updated_at__lt=deadline)
+    names = list(unused.values_list('name', flat=True))
+    if dry_run:
+        return names
+    collected = []
+    for name in names:
+        with transaction.atomic():
+            blobs = unused.select_for_update().filter(name=name)
+            if not list(blobs.values_list('pk', flat=True)):
+                continue
+            delete_image_files(name, storage)
+            blobs.delete()
+        collected.append(name)
+    return collected
+
+
+def _walk(storage, path):
+    directories, files = storage.listdir(path)
+    for file_name in files:
+        yield os.path.join(path, file_name)
+    for directory in directories:
+        yield from _walk(storage, os.path.join(path, directory))
+
+
+def find_orphan_files(grace):
+    """
+    Файлы в каталоге изображений рецептов, о которых нет записи
+    ImageBlob, старше grace секунд: остатки удалённых до учёта ссылок
+    рецептов и копии удалённых изображений.
+    """
+    storage = get_image_storage()
+    directory = Recipe._meta.get_field('image').upload_to
+    if not storage.exists(directory):
+        return
+    deadline = timezone.now() - timedelta(seconds=grace)
+    known = set(ImageBlob.objects.values_list('name', flat=True).iterator())
+    stems = {os.path.splitext(os.path.basename(name))[0] for name in known}
+    for name in _walk(storage, directory):
+        if name in known:
+            continue
+        if name.startswith(VARIANT_DIR) and (
+            os.path.basename(name).rpartition('_')[0] in stems
+        ):
+            continue
+        if storage.get_modified_time(name) < deadline:
+            yield name
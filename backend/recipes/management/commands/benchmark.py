@@ -0,0 +1,386 @@
+import io
+import json
+import random
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from foodgram.compression import compress, get_encodings
+from recipes.autocomplete import IngredientIndex
+from recipes.cookable import CookableIndex
+from recipes.filters import filter_by_tags
+from recipes.models import Ingredient, Recipe, Tag, TagRecipe
+from recipes.renderers import (
+    FastJSONRenderer,
+    MessagePackRenderer,
+    msgpack,
+)
+from recipes.serializers import (
+    IngredientSerializer,
+    RecipeListSerializer,
+    RecipeReadSerializer,
+)
+from recipes.shopping_list import draw_shopping_list
+from recipes.views import RecipeViewSet
+from users.models import CustomUser as User
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Run micro-benchmarks. Use command: '
+        'python3 manage.py benchmark [target ...]'
+    )
+    CART_SIZES = (10, 1000, 10000)
+    AUTOCOMPLETE_QUERIES = 1000
+    COOKABLE_RECIPES = 100000
+    COOKABLE_INGREDIENTS = 2000
+    COOKABLE_PER_RECIPE = 8
+    COOKABLE_PANTRY = 15
+    COOKABLE_QUERIES = 100
+    TAG_RECIPES = 100000
+    TAG_COUNT = 50
+    TAGS_PER_RECIPE = 3
+    TAG_QUERY_SIZES = (1, 3, 10)
+    PAGE_SIZE = 6
+    SERIALIZER_PAGE_SIZES = (6, 50, 100)
+    SERIALIZER_REPEATS = 20
+    RENDERER_ITEMS = 2000
+    RENDERER_REPEATS = 20
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'targets',
+            nargs='*',
+            help=(
+                'Benchmarks to run, all by default: '
+                f'{", ".join(self.get_targets())}.'
+            )
+        )
+
+    @classmethod
+    def get_targets(cls):
+        return sorted(
+            name[len('bench_'):] for name in dir(cls)
+            if name.startswith('bench_')
+        )
+
+    def measure(self, label, func, *args):
+        """Печатает время выполнения и пиковую память вызова func."""
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.stdout.write(
+            f'{label:<40} {elapsed * 1000:>10.1f} ms '
+            f'{peak / 1024 / 1024:>8.2f} MiB'
+        )
+        return result
+
+    def bench_shopping_list(self):
+        """Рендер PDF списка покупок разного размера."""
+        for size in self.CART_SIZES:
+            ingredients = [
+                {
+                    'ingredient__name': f'ингредиент {number}',
+                    'ingredient__measurement_unit': 'г',
+                    'amount': number,
+                }
+                for number in range(size)
+            ]
+            self.measure(
+                f'shopping_list pdf, {size} lines',
+                draw_shopping_list,
+                ingredients,
+                io.BytesIO()
+            )
+
+    def bench_autocomplete(self):
+        """Поиск ингредиентов: индекс в памяти против ILIKE в базе."""
+        ingredients = list(Ingredient.objects.all())
+        if not ingredients:
+            self.stdout.write(self.style.WARNING(
+                'Нет ингредиентов, загрузите их: python3 manage.py importcsv'
+            ))
+            return
+        step = max(len(ingredients) // self.AUTOCOMPLETE_QUERIES, 1)
+        queries = [
+            ingredient.name[:length]
+            for ingredient in ingredients[::step]
+            for length in (1, 2, 3)
+        ][:self.AUTOCOMPLETE_QUERIES]
+        limit = settings.INGREDIENT_SEARCH_LIMIT
+        index = self.measure(
+            'autocomplete index build', IngredientIndex, ingredients
+        )
+        self.measure(
+            f'autocomplete index, {len(queries)} queries',
+            lambda: [index.search(query, limit) for query in queries]
+        )
+
+        def search_database(query):
+            # Запрос прежнего SearchFilter с search_fields = ('^name',).
+            conditions = Q()
+            for term in query.replace(',', ' ').split():
+                conditions &= Q(name__istartswith=term)
+            return list(Ingredient.objects.filter(conditions)[:limit])
+
+        self.measure(
+            f'autocomplete database, {len(queries)} queries',
+            lambda: [search_database(query) for query in queries]
+        )
+
+    def bench_cookable(self):
+        """
+        «Что приготовить» на синтетических рецептах: обратный индекс
+        против перебора всех рецептов.
+        """
+        rng = random.Random(0)
+        ingredients = range(1, self.COOKABLE_INGREDIENTS + 1)
+        recipes = {
+            recipe_id: set(rng.sample(ingredients, self.COOKABLE_PER_RECIPE))
+            for recipe_id in range(1, self.COOKABLE_RECIPES + 1)
+        }
+        pairs = [
+            (recipe_id, ingredient_id)
+            for recipe_id, ingredient_ids in recipes.items()
+            for ingredient_id in ingredient_ids
+        ]
+        pantries = [
+            set(rng.sample(ingredients, self.COOKABLE_PANTRY))
+            for _ in range(self.COOKABLE_QUERIES)
+        ]
+        index = self.measure(
+            f'cookable index build, {len(recipes)} recipes',
+            CookableIndex,
+            pairs
+        )
+
+        def scan(pantry):
+            result = [
+                (recipe_id, len(ingredient_ids - pantry))
+                for recipe_id, ingredient_ids in recipes.items()
+                if ingredient_ids & pantry
+            ]
+            result.sort(key=lambda item: (item[1], item[0]))
+            return result
+
+        self.measure(
+            f'cookable index, {len(pantries)} queries',
+            lambda: [index.search(pantry) for pantry in pantries]
+        )
+        self.measure(
+            f'cookable full scan, {len(pantries)} queries',
+            lambda: [scan(pantry) for pantry in pantries]
+        )
+
+    def _create_tagged_recipes(self, rng):
+        author = User.objects.create(
+            username='benchmark', email='benchmark@example.com'
+        )
+        Tag.objects.bulk_create(
+            Tag(name=f'benchmark {number}', slug=f'benchmark-{number}',
+                color='#000000')
+            for number in range(self.TAG_COUNT)
+        )
+        tags = list(Tag.objects.filter(slug__startswith='benchmark-'))
+        recipes = Recipe.objects.bulk_create(
+            (
+                Recipe(author=author, name=f'recipe {number:06d}',
+                       image='benchmark.png', text='', cooking_time=1)
+                for number in range(self.TAG_RECIPES)
+            ),
+            batch_size=5000
+        )
+        if recipes[0].pk is None:
+            recipes = list(Recipe.objects.filter(author=author))
+        TagRecipe.objects.bulk_create(
+            (
+                TagRecipe(recipe=recipe, tag=tag)
+                for recipe in recipes
+                for tag in rng.sample(tags, self.TAGS_PER_RECIPE)
+            ),
+            batch_size=5000
+        )
+        return tags
+
+    def bench_tags(self):
+        """
+        Фильтр по тэгам: JOIN против подзапроса на 100k рецептов
+        и 50 тэгах. Данные создаются в транзакции и откатываются.
+        """
+        rng = random.Random(0)
+
+        def page(queryset):
+            return queryset.count(), list(
+                queryset.order_by('name', 'id')[:self.PAGE_SIZE]
+            )
+
+        def join_all(slugs):
+            queryset = Recipe.objects.all()
+            for slug in slugs:
+                queryset = queryset.filter(tags__slug=slug)
+            return queryset
+
+        try:
+            with transaction.atomic():
+                self.stdout.write(
+                    f'Создаётся {self.TAG_RECIPES} рецептов...'
+                )
+                tags = self._create_tagged_recipes(rng)
+                for size in self.TAG_QUERY_SIZES:
+                    chosen = rng.sample(tags, size)
+                    slugs = [tag.slug for tag in chosen]
+                    tag_ids = {tag.id for tag in chosen}
+                    self.measure(
+                        f'tags any of {size}, join + distinct',
+                        page,
+                        Recipe.objects.filter(tags__slug__in=slugs).distinct()
+                    )
+                    self.measure(
+                        f'tags any of {size}, subquery',
+                        page,
+                        filter_by_tags(Recipe.objects.all(), tag_ids)
+                    )
+                    self.measure(
+                        f'tags all of {size}, join per tag',
+                        page,
+                        join_all(slugs)
+                    )
+                    self.measure(
+                        f'tags all of {size}, subquery',
+                        page,
+                        filter_by_tags(Recipe.objects.all(), tag_ids, True)
+                    )
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _get_serializer_view(self, user):
+        view = RecipeViewSet(action_map={'get': 'list'}, format_kwarg=None)
+        request = APIRequestFactory().get('/api/recipes/')
+        if user is not None:
+            force_authenticate(request, user)
+        view.request = view.initialize_request(request)
+        return view
+
+    def bench_serializers(self):
+        """
+        Сериализация страниц списка рецептов: RecipeReadSerializer
+        против RecipeListSerializer на рецептах из базы.
+        """
+        if Recipe.objects.count() < max(self.SERIALIZER_PAGE_SIZES):
+            self.stdout.write(self.style.WARNING(
+                'Мало рецептов, создайте их: python3 manage.py generatedata'
+            ))
+            return
+        user = User.objects.filter(recipes__isnull=False).first()
+        for label, view in (
+            ('anonymous', self._get_serializer_view(None)),
+            ('user', self._get_serializer_view(user)),
+        ):
+            context = view.get_serializer_context()
+            queryset = view.get_queryset().order_by('name', 'id')
+            for size in self.SERIALIZER_PAGE_SIZES:
+                def model_path():
+                    return RecipeReadSerializer(
+                        list(queryset[:size]), many=True, context=context
+                    ).data
+
+                def rows_path():
+                    return RecipeListSerializer(
+                        RecipeListSerializer.get_rows(queryset)[:size],
+                        context=context
+                    ).data
+                for name, func in (
+                    ('ModelSerializer', model_path),
+                    ('rows', rows_path),
+                ):
+                    self.measure(
+                        f'{label}, {size} recipes, {name} '
+                        f'x{self.SERIALIZER_REPEATS}',
+                        lambda: [
+                            func() for _ in range(self.SERIALIZER_REPEATS)
+                        ]
+                    )
+                if json.dumps(model_path()) != json.dumps(rows_path()):
+                    self.stdout.write(self.style.ERROR(
+                        'Ответы сериализаторов различаются'
+                    ))
+
+    def _get_catalog_data(self):
+        """Каталог ингредиентов из базы или синтетический, если база пуста."""
+        data = IngredientSerializer(
+            Ingredient.objects.all(), many=True
+        ).data
+        if not data:
+            data = [
+                {'id': number, 'name': f'ингредиент {number}',
+                 'measurement_unit': 'г'}
+                for number in range(self.RENDERER_ITEMS)
+            ]
+        return data
+
+    def bench_renderers(self):
+        """
+        Рендер полного каталога ингредиентов: JSONRenderer против
+        FastJSONRenderer и MessagePackRenderer.
+        """
+        data = self._get_catalog_data()
+        renderers = [JSONRenderer(), FastJSONRenderer()]
+        if msgpack is not None:
+            renderers.append(MessagePackRenderer())
+        for renderer in renderers:
+            size = len(renderer.render(data))
+            self.measure(
+                f'{type(renderer).__name__}, {len(data)} items '
+                f'x{self.RENDERER_REPEATS}, {size // 1024} KiB',
+                lambda: [
+                    renderer.render(data)
+                    for _ in range(self.RENDERER_REPEATS)
+                ]
+            )
+        if renderers[0].render(data) != renderers[1].render(data):
+            self.stdout.write(self.style.ERROR(
+                'Вывод JSONRenderer и FastJSONRenderer различается'
+            ))
+
+    def bench_compression(self):
+        """
+        Сжатие каталога ингредиентов: уровни для обычных ответов и для
+        сжатых один раз на версию справочника.
+        """
+        data = self._get_catalog_data()
+        content = FastJSONRenderer().render(data)
+        self.stdout.write(
+            f'{len(data)} items, {len(content) // 1024} KiB без сжатия'
+        )
+        for encoding in get_encodings():
+            for precompress in (False, True):
+                size = len(compress(content, encoding, precompress))
+                self.measure(
+                    f'{encoding}, '
+                    f'{"precompressed" if precompress else "per request"}, '
+                    f'{size // 1024} KiB',
+                    compress, content, encoding, precompress
+                )
+
+    def handle(self, *args, **options):
+        targets = options['targets'] or self.get_targets()
+        unknown = set(targets) - set(self.get_targets())
+        if unknown:
+            raise CommandError(f'Unknown benchmarks: {", ".join(unknown)}')
+        for target in targets:
+            self.stdout.write(self.style.MIGRATE_HEADING(target))
+            getattr(self, f'bench_{target}')()
@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.images import (
+    collect_images,
+    find_orphan_files,
+    get_image_storage,
+    recount_images,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete recipe image files no recipe refers to. Run it by cron: '
+        'python3 manage.py collectimages [--recount] [--orphans] [--dry-run]'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace',
+            type=int,
+            default=settings.RECIPE_IMAGE_GC_GRACE,
+            help='Keep unused files younger than this many seconds.'
+        )
+        parser.add_argument(
+            '--recount',
+            action='store_true',
+            help='Recount references from recipes before collecting.'
+        )
+        parser.add_argument(
+            '--orphans',
+            action='store_true',
+            help='Also delete files in the image directory that are unknown '
+                 'to the reference table.'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only list files that would be deleted.'
+        )
+
+    def handle(self, *args, **options):
+        grace, dry_run = options['grace'], options['dry_run']
+        if options['recount']:
+            self.stdout.write(f'Исправлено счётчиков: {recount_images()}')
+        collected = collect_images(grace, dry_run)
+        if options['orphans']:
+            storage = get_image_storage()
+            orphans = list(find_orphan_files(grace))
+            if not dry_run:
+                for name in orphans:
+                    storage.delete(name)
+            collected += orphans
+        if options['verbosity'] > 1 or dry_run:
+            for name in collected:
+                self.stdout.write(name)
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Будет удалено" if dry_run else "Удалено"} файлов: '
+            f'{len(collected)}'
+        ))
@@ -0,0 +1,113 @@
+import gzip
+import json
+import sys
+import time
+from collections import defaultdict
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import IngredientRecipe, Recipe, TagRecipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Export recipes with authors, tags, ingredients and image paths '
+        'to JSON Lines. Use command: '
+        'python3 manage.py exportrecipes recipes.jsonl[.gz]'
+    )
+    FIELDS = ('id', 'name', 'text', 'cooking_time', 'image')
+    AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Output file, "-" for stdout. Gzipped if it ends with .gz.'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Recipes read per query.'
+        )
+
+    def _open(self, path):
+        if path == '-':
+            return sys.stdout
+        if path.endswith('.gz'):
+            return gzip.open(path, 'wt', encoding='utf-8')
+        return open(path, 'w', encoding='utf-8')
+
+    def _iter_chunks(self, chunk_size):
+        rows = Recipe.objects.order_by('id').values(
+            *self.FIELDS,
+            *(f'author__{field}' for field in self.AUTHOR_FIELDS)
+        ).iterator(chunk_size=chunk_size)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def _get_relations(self, recipe_ids):
+        """Тэги и ингредиенты рецептов чанка двумя запросами."""
+        tags = defaultdict(list)
+        for recipe_id, slug in TagRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'tag__slug').order_by('recipe_id', 'id'):
+            tags[recipe_id].append(slug)
+        ingredients = defaultdict(list)
+        for recipe_id, name, unit, amount in IngredientRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list(
+            'recipe_id',
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            'amount'
+        ).order_by('recipe_id', 'id'):
+            ingredients[recipe_id].append({
+                'name': name, 'measurement_unit': unit, 'amount': amount
+            })
+        return tags, ingredients
+
+    def _to_line(self, row, tags, ingredients):
+        email = row['author__email']
+        return json.dumps({
+            'name': row['name'],
+            'text': row['text'],
+            'cooking_time': row['cooking_time'],
+            'image': row['image'],
+            'author': {
+                field: row[f'author__{field}'] for field in self.AUTHOR_FIELDS
+            } if email else None,
+            'tags': tags.get(row['id'], []),
+            'ingredients': ingredients.get(row['id'], []),
+        }, ensure_ascii=False)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        exported = 0
+        try:
+            file = self._open(options['path'])
+        except OSError as e:
+            raise CommandError(f'File write exception {e}')
+        try:
+            for chunk in self._iter_chunks(options['chunk_size']):
+                tags, ingredients = self._get_relations(
+                    [row['id'] for row in chunk]
+                )
+                file.writelines(
+                    self._to_line(row, tags, ingredients) + '\n'
+                    for row in chunk
+                )
+                exported += len(chunk)
+                if options['verbosity'] > 1:
+                    self.stderr.write(f'Выгружено рецептов: {exported}')
+        finally:
+            if file is not sys.stdout:
+                file.close()
+        elapsed = time.perf_counter() - start
+        self.stderr.write(
+            f'Выгружено рецептов: {exported}, '
+            f'{exported / elapsed if elapsed else 0:.0f} рецептов/с'
+        )
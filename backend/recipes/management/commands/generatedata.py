@@ -0,0 +1,267 @@
+import io
+import random
+import secrets
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from PIL import Image
+
+from recipes.caching import bump_catalog_version, bump_generation
+from recipes.counters import recount
+from recipes.images import acquire_images, get_image_storage
+from recipes.models import (
+    Favorite,
+    Follow,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    Tag,
+    TagRecipe,
+)
+from recipes.search import refresh_search_index
+from recipes.shopping_list import rebuild_shopping_lists
+
+User = get_user_model()
+
+WORDS = (
+    'суп', 'салат', 'пирог', 'каша', 'рагу', 'запеканка', 'омлет', 'плов',
+    'борщ', 'паста', 'курица', 'говядина', 'рыба', 'грибы', 'сыр',
+    'томатный', 'овощной', 'сливочный', 'острый', 'домашний', 'быстрый',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a synthetic dataset of users, follows, recipes, favorites '
+        'and shopping carts for benchmarks. Use command: '
+        'python3 manage.py generatedata --users 1000 --recipes 100000'
+    )
+    TAG_COUNT = 10
+    INGREDIENT_COUNT = 2000
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=8
+        )
+        parser.add_argument('--tags-per-recipe', type=int, default=2)
+        parser.add_argument(
+            '--follows', type=int, default=10,
+            help='Subscriptions per user.'
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Favorite recipes per user.'
+        )
+        parser.add_argument(
+            '--cart', type=int, default=10,
+            help='Recipes in the shopping cart per user.'
+        )
+        parser.add_argument(
+            '--prefix', default='synthetic',
+            help=(
+                'Username and email prefix of generated users, a random '
+                'run suffix is added to it.'
+            )
+        )
+        parser.add_argument(
+            '--password',
+            help='Password of generated users, by default they cannot log in.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def _step(self, label, start):
+        if self.verbosity:
+            self.stdout.write(
+                f'{label}: {time.perf_counter() - start:.1f} с'
+            )
+
+    def _ensure_catalogs(self):
+        """Тэги и ингредиенты, при пустых справочниках создаются свои."""
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=f'тэг {number}', slug=f'tag-{number}',
+                    color=f'#{self.rng.randrange(0x1000000):06X}')
+                for number in range(self.TAG_COUNT)
+            )
+            bump_catalog_version('tags')
+            bump_generation('tags')
+        if not Ingredient.objects.exists():
+            Ingredient.objects.bulk_create(
+                (
+                    Ingredient(name=f'ингредиент {number}',
+                               measurement_unit='г')
+                    for number in range(self.INGREDIENT_COUNT)
+                ),
+                batch_size=self.batch_size
+            )
+            bump_catalog_version('ingredients')
+            bump_generation('ingredients')
+        return (
+            list(Tag.objects.values_list('id', flat=True)),
+            list(Ingredient.objects.values_list('id', flat=True)),
+        )
+
+    def _create_users(self, count, prefix, password):
+        """
+        Создаёт пользователей с префиксом запуска: имена не совпадают с
+        пользователями прошлых запусков и настоящими. Занятые имена
+        пропускаются.
+        """
+        prefix = f'{prefix}-{secrets.token_hex(4)}-'
+        password = make_password(password)
+        users = (
+            User(
+                username=f'{prefix}{number}',
+                email=f'{prefix}{number}@example.com',
+                first_name='Имя',
+                last_name=f'Фамилия {number}',
+                password=password,
+            )
+            for number in range(count)
+        )
+        User.objects.bulk_create(
+            users, batch_size=self.batch_size, ignore_conflicts=True
+        )
+        return list(
+            User.objects.filter(username__startswith=prefix).values_list(
+                'id', flat=True
+            )
+        )
+
+    def _make_image(self):
+        """Одна картинка на все рецепты: хранилище хранит её один раз."""
+        buffer = io.BytesIO()
+        Image.new('RGB', (640, 480), (226, 108, 45)).save(buffer, 'JPEG')
+        field = Recipe._meta.get_field('image')
+        return get_image_storage().save(
+            f'{field.upload_to}synthetic.jpg', ContentFile(buffer.getvalue())
+        )
+
+    def _recipe(self, author_id, image):
+        words = self.rng.sample(WORDS, 3)
+        return Recipe(
+            author_id=author_id,
+            name=' '.join(words).capitalize(),
+            text=' '.join(self.rng.choices(WORDS, k=40)),
+            cooking_time=self.rng.randint(5, 180),
+            image=image,
+        )
+
+    def _create_recipes(self, count, author_ids, tag_ids, ingredient_ids,
+                        options):
+        image = self._make_image()
+        recipe_ids = []
+        recipes = (
+            self._recipe(self.rng.choice(author_ids), image)
+            for _ in range(count)
+        )
+        tags_per_recipe = min(options['tags_per_recipe'], len(tag_ids))
+        ingredients_per_recipe = min(
+            options['ingredients_per_recipe'], len(ingredient_ids)
+        )
+        while True:
+            chunk = list(islice(recipes, self.batch_size))
+            if not chunk:
+                break
+            with transaction.atomic():
+                last_id = (
+                    Recipe.objects.aggregate(last_id=Max('id'))['last_id']
+                    or 0
+                )
+                Recipe.objects.bulk_create(chunk)
+                ids = list(
+                    Recipe.objects.filter(id__gt=last_id).order_by(
+                        'id'
+                    ).values_list('id', flat=True)
+                )
+                TagRecipe.objects.bulk_create(
+                    TagRecipe(recipe_id=recipe_id, tag_id=tag_id)
+                    for recipe_id in ids
+                    for tag_id in self.rng.sample(tag_ids, tags_per_recipe)
+                )
+                IngredientRecipe.objects.bulk_create(
+                    (
+                        IngredientRecipe(
+                            recipe_id=recipe_id,
+                            ingredient_id=ingredient_id,
+                            amount=self.rng.randint(1, 500)
+                        )
+                        for recipe_id in ids
+                        for ingredient_id in self.rng.sample(
+                            ingredient_ids, ingredients_per_recipe
+                        )
+                    ),
+                    batch_size=self.batch_size
+                )
+                refresh_search_index(ids)
+            recipe_ids.extend(ids)
+        acquire_images([image] * len(recipe_ids))
+        return recipe_ids
+
+    def _create_links(self, model, field, user_ids, targets, per_user):
+        """Каждому пользователю per_user случайных рецептов или авторов."""
+        def links():
+            for user_id in user_ids:
+                candidates = self.rng.sample(
+                    targets, min(per_user + 1, len(targets))
+                )
+                if model is Follow:
+                    candidates = [
+                        target for target in candidates if target != user_id
+                    ]
+                for target in candidates[:per_user]:
+                    yield model(user_id=user_id, **{field: target})
+        model.objects.bulk_create(
+            links(), batch_size=self.batch_size, ignore_conflicts=True
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        self.batch_size = options['batch_size']
+        self.rng = random.Random(options['seed'])
+        start = time.perf_counter()
+        tag_ids, ingredient_ids = self._ensure_catalogs()
+        user_ids = self._create_users(
+            options['users'], options['prefix'], options['password']
+        )
+        self._step(f'Пользователи: {len(user_ids)}', start)
+        author_ids = user_ids or list(
+            User.objects.values_list('id', flat=True)
+        )
+        recipe_ids = self._create_recipes(
+            options['recipes'], author_ids, tag_ids, ingredient_ids, options
+        ) if author_ids else []
+        self._step(f'Рецепты: {len(recipe_ids)}', start)
+        if recipe_ids:
+            self._create_links(
+                Favorite, 'recipe_id', user_ids, recipe_ids,
+                options['favorites']
+            )
+            self._create_links(
+                ShoppingCart, 'recipe_id', user_ids, recipe_ids,
+                options['cart']
+            )
+        self._create_links(
+            Follow, 'author_id', user_ids, user_ids, options['follows']
+        )
+        self._step('Избранное, корзины и подписки', start)
+        rebuild_shopping_lists()
+        self._step('Списки покупок', start)
+        recount(Recipe)
+        recount(User)
+        bump_generation('recipes')
+        self._step('Счётчики', start)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(user_ids)}, '
+            f'рецептов: {len(recipe_ids)}'
+        ))
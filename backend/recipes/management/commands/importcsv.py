@@ -1,14 +1,28 @@
 import csv
-import sys
+import io
+import json
+import os
+import time
+from itertools import islice
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
+from recipes.autocomplete import invalidate_index
+from recipes.caching import bump_catalog_version, bump_generation
 from recipes.models import Ingredient, Tag
 
 
 class Command(BaseCommand):
-    help = ('Import CSV-files. Use command: python3 manage.py importcsv')
+    help = (
+        'Import ingredients and tags from CSV or JSON files. '
+        'Catalog versions and cached responses are reset for all '
+        'processes; the ingredient autocomplete index is reset only in '
+        'this one, running servers pick up new ingredients after '
+        'INGREDIENT_INDEX_TTL. '
+        'Use command: python3 manage.py importcsv [ingredients] [tags]'
+    )
     BASES = {
         'ingredients': Ingredient,
         'tags': Tag,
@@ -17,35 +31,197 @@ class Command(BaseCommand):
         'ingredients': f'{settings.DATA_ROOT}/ingredients.csv',
         'tags': f'{settings.DATA_ROOT}/tags.csv',
     }
+    KEYS = {
+        'ingredients': ('name', 'measurement_unit'),
+        'tags': ('slug',),
+    }
+    JSON_READ_SIZE = 64 * 1024
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'bases',
+            nargs='*',
+            help=f'What to import, all by default: {", ".join(self.BASES)}.'
+        )
+        for base_name, path in self.FILES.items():
+            parser.add_argument(
+                f'--{base_name}-file',
+                default=path,
+                help=f'CSV (";"-separated) or JSON file, default {path}.'
+            )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows per insert.'
+        )
+        parser.add_argument(
+            '--no-copy',
+            action='store_true',
+            help='Do not use PostgreSQL COPY, insert with bulk_create.'
+        )
 
-    def _get_or_create_object(self, model, data):
+    def _get_object(self, model, data):
         if model == Tag:
-            return model.objects.get_or_create(
-                                name=data['name'].lower(),
-                                slug=data['slug']
-                            )
-        return model.objects.get_or_create(
-                            name=data['name'].lower(),
-                            measurement_unit=data['measurement_unit']
+            return model(name=data['name'].lower(), slug=data['slug'])
+        return model(
+            name=data['name'].lower(),
+            measurement_unit=data['measurement_unit']
+        )
+
+    def _iter_json(self, file):
+        """Поэлементно читает JSON-массив, не загружая файл целиком."""
+        decoder = json.JSONDecoder()
+        buffer = file.read(self.JSON_READ_SIZE).lstrip()
+        if not buffer.startswith('['):
+            raise CommandError('JSON-file must contain an array of objects')
+        buffer = buffer[1:]
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                obj, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                chunk = file.read(self.JSON_READ_SIZE)
+                if not chunk:
+                    raise CommandError('Unexpected end of JSON-file')
+                buffer += chunk
+                continue
+            yield obj
+            buffer = buffer[end:]
+
+    def _read_rows(self, path):
+        with open(path, 'r', encoding='utf-8') as file:
+            if os.path.splitext(path)[1].lower() == '.json':
+                yield from self._iter_json(file)
+            else:
+                yield from csv.DictReader(file, delimiter=';')
+
+    def _get_temp_table(self, model):
+        return connection.ops.quote_name(f'import_{model._meta.db_table}')
+
+    def _copy(self, model, objects):
+        """
+        Загружает объекты через COPY во временную таблицу. Таблица
+        создаётся один раз за запуск и очищается перед каждой пачкой:
+        внутри внешней транзакции ON COMMIT DROP не удалил бы её
+        между пачками.
+        """
+        table = connection.ops.quote_name(model._meta.db_table)
+        temp_table = self._get_temp_table(model)
+        fields = [
+            field for field in model._meta.concrete_fields
+            if not field.primary_key
+        ]
+        columns = ', '.join(
+            connection.ops.quote_name(field.column) for field in fields
+        )
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for obj in objects:
+            writer.writerow(getattr(obj, field.attname) for field in fields)
+        buffer.seek(0)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMP TABLE IF NOT EXISTS {temp_table} AS '
+                f'SELECT {columns} FROM {table} WITH NO DATA'
+            )
+            cursor.execute(f'TRUNCATE {temp_table}')
+            cursor.copy_expert(
+                f'COPY {temp_table} ({columns}) FROM STDIN WITH (FORMAT csv)',
+                buffer
+            )
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) '
+                f'SELECT {columns} FROM {temp_table} ON CONFLICT DO NOTHING'
+            )
+
+    def _drop_temp_table(self, model):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DROP TABLE IF EXISTS {self._get_temp_table(model)}'
+            )
+
+    def _import(self, base_name, path, batch_size, use_copy):
+        model = self.BASES[base_name]
+        keys = self.KEYS[base_name]
+        existing = set(model.objects.values_list(*keys).iterator())
+        rows = self._read_rows(path)
+        read = created = errors = 0
+        start = time.perf_counter()
+        try:
+            while True:
+                chunk = list(islice(rows, batch_size))
+                if not chunk:
+                    break
+                read += len(chunk)
+                objects = []
+                for row in chunk:
+                    try:
+                        obj = self._get_object(model, row)
+                    except (KeyError, AttributeError) as e:
+                        errors += 1
+                        self.stderr.write(f'Exception {e} in row {row}')
+                        continue
+                    key = tuple(getattr(obj, field) for field in keys)
+                    if key not in existing:
+                        existing.add(key)
+                        objects.append(obj)
+                if objects:
+                    if use_copy:
+                        self._copy(model, objects)
+                    else:
+                        model.objects.bulk_create(
+                            objects,
+                            batch_size=batch_size,
+                            ignore_conflicts=True
                         )
+                created += len(objects)
+                if self.verbosity > 1:
+                    self._report(base_name, read, created, start)
+            if use_copy:
+                self._drop_temp_table(model)
+        finally:
+            if created:
+                self._invalidate(base_name)
+        self._report(base_name, read, created, start)
+        if errors:
+            self.stderr.write(f'{base_name}: пропущено строк: {errors}')
+
+    def _invalidate(self, base_name):
+        """
+        Сбрасывает версию и кэш справочника: bulk_create и COPY не шлют
+        сигналов, которые делают это при обычном сохранении. Индекс
+        автодополнения сбрасывается только в этом процессе, в остальных
+        он обновится по истечении INGREDIENT_INDEX_TTL.
+        """
+        bump_catalog_version(base_name)
+        bump_generation(base_name)
+        if base_name == 'ingredients':
+            invalidate_index()
+
+    def _report(self, base_name, read, created, start):
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'{base_name}: прочитано {read}, создано {created}, '
+            f'{read / elapsed if elapsed else 0:.0f} строк/с'
+        )
 
     def handle(self, *args, **options):
-        for base_name, base in self.BASES.items():
-            with open(self.FILES[base_name], 'r', encoding="utf-8") as csvfile:
-                try:
-                    reader = csv.DictReader(csvfile, delimiter=';')
-                except Exception as e:
-                    sys.exit(f'CSV-file read exception {e}')
-                for row in reader:
-                    try:
-                        new_obj, status = self._get_or_create_object(base, row)
-                        if status:
-                            print(
-                                f'Создан новый объект: "{new_obj}"'
-                            )
-                        else:
-                            print(
-                                f'Объект "{new_obj}" создан ранее'
-                            )
-                    except Exception as e:
-                        print(f'Exception {e}')
+        self.verbosity = options['verbosity']
+        bases = options['bases'] or list(self.BASES)
+        unknown = set(bases) - set(self.BASES)
+        if unknown:
+            raise CommandError(f'Unknown bases: {", ".join(unknown)}')
+        use_copy = (
+            connection.vendor == 'postgresql' and not options['no_copy']
+        )
+        for base_name in bases:
+            path = options[f'{base_name}_file']
+            try:
+                self._import(
+                    base_name, path, options['batch_size'], use_copy
+                )
+            except (OSError, csv.Error) as e:
+                raise CommandError(f'File read exception {e}')
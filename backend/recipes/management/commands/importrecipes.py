@@ -0,0 +1,314 @@
+import gzip
+import json
+import sys
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from recipes.autocomplete import invalidate_index
+from recipes.caching import bump_catalog_version, bump_generation
+from recipes.cookable import schedule_cookable_update
+from recipes.counters import recount
+from recipes.images import acquire_images
+from recipes.models import (
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    Tag,
+    TagRecipe,
+)
+from recipes.search import refresh_search_index
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Import recipes from JSON Lines written by exportrecipes. '
+        'Recipes whose author already has a recipe with the same name '
+        'are skipped, as are recipes of new authors whose username is '
+        'taken by another user. Use command: '
+        'python3 manage.py importrecipes recipes.jsonl[.gz]'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Input file, "-" for stdin. Gzipped if it ends with .gz.'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Recipes per transaction.'
+        )
+
+    def _open(self, path):
+        if path == '-':
+            return sys.stdin
+        if path.endswith('.gz'):
+            return gzip.open(path, 'rt', encoding='utf-8')
+        return open(path, 'r', encoding='utf-8')
+
+    def _iter_rows(self, file):
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                self.errors += 1
+                self.stderr.write(f'Exception {e} in line {number}')
+                continue
+            yield row
+
+    def _get_authors(self, rows):
+        """
+        Словарь email → id авторов чанка, недостающие создаются.
+
+        Автор, username которого занят пользователем с другим email,
+        не создаётся: его email попадает в self.conflicts, а рецепты
+        пропускаются.
+        """
+        authors = {
+            row['author']['email']: row['author']
+            for row in rows if row.get('author')
+        }
+        ids = dict(
+            User.objects.filter(email__in=authors).values_list('email', 'id')
+        )
+        new_authors = {
+            email: author for email, author in authors.items()
+            if email not in ids and email not in self.conflicts
+        }
+        taken = set(
+            User.objects.filter(username__in={
+                author['username'] for author in new_authors.values()
+            }).values_list('username', flat=True)
+        )
+        missing = []
+        for email, author in new_authors.items():
+            if author['username'] in taken:
+                self.conflicts.add(email)
+                self.stderr.write(
+                    f'Username {author["username"]} автора {email} занят '
+                    f'другим пользователем, его рецепты пропущены'
+                )
+                continue
+            taken.add(author['username'])
+            missing.append(User(
+                email=email,
+                username=author['username'],
+                first_name=author.get('first_name', ''),
+                last_name=author.get('last_name', ''),
+                password=self.unusable_password,
+            ))
+        if missing:
+            User.objects.bulk_create(missing)
+            ids.update(
+                User.objects.filter(
+                    email__in=[user.email for user in missing]
+                ).values_list('email', 'id')
+            )
+        return ids
+
+    def _get_ingredients(self, rows):
+        """
+        Дополняет словарь (название, единица) → id ингредиентами чанка,
+        которых ещё нет в базе.
+        """
+        missing = {
+            (item['name'], item['measurement_unit'])
+            for row in rows for item in row.get('ingredients', ())
+        } - self.ingredients.keys()
+        if not missing:
+            return
+        Ingredient.objects.bulk_create(
+            (
+                Ingredient(name=name, measurement_unit=unit)
+                for name, unit in missing
+            ),
+            ignore_conflicts=True
+        )
+        self.ingredients.update(
+            ((name, unit), pk)
+            for pk, name, unit in Ingredient.objects.filter(
+                name__in={name for name, _ in missing}
+            ).values_list('id', 'name', 'measurement_unit')
+        )
+        self.new_ingredients = True
+
+    def _create_recipes(self, recipes):
+        """
+        Создаёт рецепты и возвращает их с id. SQLite не возвращает id
+        из bulk_create, их приходится перечитывать по паре (автор,
+        название): среди импортируемых рецептов она уникальна.
+        """
+        created = Recipe.objects.bulk_create(recipes)
+        if all(recipe.pk for recipe in created):
+            return created
+        author_ids = {recipe.author_id for recipe in created}
+        by_author = Q(author_id__in=author_ids - {None})
+        if None in author_ids:
+            by_author |= Q(author__isnull=True)
+        ids = {
+            (author_id, name): pk
+            for pk, author_id, name in Recipe.objects.filter(
+                by_author, name__in={recipe.name for recipe in created}
+            ).values_list('id', 'author_id', 'name').order_by('id')
+        }
+        for recipe in created:
+            recipe.pk = ids[(recipe.author_id, recipe.name)]
+            recipe._state.adding = False
+        return created
+
+    def _import_chunk(self, rows):
+        authors = self._get_authors(rows)
+        self._get_ingredients(rows)
+        keys = {
+            (authors.get((row.get('author') or {}).get('email')), row['name'])
+            for row in rows
+        }
+        author_ids = {author_id for author_id, _ in keys}
+        by_author = Q(author_id__in=author_ids)
+        if None in author_ids:
+            by_author |= Q(author__isnull=True)
+        existing = set(
+            Recipe.objects.filter(
+                by_author, name__in={name for _, name in keys}
+            ).values_list('author_id', 'name').order_by()
+        )
+        new_rows, recipes = [], []
+        for row in rows:
+            email = (row.get('author') or {}).get('email')
+            if email in self.conflicts:
+                self.conflicting += 1
+                continue
+            author_id = authors.get(email)
+            key = (author_id, row['name'])
+            if key in existing:
+                self.skipped += 1
+                continue
+            existing.add(key)
+            new_rows.append(row)
+            recipes.append(Recipe(
+                author_id=author_id,
+                name=row['name'],
+                text=row['text'],
+                cooking_time=row['cooking_time'],
+                image=row.get('image') or '',
+            ))
+        if not recipes:
+            return
+        recipes = self._create_recipes(recipes)
+        tag_links, ingredient_links = [], []
+        for recipe, row in zip(recipes, new_rows):
+            for slug in dict.fromkeys(row.get('tags', ())):
+                if slug in self.tags:
+                    tag_links.append(
+                        TagRecipe(recipe_id=recipe.id, tag_id=self.tags[slug])
+                    )
+                else:
+                    self.unknown_tags.add(slug)
+            amounts = {}
+            for item in row.get('ingredients', ()):
+                ingredient_id = self.ingredients[
+                    (item['name'], item['measurement_unit'])
+                ]
+                amounts[ingredient_id] = item['amount']
+            ingredient_links.extend(
+                IngredientRecipe(
+                    recipe_id=recipe.id,
+                    ingredient_id=ingredient_id,
+                    amount=amount
+                )
+                for ingredient_id, amount in amounts.items()
+            )
+        TagRecipe.objects.bulk_create(tag_links)
+        IngredientRecipe.objects.bulk_create(ingredient_links)
+        acquire_images(recipe.image.name for recipe in recipes)
+        refresh_search_index(recipe.id for recipe in recipes)
+        schedule_cookable_update(recipe.id for recipe in recipes)
+        recount(User, {recipe.author_id for recipe in recipes} - {None})
+        self.created += len(recipes)
+
+    def _report(self, start):
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'Прочитано {self.read}, создано {self.created}, '
+            f'пропущено {self.skipped}, '
+            f'{self.read / elapsed if elapsed else 0:.0f} рецептов/с'
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        chunk_size = options['chunk_size']
+        self.read = self.created = self.skipped = self.errors = 0
+        self.conflicting = 0
+        self.conflicts = set()
+        self.unknown_tags = set()
+        self.new_ingredients = False
+        self.unusable_password = make_password(None)
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.ingredients = {
+            (name, unit): pk
+            for pk, name, unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            ).iterator()
+        }
+        start = time.perf_counter()
+        try:
+            file = self._open(options['path'])
+        except OSError as e:
+            raise CommandError(f'File read exception {e}')
+        try:
+            rows = self._iter_rows(file)
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    break
+                self.read += len(chunk)
+                try:
+                    with transaction.atomic():
+                        self._import_chunk(chunk)
+                except (KeyError, TypeError, IntegrityError) as e:
+                    raise CommandError(
+                        f'Exception {e!r} in recipes '
+                        f'{self.read - len(chunk) + 1}-{self.read}'
+                    )
+                if self.verbosity > 1:
+                    self._report(start)
+        except OSError as e:
+            raise CommandError(f'File read exception {e}')
+        finally:
+            if file is not sys.stdin:
+                file.close()
+            if self.new_ingredients:
+                bump_catalog_version('ingredients')
+                bump_generation('ingredients')
+                invalidate_index()
+            if self.created:
+                bump_generation('recipes')
+        self._report(start)
+        if self.errors:
+            self.stderr.write(f'Пропущено строк с ошибками: {self.errors}')
+        if self.conflicting:
+            self.stderr.write(
+                f'Пропущено рецептов авторов с занятым username: '
+                f'{self.conflicting}'
+            )
+        if self.unknown_tags:
+            self.stderr.write(
+                f'Неизвестные тэги пропущены: '
+                f'{", ".join(sorted(self.unknown_tags))}'
+            )
+        if self.created:
+            self.stdout.write(
+                'Копии изображений можно построить командой '
+                'makeimagevariants'
+            )
@@ -0,0 +1,271 @@
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+NO_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+}
+
+
+def percentile(values, share):
+    """Перцентиль по ближайшему рангу."""
+    ordered = sorted(values)
+    return ordered[max(round(share * len(ordered)) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure latency, queries and memory of the main API endpoints on '
+        'the current database through the Django test client. Use command: '
+        'python3 manage.py loadtest [endpoint ...] --output results.json '
+        '[--compare baseline.json]'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'endpoints',
+            nargs='*',
+            help='Endpoints to measure, all by default.'
+        )
+        parser.add_argument(
+            '--requests', type=int, default=50,
+            help='Measured requests per endpoint.'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=5,
+            help='Unmeasured requests per endpoint.'
+        )
+        parser.add_argument(
+            '--user',
+            help=(
+                'Email of the user for authenticated endpoints, by default '
+                'the user with the most subscriptions. A token created for '
+                'the run is deleted at the end.'
+            )
+        )
+        parser.add_argument(
+            '--cache', action='store_true',
+            help='Keep the configured cache, by default it is disabled.'
+        )
+        parser.add_argument('--output', help='Write results to a JSON file.')
+        parser.add_argument(
+            '--compare', help='Compare with results from a JSON file.'
+        )
+
+    def get_endpoints(self):
+        """
+        Словарь имя → (функция номера запроса → адрес, нужен ли вход).
+        Адреса зависят от номера, чтобы запросы не повторяли друг друга.
+        """
+        recipe_ids = list(
+            Recipe.objects.order_by('?').values_list('id', flat=True)[:100]
+        )
+        slugs = list(Tag.objects.values_list('slug', flat=True)) or ['']
+        names = list(
+            Ingredient.objects.order_by('?').values_list(
+                'name', flat=True
+            )[:100]
+        ) or ['']
+        words = [
+            word for name in Recipe.objects.order_by('?').values_list(
+                'name', flat=True
+            )[:100]
+            for word in name.split()
+        ] or ['']
+        endpoints = {
+            'recipes': (lambda n: f'/api/recipes/?page={n % 5 + 1}', False),
+            'recipes_auth': (
+                lambda n: f'/api/recipes/?page={n % 5 + 1}', True
+            ),
+            'recipes_filtered': (
+                lambda n: (
+                    f'/api/recipes/?tags={slugs[n % len(slugs)]}'
+                    f'&is_favorited=1'
+                ),
+                True
+            ),
+            'recipes_search': (
+                lambda n: f'/api/recipes/?search={words[n % len(words)]}',
+                False
+            ),
+            'recipe_detail': (
+                lambda n: f'/api/recipes/{recipe_ids[n % len(recipe_ids)]}/',
+                True
+            ),
+            'subscriptions': (
+                lambda n: '/api/users/subscriptions/?recipes_limit=3',
+                True
+            ),
+            'download_shopping_cart': (
+                lambda n: '/api/recipes/download_shopping_cart/?format=pdf',
+                True
+            ),
+            'download_shopping_cart_txt': (
+                lambda n: '/api/recipes/download_shopping_cart/?format=txt',
+                True
+            ),
+            'ingredients': (
+                lambda n: (
+                    f'/api/ingredients/?name={names[n % len(names)][:3]}'
+                ),
+                False
+            ),
+            'tags': (lambda n: '/api/tags/', False),
+        }
+        if not recipe_ids:
+            del endpoints['recipe_detail']
+        return endpoints
+
+    def get_user(self, email):
+        if email:
+            user = User.objects.filter(email=email).first()
+            if user is None:
+                raise CommandError(f'User {email} not found')
+            return user
+        user = User.objects.annotate(
+            follows=Count('user')
+        ).order_by('-follows', 'id').first()
+        if user is None:
+            raise CommandError(
+                'Database is empty, run: python3 manage.py generatedata'
+            )
+        return user
+
+    @staticmethod
+    def request(client, path):
+        """Запрос с чтением всего ответа, включая потоковый."""
+        response = client.get(path)
+        if response.streaming:
+            body = b''.join(response.streaming_content)
+        else:
+            body = response.content
+        response.close()
+        return response.status_code, len(body)
+
+    def measure(self, client, get_path, count, warmup):
+        for number in range(warmup):
+            self.request(client, get_path(number))
+        timings, queries, statuses, sizes = [], [], set(), []
+        for number in range(count):
+            path = get_path(number)
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                status, size = self.request(client, path)
+                timings.append((time.perf_counter() - start) * 1000)
+            queries.append(len(context.captured_queries))
+            statuses.add(status)
+            sizes.append(size)
+        tracemalloc.start()
+        self.request(client, get_path(0))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return {
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'mean_ms': round(statistics.mean(timings), 2),
+            'max_ms': round(max(timings), 2),
+            'queries': round(statistics.mean(queries), 1),
+            'max_queries': max(queries),
+            'peak_memory_kib': round(peak / 1024, 1),
+            'response_bytes': round(statistics.mean(sizes)),
+            'statuses': sorted(statuses),
+        }
+
+    def compare(self, results, path):
+        try:
+            with open(path, encoding='utf-8') as file:
+                baseline = json.load(file)['results']
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f'Cannot read baseline {path}: {e}')
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Сравнение с {path}'))
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            changes = []
+            for key in ('p50_ms', 'p95_ms', 'queries', 'peak_memory_kib'):
+                old, new = baseline[name][key], result[key]
+                change = (new - old) / old * 100 if old else 0
+                changes.append(f'{key} {old} → {new} ({change:+.0f}%)')
+            self.stdout.write(f'{name:<28} ' + ', '.join(changes))
+
+    def measure_endpoints(self, endpoints, names, token, options):
+        """Замеры адресов names, с входом по token там, где он нужен."""
+        anonymous = Client()
+        authenticated = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        overrides = {'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver']}
+        if not options['cache']:
+            overrides['CACHES'] = NO_CACHE
+        results = {}
+        with override_settings(**overrides):
+            for name in names:
+                get_path, login = endpoints[name]
+                result = self.measure(
+                    authenticated if login else anonymous,
+                    get_path,
+                    options['requests'],
+                    options['warmup']
+                )
+                results[name] = result
+                style = (
+                    self.style.ERROR if result['statuses'][-1] >= 400
+                    else str
+                )
+                self.stdout.write(style(
+                    f'{name:<28} p50 {result["p50_ms"]:>8.1f} ms  '
+                    f'p95 {result["p95_ms"]:>8.1f} ms  '
+                    f'{result["queries"]:>5} queries  '
+                    f'{result["peak_memory_kib"]:>9.1f} KiB  '
+                    f'{result["statuses"]}'
+                ))
+        return results
+
+    def handle(self, *args, **options):
+        endpoints = self.get_endpoints()
+        names = options['endpoints'] or list(endpoints)
+        unknown = set(names) - set(endpoints)
+        if unknown:
+            raise CommandError(f'Unknown endpoints: {", ".join(unknown)}')
+        user = self.get_user(options['user'])
+        token, created = Token.objects.get_or_create(user=user)
+        try:
+            results = self.measure_endpoints(endpoints, names, token, options)
+        finally:
+            if created:
+                token.delete()
+        if options['compare']:
+            self.compare(results, options['compare'])
+        if options['output']:
+            report = {
+                'created_at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'user': user.email,
+                'requests': options['requests'],
+                'cache': options['cache'],
+                'counts': {
+                    'users': User.objects.count(),
+                    'recipes': Recipe.objects.count(),
+                    'ingredients': Ingredient.objects.count(),
+                    'tags': Tag.objects.count(),
+                },
+                'results': results,
+            }
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Результаты записаны в {options["output"]}')
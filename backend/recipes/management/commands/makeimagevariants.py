@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.images import make_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Build missing thumbnails and WebP variants of recipe images. '
+        'Use command: python3 manage.py makeimagevariants [--workers N]'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.RECIPE_IMAGE_WORKERS or 1,
+            help='Number of worker threads.'
+        )
+
+    def handle(self, *args, **options):
+        images = (
+            recipe.image for recipe in Recipe.objects.exclude(
+                image=''
+            ).only('id', 'image').iterator()
+        )
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            futures = [
+                (image.name, executor.submit(make_variants, image))
+                for image in images
+            ]
+            for name, future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f'{name}: {e}')
+                else:
+                    done += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {done}, с ошибками: {failed}'
+        ))
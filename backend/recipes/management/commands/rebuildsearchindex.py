@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from recipes.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the recipe full-text search index, e.g. after bulk imports. '
+        'Use command: python3 manage.py rebuildsearchindex'
+    )
+
+    def handle(self, *args, **options):
+        rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс пересобран'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.shopping_list import rebuild_shopping_lists, verify_shopping_lists
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild or verify stored shopping lists. Use command: '
+        'python3 manage.py rebuildshoppinglists [--verify]'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only compare stored shopping lists with recomputed ones.'
+        )
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            rebuild_shopping_lists()
+            self.stdout.write(self.style.SUCCESS('Списки покупок пересобраны'))
+            return
+        mismatches = verify_shopping_lists()
+        for (user, ingredient), (stored, expected) in sorted(
+            mismatches.items()
+        ):
+            self.stdout.write(
+                f'Пользователь {user}, ингредиент {ingredient}: '
+                f'сохранено {stored}, ожидается {expected}'
+            )
+        if mismatches:
+            raise CommandError(f'Расхождений: {len(mismatches)}')
+        self.stdout.write(self.style.SUCCESS('Расхождений нет'))
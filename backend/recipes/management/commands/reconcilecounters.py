@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.counters import recount
+from recipes.models import Recipe
+from users.models import CustomUser as User
+
+
+class Command(BaseCommand):
+    help = (
+        'Recount favorites, recipes and followers counters and fix drift. '
+        'Use command: python3 manage.py reconcilecounters [--dry-run]'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report counters that differ from the data.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Rows fixed per UPDATE statement.'
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        total = 0
+        for model in (Recipe, User):
+            drift = recount(
+                model, dry_run=dry_run, batch_size=options['batch_size']
+            )
+            for field, count in drift.items():
+                self.stdout.write(
+                    f'{model.__name__}.{field}: расхождений {count}'
+                )
+                total += count
+        if dry_run and total:
+            raise CommandError(f'Расхождений: {total}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено счётчиков: {total}' if not dry_run
+            else 'Расхождений нет'
+        ))
@@ -0,0 +1,70 @@
+# Generated by Django 3.2.16 on 2026-10-18 02:49
+
+import django.contrib.postgres.search
+import foodgram.indexes
+from django.db import migrations
+
+INGREDIENT_NAMES = (
+    "coalesce((SELECT {aggregate}(i.name, ' ') "
+    'FROM recipes_ingredientrecipe ir '
+    'JOIN recipes_ingredient i ON i.id = ir.ingredient_id '
+    "WHERE ir.recipe_id = r.id), '')"
+)
+
+
+def fold_yo(column):
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def create_search_index(apps, schema_editor):
+    """
+    Заполняет search_vector на PostgreSQL (GIN-индекс по нему создаётся
+    следующей операцией) или таблицу FTS5 на SQLite по существующим
+    рецептам.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        names = fold_yo(INGREDIENT_NAMES.format(aggregate='string_agg'))
+        schema_editor.execute(
+            'UPDATE recipes_recipe r SET search_vector = '
+            f"setweight(to_tsvector('russian', {fold_yo('r.name')}), 'A') || "
+            f"setweight(to_tsvector('russian', {names}), 'B') || "
+            f"setweight(to_tsvector('russian', {fold_yo('r.text')}), 'C')"
+        )
+    elif vendor == 'sqlite':
+        names = fold_yo(INGREDIENT_NAMES.format(aggregate='group_concat'))
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5('
+            'name, ingredients, text, '
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            'INSERT INTO recipes_recipe_fts (rowid, name, ingredients, text) '
+            f"SELECT r.id, {fold_yo('r.name')}, {names}, "
+            f"{fold_yo('r.text')} FROM recipes_recipe r"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE recipes_recipe_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0023_image_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=foodgram.indexes.PostgresGinIndex(fields=['search_vector'], name='recipe_search_vector_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.16 on 2026-10-18 03:52
+
+from django.db import migrations, models
+
+from recipes.images import iter_variants
+
+
+def fill_variants_ready(apps, schema_editor):
+    """Отмечает рецепты, копии изображений которых уже построены."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    storage = Recipe._meta.get_field('image').storage
+    names = Recipe.objects.exclude(image='').values_list(
+        'image', flat=True
+    ).distinct().order_by()
+    ready = [
+        name for name in names.iterator()
+        if all(storage.exists(variant) for _, variant in iter_variants(name))
+    ]
+    for start in range(0, len(ready), 1000):
+        Recipe.objects.filter(image__in=ready[start:start + 1000]).update(
+            image_variants_ready=True
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0025_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants_ready',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Копии изображения построены'),
+        ),
+        migrations.RunPython(fill_variants_ready, migrations.RunPython.noop),
+    ]
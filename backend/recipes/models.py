@@ -1,11 +1,14 @@
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
 from django.db.models import UniqueConstraint
 
+from foodgram.indexes import PostgresGinIndex
 from recipes import validators
+from recipes.storage import ContentAddressedStorage
 
-from users.models import CustomUser as User
+from users.models import CounterFieldsMixin, CustomUser as User
 
 
 class Tag(models.Model):
@@ -60,7 +63,7 @@ class Ingredient(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(CounterFieldsMixin, models.Model):
     """Модель рецепта."""
     author = models.ForeignKey(
         User,
@@ -76,6 +79,7 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         upload_to='recipes/images/',
+        storage=ContentAddressedStorage(),
         verbose_name='Картинка'
     )
     text = models.TextField(verbose_name='Описание')
@@ -85,6 +89,25 @@ class Recipe(models.Model):
             1, message='Время приготовления не может быть меньше 1 минуты.'
         )]
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
+    image_variants_ready = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Копии изображения построены'
+    )
     tags = models.ManyToManyField(
         Tag,
         through='TagRecipe',
@@ -101,10 +124,18 @@ class Recipe(models.Model):
     )
 
     class Meta:
+        indexes = [
+            models.Index(fields=('name', 'id'), name='recipe_name_id_idx'),
+            PostgresGinIndex(
+                fields=('search_vector',), name='recipe_search_vector_idx'
+            ),
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('name',)
 
+    counter_fields = ('favorites_count', 'image_variants_ready')
+
     def __str__(self):
         return self.name
 
@@ -114,13 +145,13 @@ class TagRecipe(models.Model):
     tag = models.ForeignKey(
         Tag,
         on_delete=models.CASCADE,
-        related_name='recipes',
+        related_name='tags_recipes',
         verbose_name='Тэг'
     )
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
-        related_name='tags',
+        related_name='tags_recipes',
         verbose_name='Рецепт'
     )
 
@@ -144,16 +175,16 @@ class IngredientRecipe(models.Model):
     ingredient = models.ForeignKey(
         Ingredient,
         on_delete=models.CASCADE,
-        related_name='recipes',
+        related_name='ingrs_recipes',
         verbose_name='Ингредиент'
     )
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
-        related_name='ingredients',
+        related_name='ingrs_recipes',
         verbose_name='Рецепт'
     )
-    quantity = models.PositiveSmallIntegerField(
+    amount = models.PositiveSmallIntegerField(
         verbose_name='Количество',
         validators=[MinValueValidator(
             1, message='Количество не может быть меньше 1.'
@@ -213,6 +244,102 @@ class ShoppingCart(FavoriteShoppingCartBaseModel):
         default_related_name = 'shopping_cart'
 
 
+class ShoppingListItem(models.Model):
+    """
+    Модель строки списка покупок.
+
+    Хранит сумму ингредиента по всем рецептам в списке покупок
+    пользователя, обновляется при изменении списка и рецептов в нём.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент'
+    )
+    total = models.PositiveIntegerField(verbose_name='Количество')
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item'
+            ),
+        ]
+        default_related_name = 'shopping_list'
+        verbose_name = 'Строка списка покупок'
+        verbose_name_plural = 'Строки списка покупок'
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} - {self.total}'
+
+
+class CatalogVersion(models.Model):
+    """
+    Модель версии справочника (тэги, ингредиенты).
+
+    Версия увеличивается при любом изменении справочника и служит
+    дешёвым признаком для условных GET-запросов.
+    """
+    name = models.CharField(
+        max_length=settings.NAME_SLUG_LENGTH,
+        unique=True,
+        verbose_name='Справочник'
+    )
+    version = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Версия'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+
+    class Meta:
+        verbose_name = 'Версия справочника'
+        verbose_name_plural = 'Версии справочников'
+
+    def __str__(self):
+        return f'{self.name} - {self.version}'
+
+
+class ImageBlob(models.Model):
+    """
+    Модель файла изображения в хранилище с числом рецептов,
+    которые на него ссылаются.
+    """
+    name = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Файл'
+    )
+    references = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число ссылок'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=('references', 'updated_at'),
+                name='imageblob_references_idx'
+            ),
+        ]
+        verbose_name = 'Файл изображения'
+        verbose_name_plural = 'Файлы изображений'
+
+    def __str__(self):
+        return self.name
+
+
 class Follow(models.Model):
     """Модель подписки."""
     user = models.ForeignKey(
@@ -235,5 +362,8 @@ class Follow(models.Model):
                 name='unique_follow'
             ),
         ]
+        indexes = [
+            models.Index(fields=('user', 'id'), name='follow_user_id_idx'),
+        ]
         verbose_name_plural = 'Подписки'
         verbose_name = 'Подписка'
@@ -1,7 +1,217 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+import json
+from base64 import b64decode, b64encode
+from binascii import Error as BinasciiError
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def get_cached_count(queryset):
+    """Число строк queryset, закэшированное по тексту запроса."""
+    try:
+        sql = str(queryset.query)
+    except EmptyResultSet:
+        return 0
+    key = f'keyset-count:{hashlib.md5(sql.encode()).hexdigest()}'
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TTL)
+    return count
+
+
+def get_estimated_count(model, using='default'):
+    """
+    Оценка числа строк таблицы из статистики PostgreSQL или None на
+    других базах и для таблиц, которые ещё не анализировались.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class '
+            'WHERE oid = %s::regclass',
+            [model._meta.db_table]
+        )
+        row = cursor.fetchone()
+    return row[0] if row and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор списков админки для больших таблиц.
+
+    Для списка без фильтров и поиска берётся оценка числа строк из
+    статистики PostgreSQL, если она больше
+    ADMIN_ESTIMATED_COUNT_THRESHOLD. Иначе число строк считается точно
+    и кэшируется, как в пагинации по ключу.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = get_estimated_count(queryset.model, queryset.db)
+            if (
+                estimate is not None
+                and estimate >= settings.ADMIN_ESTIMATED_COUNT_THRESHOLD
+            ):
+                return estimate
+        return get_cached_count(queryset)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по ключу: следующая страница выбирается условием
+    (name, id) > (последний name, последний id) вместо OFFSET, поэтому
+    любая страница отдаётся за одно и то же время.
+
+    Поля ключа берутся из cursor_ordering вьюсета и должны вместе
+    однозначно задавать порядок. Общее количество объектов кэшируется.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = 6
+    max_page_size = 100
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = tuple(view.cursor_ordering)
+        self.page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+        self.count = self.get_count(queryset)
+        queryset = queryset.order_by(*(
+            f'-{field}' if reverse else field for field in self.ordering
+        ))
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(
+                position, reverse
+            ))
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+        has_next = has_more if not reverse else position is not None
+        has_previous = has_more if reverse else position is not None
+        self.next_position = (
+            self.get_position(results[-1]) if has_next and results else None
+        )
+        self.previous_position = (
+            self.get_position(results[0]) if has_previous and results
+            else None
+        )
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_count(self, queryset):
+        return get_cached_count(queryset)
+
+    def get_position(self, obj):
+        if isinstance(obj, dict):
+            return [obj[field] for field in self.ordering]
+        return [getattr(obj, field) for field in self.ordering]
+
+    def get_position_filter(self, position, reverse):
+        """
+        Условие (f1, f2, ...) > (v1, v2, ...) для порядка по возрастанию
+        и < для обратного.
+        """
+        lookup = 'lt' if reverse else 'gt'
+        condition = None
+        for field, value in reversed(list(zip(self.ordering, position))):
+            beyond = Q(**{f'{field}__{lookup}': value})
+            condition = beyond if condition is None else (
+                beyond | Q(**{field: value}) & condition
+            )
+        first_field, first_value = self.ordering[0], position[0]
+        return Q(**{f'{first_field}__{lookup}e': first_value}) & condition
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            data = json.loads(b64decode(encoded.encode()).decode())
+            position, reverse = data['p'], bool(data['r'])
+        except (BinasciiError, UnicodeDecodeError, ValueError, KeyError,
+                TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or (
+            len(position) != len(self.ordering)
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, position, reverse):
+        data = json.dumps({'p': position, 'r': int(reverse)}, default=str)
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            b64encode(data.encode()).decode()
+        )
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position, False)
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
 
 
 class CustomPageNumberPagination(PageNumberPagination):
-    """Кастомный пагинатор, по умолчанию возвращает 6 объектов на странице."""
+    """
+    Кастомный пагинатор, по умолчанию возвращает 6 объектов на странице.
+
+    Если в запросе есть параметр cursor, а у вьюсета задан
+    cursor_ordering, страницы отдаются пагинацией по ключу.
+    """
     page_size_query_param = 'limit'
     page_size = 6
+    keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (
+            KeysetPagination.cursor_query_param in request.query_params
+            and getattr(view, 'cursor_ordering', None)
+        ):
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,177 @@
+import re
+import threading
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.db import connection, transaction
+from django.db.models import (
+    Aggregate,
+    F,
+    OuterRef,
+    Subquery,
+    TextField,
+    Value,
+)
+from django.db.models.functions import Coalesce, Replace
+
+from recipes.models import IngredientRecipe, Recipe
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+FTS_WEIGHTS = (10.0, 4.0, 1.0)
+MAX_TERMS = 10
+
+_pending = threading.local()
+
+
+class GroupConcat(Aggregate):
+    """Агрегат group_concat из SQLite, аналог StringAgg."""
+    function = 'GROUP_CONCAT'
+    template = "%(function)s(%(expressions)s, ' ')"
+    output_field = TextField()
+
+
+def fold_yo(value):
+    """Ё и е в поиске не различаются."""
+    return value.replace('ё', 'е').replace('Ё', 'Е')
+
+
+def _fold_yo_expression(expression):
+    return Replace(
+        Replace(expression, Value('ё'), Value('е')), Value('Ё'), Value('Е')
+    )
+
+
+def uses_fts5():
+    """На SQLite поиск идёт по виртуальной таблице FTS5."""
+    return connection.vendor == 'sqlite'
+
+
+def _ingredient_names():
+    """Подзапрос: названия ингредиентов рецепта через пробел."""
+    if uses_fts5():
+        aggregate = GroupConcat('ingredient__name')
+    else:
+        aggregate = StringAgg('ingredient__name', ' ')
+    return Coalesce(Subquery(
+        IngredientRecipe.objects.filter(recipe=OuterRef('pk')).values(
+            'recipe'
+        ).annotate(names=aggregate).values('names')[:1]
+    ), Value(''), output_field=TextField())
+
+
+def refresh_search_index(recipe_ids):
+    """Пересчитывает поисковый индекс рецептов с переданными id."""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    if not uses_fts5():
+        Recipe.objects.filter(id__in=recipe_ids).update(
+            search_vector=(
+                SearchVector(
+                    _fold_yo_expression(F('name')),
+                    weight='A',
+                    config=SEARCH_CONFIG
+                )
+                + SearchVector(
+                    _fold_yo_expression(_ingredient_names()),
+                    weight='B',
+                    config=SEARCH_CONFIG
+                )
+                + SearchVector(
+                    _fold_yo_expression(F('text')),
+                    weight='C',
+                    config=SEARCH_CONFIG
+                )
+            )
+        )
+        return
+    rows = Recipe.objects.filter(id__in=recipe_ids).annotate(
+        ingredient_names=_ingredient_names()
+    ).values_list('id', 'name', 'ingredient_names', 'text')
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})',
+            recipe_ids
+        )
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, ingredients, text) '
+            f'VALUES (%s, %s, %s, %s)',
+            [
+                (recipe_id, fold_yo(name), fold_yo(names), fold_yo(text))
+                for recipe_id, name, names, text in rows
+            ]
+        )
+
+
+def rebuild_search_index(batch_size=1000):
+    """Пересчитывает поисковый индекс всех рецептов."""
+    if uses_fts5():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+    ids = Recipe.objects.order_by('id').values_list('id', flat=True)
+    batch = []
+    for recipe_id in ids.iterator():
+        batch.append(recipe_id)
+        if len(batch) >= batch_size:
+            refresh_search_index(batch)
+            batch = []
+    refresh_search_index(batch)
+
+
+def _flush():
+    recipe_ids = getattr(_pending, 'ids', None)
+    if recipe_ids:
+        _pending.ids = set()
+        refresh_search_index(recipe_ids)
+
+
+def schedule_search_update(recipe_ids):
+    """
+    Откладывает пересчёт индекса до фиксации транзакции, чтобы все
+    изменения рецепта за транзакцию пересчитывались одним запросом.
+    """
+    if not hasattr(_pending, 'ids'):
+        _pending.ids = set()
+    _pending.ids.update(recipe_ids)
+    transaction.on_commit(_flush)
+
+
+def get_fts_query(query):
+    """
+    Запрос FTS5 из пользовательской строки: все слова должны
+    встретиться, каждое как начало слова, что заменяет стемминг.
+    """
+    terms = re.findall(r'\w+', fold_yo(query))[:MAX_TERMS]
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_recipes(queryset, query):
+    """Рецепты, подходящие под запрос, по убыванию релевантности."""
+    if uses_fts5():
+        fts_query = get_fts_query(query)
+        if not fts_query:
+            return queryset
+        # Соединение, а не коррелированный подзапрос: bm25 доступна только
+        # внутри MATCH, и подзапрос повторял бы поиск для каждой строки.
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        return queryset.extra(
+            select={'search_rank': f'-bm25({FTS_TABLE}, {weights})'},
+            tables=[FTS_TABLE],
+            where=[
+                f'{FTS_TABLE} MATCH %s',
+                f'{FTS_TABLE}.rowid = {Recipe._meta.db_table}.id',
+            ],
+            params=[fts_query]
+        ).order_by('-search_rank', 'id')
+    search_query = SearchQuery(
+        fold_yo(query), config=SEARCH_CONFIG, search_type='websearch'
+    )
+    return queryset.filter(search_vector=search_query).annotate(
+        search_rank=SearchRank(F('search_vector'), search_query)
+    ).order_by('-search_rank', 'id')
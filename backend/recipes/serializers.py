@@ -1,10 +1,18 @@
-from django.shortcuts import get_object_or_404
+from collections import defaultdict
+from operator import itemgetter
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Value
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers, status
 from rest_framework.exceptions import ValidationError
 
-from users.models import CustomUser as User
-from users.serializers import CustomUserSerializer
+from recipes.images import (
+    StreamingBase64ImageField,
+    get_image_storage,
+    get_variant_urls,
+    get_variant_urls_by_name,
+)
 from recipes.models import (
     Favorite,
     Follow,
@@ -13,7 +21,11 @@ from recipes.models import (
     Recipe,
     ShoppingCart,
     Tag,
+    TagRecipe,
 )
+from recipes.shopping_list import update_shopping_lists, updated_explicitly
+from users.models import CustomUser as User
+from users.serializers import CustomUserSerializer
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -33,7 +45,7 @@ class IngredientSerializer(serializers.ModelSerializer):
 
 class IngredientRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор ингредиентов в рецептах."""
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField(source='ingredient_id')
     name = serializers.ReadOnlyField(source='ingredient.name')
     measurement_unit = serializers.ReadOnlyField(
         source='ingredient.measurement_unit'
@@ -41,7 +53,27 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = IngredientRecipe
-        fields = ('id', 'name', 'measurement_unit', 'quantity')
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    Адреса уменьшенных копий изображения рецепта и их WebP-вариантов,
+    пока копии не построены — адреса исходного изображения.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', '*')
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        urls = get_variant_urls(recipe.image, recipe.image_variants_ready)
+        request = self.context.get('request')
+        if urls is None or request is None:
+            return urls
+        return {
+            key: request.build_absolute_uri(url) for key, url in urls.items()
+        }
 
 
 class RecipeReadSerializer(serializers.ModelSerializer):
@@ -53,6 +85,7 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         source='ingrs_recipes'
     )
     image = Base64ImageField(max_length=None)
+    image_variants = ImageVariantsField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -61,11 +94,13 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         fields = (
             'id', 'tags', 'author',
             'ingredients', 'name', 'is_favorited', 'is_in_shopping_cart',
-            'image', 'text', 'cooking_time'
+            'image', 'image_variants', 'text', 'cooking_time'
         )
 
-    def _is_exist(self, arg0, obj):
+    def _is_exist(self, arg0, obj, annotation):
         """Возвращает информацию о существовании объекта."""
+        if hasattr(obj, annotation):
+            return getattr(obj, annotation)
         request = self.context.get('request')
         if request:
             current_user = request.user
@@ -78,26 +113,157 @@ class RecipeReadSerializer(serializers.ModelSerializer):
                 return False
         return None
 
-
     def get_is_in_shopping_cart(self, obj):
         """Возвращает присутствие рецепта в списке покупок."""
-        return self._is_exist(ShoppingCart, obj)
+        return self._is_exist(ShoppingCart, obj, 'is_in_shopping_cart')
 
     def get_is_favorited(self, obj):
         """Возвращает присутствие рецепта в избранном."""
-        return self._is_exist(Favorite, obj)
+        return self._is_exist(Favorite, obj, 'is_favorited')
 
 
-class RecipeCreateSerializer(serializers.ModelSerializer):
-    """Сериализатор для создания рецепта."""
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True
+class CookableRecipeSerializer(RecipeReadSerializer):
+    """Рецепт с числом ингредиентов, которых не хватает."""
+    missing_count = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeReadSerializer.Meta):
+        fields = RecipeReadSerializer.Meta.fields + ('missing_count',)
+
+
+class RecipeListSerializer:
+    """
+    Быстрый сериализатор страницы рецептов только для чтения.
+
+    Вместо экземпляров моделей и полей DRF страница строится из строк
+    .values() и трёх запросов за тэгами, ингредиентами и авторами.
+    Словари тэгов и авторов создаются один раз на страницу, адреса
+    изображений считаются один раз на файл. Поля и их порядок берутся
+    из RecipeReadSerializer, ответ совпадает с ним байт в байт.
+    """
+    FIELDS = (
+        'id', 'author_id', 'name', 'image', 'image_variants_ready', 'text',
+        'cooking_time', 'is_favorited', 'is_in_shopping_cart',
     )
+    AUTHOR_FIELDS = ('email', 'id', 'username', 'first_name', 'last_name')
+    TAG_FIELDS = ('id', 'name', 'color', 'slug')
+    INGREDIENT_FIELDS = ('id', 'name', 'measurement_unit', 'amount')
+
+    def __init__(self, instance=None, many=True, context=None):
+        self.instance = instance
+        self.context = context or {}
+
+    @classmethod
+    def get_rows(cls, queryset):
+        """Строки рецептов для страницы вместо экземпляров модели."""
+        return queryset.prefetch_related(None).values(*cls.FIELDS)
+
+    def get_tags(self, recipe_ids):
+        tags, by_recipe = {}, defaultdict(list)
+        for recipe_id, *values in TagRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list(
+            'recipe_id', *(f'tag__{field}' for field in self.TAG_FIELDS)
+        ).order_by('tag_id'):
+            tag = tags.get(values[0])
+            if tag is None:
+                tag = tags[values[0]] = dict(zip(self.TAG_FIELDS, values))
+            by_recipe[recipe_id].append(tag)
+        return by_recipe
+
+    def get_ingredients(self, recipe_ids):
+        by_recipe = defaultdict(list)
+        for recipe_id, *values in IngredientRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list(
+            'recipe_id',
+            'ingredient_id',
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            'amount'
+        ).order_by('id'):
+            by_recipe[recipe_id].append(
+                dict(zip(self.INGREDIENT_FIELDS, values))
+            )
+        return by_recipe
+
+    def get_authors(self, author_ids):
+        user = getattr(self.context.get('request'), 'user', None)
+        authors = User.objects.filter(id__in=author_ids).order_by()
+        if user is not None and user.is_authenticated:
+            authors = authors.annotate(is_subscribed=Exists(
+                Follow.objects.filter(user=user, author=OuterRef('pk'))
+            ))
+        else:
+            authors = authors.annotate(is_subscribed=Value(False))
+        return {
+            author['id']: author
+            for author in authors.values(*self.AUTHOR_FIELDS, 'is_subscribed')
+        }
+
+    def get_image_urls(self):
+        """
+        Функция строки рецепта → (адрес, адреса копий) с кэшем на
+        страницу.
+        """
+        request = self.context.get('request')
+        storage = get_image_storage()
+        absolute = request.build_absolute_uri if request else str
+        urls = {}
+
+        def get(row):
+            name, ready = row['image'], row['image_variants_ready']
+            if not name:
+                return None, None
+            if (name, ready) not in urls:
+                variants = get_variant_urls_by_name(name, ready, storage)
+                urls[name, ready] = (
+                    absolute(storage.url(name)),
+                    {key: absolute(url) for key, url in variants.items()}
+                )
+            return urls[name, ready]
+        return get
+
+    def to_representation(self, rows):
+        recipe_ids = [row['id'] for row in rows]
+        tags = self.get_tags(recipe_ids)
+        ingredients = self.get_ingredients(recipe_ids)
+        authors = self.get_authors({row['author_id'] for row in rows})
+        image_urls = self.get_image_urls()
+        getters = {
+            'id': itemgetter('id'),
+            'tags': lambda row: tags.get(row['id'], []),
+            'author': lambda row: authors.get(row['author_id']),
+            'ingredients': lambda row: ingredients.get(row['id'], []),
+            'name': itemgetter('name'),
+            'is_favorited': itemgetter('is_favorited'),
+            'is_in_shopping_cart': itemgetter('is_in_shopping_cart'),
+            'image': lambda row: image_urls(row)[0],
+            'image_variants': lambda row: image_urls(row)[1],
+            'text': itemgetter('text'),
+            'cooking_time': itemgetter('cooking_time'),
+        }
+        fields = [
+            (name, getters[name]) for name in RecipeReadSerializer.Meta.fields
+        ]
+        return [{name: get(row) for name, get in fields} for row in rows]
+
+    @property
+    def data(self):
+        return self.to_representation(list(self.instance))
+
+
+class RecipeCreateSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор для создания рецепта.
+
+    Тэги и ингредиенты проверяются одним запросом на каждый список,
+    при обновлении меняются только изменившиеся строки.
+    """
+    tags = serializers.ListField(child=serializers.IntegerField())
     ingredients = IngredientRecipeSerializer(
         many=True,
     )
-    image = Base64ImageField(max_length=None)
+    image = StreamingBase64ImageField(max_length=None)
     author = CustomUserSerializer(read_only=True)
 
     class Meta:
@@ -109,53 +275,135 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         )
 
     @staticmethod
-    def validate(self, data):
-        ingredients = data.get('ingredients', [])
-        ingredient_ids = []
-        for ingredient in ingredients:
-            ingredient_id = ingredient.get('id').id
-            if ingredient_id in ingredient_ids:
-                raise serializers.ValidationError("Ингредиент уже добавлен")
-            ingredient_ids.append(ingredient_id)
-        return data
+    def _check_exist(model, ids):
+        missing = set(ids) - set(
+            model.objects.filter(id__in=ids).values_list('id', flat=True)
+        )
+        if missing:
+            raise serializers.ValidationError(
+                'Недопустимые id, объектов не существует: '
+                f'{", ".join(map(str, sorted(missing)))}'
+            )
+
+    def validate_tags(self, value):
+        """Возвращает множество id существующих тэгов."""
+        tag_ids = set(value)
+        self._check_exist(Tag, tag_ids)
+        return tag_ids
 
+    def validate_ingredients(self, value):
+        """Возвращает {id ингредиента: количество}."""
+        amounts = {item['ingredient_id']: item['amount'] for item in value}
+        if len(amounts) != len(value):
+            raise serializers.ValidationError('Ингредиент уже добавлен')
+        self._check_exist(Ingredient, amounts)
+        return amounts
+
+    @staticmethod
+    def set_tags(recipe, tag_ids, existing=()):
+        """Добавляет рецепту недостающие тэги и удаляет лишние."""
+        existing = set(existing)
+        TagRecipe.objects.bulk_create(
+            TagRecipe(recipe=recipe, tag_id=tag_id)
+            for tag_id in tag_ids - existing
+        )
+        removed = existing - tag_ids
+        if removed:
+            TagRecipe.objects.filter(
+                recipe=recipe, tag_id__in=removed
+            ).delete()
+
+    @staticmethod
+    def set_ingredients(recipe, amounts, existing=None):
+        """
+        Приводит ингредиенты рецепта к amounts: вставляет новые,
+        обновляет изменившиеся и удаляет лишние строки.
+
+        existing — {id ингредиента: (id строки, количество)}.
+        """
+        existing = existing or {}
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in existing
+        )
+        IngredientRecipe.objects.bulk_update(
+            [
+                IngredientRecipe(id=pk, amount=amounts[ingredient_id])
+                for ingredient_id, (pk, amount) in existing.items()
+                if amounts.get(ingredient_id, amount) != amount
+            ],
+            ('amount',)
+        )
+        removed = [
+            pk for ingredient_id, (pk, _) in existing.items()
+            if ingredient_id not in amounts
+        ]
+        if removed:
+            IngredientRecipe.objects.filter(id__in=removed).delete()
+
+    @transaction.atomic
     def create(self, validated_data):
-        ingredients = validated_data.pop('ingredients')
+        tag_ids = validated_data.pop('tags')
+        amounts = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(**validated_data)
-        ingredient_list = []
-        for ingredient in ingredients:
-            ingredient_list.append(
-                IngredientRecipe(
-                    ingredient=get_object_or_404(
-                        Ingredient, pk=ingredient.get('id').id
-                    ),
-                    recipe=recipe,
-                    amount=ingredient.get('amount'),
-                )
-            )
-        IngredientRecipe.objects.bulk_create(ingredient_list)
+        self.set_tags(recipe, tag_ids)
+        self.set_ingredients(recipe, amounts)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        """Обновляет рецепт."""
-        instance.tags.clear()
-        IngredientRecipe.objects.filter(recipe=instance).delete()
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
-        instance.tags.set(tags)
-        self.set_recipe_ingredient(ingredients, instance)
+        """Обновляет рецепт и списки покупок, в которых он лежит."""
+        tag_ids = validated_data.pop('tags', None)
+        amounts = validated_data.pop('ingredients', None)
+        if tag_ids is not None:
+            self.set_tags(
+                instance,
+                tag_ids,
+                TagRecipe.objects.filter(recipe=instance).values_list(
+                    'tag_id', flat=True
+                ).order_by()
+            )
+        if amounts is not None:
+            rows = IngredientRecipe.objects.filter(
+                recipe=instance
+            ).values_list('id', 'ingredient_id', 'amount').order_by()
+            existing = {
+                ingredient_id: (pk, amount)
+                for pk, ingredient_id, amount in rows
+            }
+            with updated_explicitly(instance.pk):
+                self.set_ingredients(instance, amounts, existing)
+                update_shopping_lists(
+                    instance,
+                    {
+                        ingredient_id: amount
+                        for ingredient_id, (_, amount) in existing.items()
+                    },
+                    amounts
+                )
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
-        """Метод для отображения данных в соответствии с ТЗ."""
-        return RecipeReadSerializer(instance).data
+        """
+        Метод для отображения данных в соответствии с ТЗ: рецепт
+        перечитывается через queryset вьюсета с предзагрузкой.
+        """
+        view = self.context.get('view')
+        if view is not None:
+            instance = view.get_queryset().get(pk=instance.pk)
+        return RecipeReadSerializer(instance, context=self.context).data
 
 
 class ShortRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для отображения короткого рецепта."""
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
         read_only_fields = ('id', 'name', 'image', 'cooking_time')
 
 
@@ -226,21 +474,34 @@ class SubscriptionsSerializer(CustomUserSerializer):
             'username',
             'first_name',
             'last_name',
+            'is_subscribed',
             'recipes',
             'recipes_count'
         )
 
+    @staticmethod
+    def get_recipes_limit(request):
+        """Возвращает recipes_limit из запроса или None."""
+        try:
+            limit = int(request.query_params['recipes_limit'])
+        except (AttributeError, KeyError, ValueError):
+            return None
+        return limit if limit >= 0 else None
+
+    def get_is_subscribed(self, obj):
+        return True
+
     def get_recipes(self, obj):
-        queryset = obj.author.recipes.all()
-        request = self.context.get('request')
-        if request:
-            limit = request.query_params.get('recipes_limit')
-            if limit:
-                queryset = queryset[: int(limit)]
+        queryset = getattr(obj.author, 'recipes_preview', None)
+        if queryset is None:
+            queryset = obj.author.recipes.all()
+            limit = self.get_recipes_limit(self.context.get('request'))
+            if limit is not None:
+                queryset = queryset[:limit]
         return ShortRecipeSerializer(queryset, many=True).data
 
     def get_recipes_count(self, obj):
-        return obj.author.recipes.count()
+        return obj.author.recipes_count
 
 
 class SubscribeSerializer(CustomUserSerializer):
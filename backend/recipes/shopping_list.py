@@ -0,0 +1,376 @@
+import csv
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Greatest
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from recipes.models import IngredientRecipe, ShoppingCart, ShoppingListItem
+
+FONT_NAME = 'FreeSans'
+TITLE = 'Список покупок'
+
+_explicit = threading.local()
+
+
+def register_fonts():
+    """Регистрирует шрифт списка покупок, вызывается один раз при старте."""
+    if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(FONT_NAME, settings.SHOPPING_LIST_FONT)
+        )
+
+
+def format_line(ingredient):
+    """Строка списка покупок для одного ингредиента."""
+    return (
+        f"{ingredient['ingredient__name']} "
+        f"({ingredient['ingredient__measurement_unit']}) - "
+        f"{ingredient['amount']}"
+    )
+
+
+def _as_dict(ingredient):
+    return {
+        'name': ingredient['ingredient__name'],
+        'measurement_unit': ingredient['ingredient__measurement_unit'],
+        'amount': ingredient['amount'],
+    }
+
+
+class _Echo:
+    """Буфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def iter_text(ingredients):
+    """Построчно отдаёт список покупок в виде простого текста."""
+    yield f'{TITLE}\n\n'
+    for ingredient in ingredients:
+        yield f'{format_line(ingredient)}\n'
+
+
+def iter_csv(ingredients):
+    """Построчно отдаёт список покупок в формате CSV."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for ingredient in ingredients:
+        yield writer.writerow(_as_dict(ingredient).values())
+
+
+def iter_json(ingredients):
+    """Поэлементно отдаёт список покупок в виде JSON-массива."""
+    separator = '['
+    for ingredient in ingredients:
+        yield separator + json.dumps(_as_dict(ingredient), ensure_ascii=False)
+        separator = ','
+    yield ']' if separator == ',' else '[]'
+
+
+WRITERS = {
+    'txt': (iter_text, 'text/plain; charset=utf-8'),
+    'csv': (iter_csv, 'text/csv; charset=utf-8'),
+    'json': (iter_json, 'application/json'),
+}
+
+
+def get_cache_key(ingredients):
+    """Хэш агрегированного списка покупок и параметров вёрстки."""
+    digest = hashlib.sha256()
+    digest.update(repr((
+        settings.BIG_FONT,
+        settings.SMALL_FONT,
+        settings.SIZE_BETWEEN_ROW,
+        settings.PADDING_START_TEXT,
+        settings.PADDING_START_NUMBER,
+        settings.PADDING_BOTTOM_FIRST_ROW,
+        settings.PADDING_BOTTOM_ROWS,
+    )).encode())
+    for ingredient in ingredients:
+        digest.update(format_line(ingredient).encode())
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def _draw_header(shopping_cart, page_count):
+    shopping_cart.setFont(FONT_NAME, settings.BIG_FONT)
+    shopping_cart.drawString(
+        settings.PADDING_START_TEXT,
+        settings.PADDING_BOTTOM_FIRST_ROW,
+        TITLE
+    )
+    shopping_cart.setFont(FONT_NAME, settings.SMALL_FONT)
+    shopping_cart.drawString(
+        settings.PADDING_START_NUMBER,
+        settings.PADDING_BOTTOM_FIRST_ROW,
+        str(page_count)
+    )
+
+
+def draw_shopping_list(ingredients, file):
+    """Рисует список покупок в PDF и записывает его в file."""
+    register_fonts()
+    shopping_cart = canvas.Canvas(file)
+    page_count = 1
+    step = settings.PADDING_BOTTOM_ROWS
+    _draw_header(shopping_cart, page_count)
+    for ingredient in ingredients:
+        shopping_cart.drawString(
+            settings.PADDING_START_TEXT,
+            step,
+            format_line(ingredient)
+        )
+        if step <= settings.SIZE_BETWEEN_ROW:
+            page_count += 1
+            step = settings.PADDING_BOTTOM_ROWS
+            shopping_cart.showPage()
+            _draw_header(shopping_cart, page_count)
+        else:
+            step -= settings.SIZE_BETWEEN_ROW
+    shopping_cart.showPage()
+    shopping_cart.save()
+
+
+def _prune_cache(cache_dir):
+    """Удаляет из кэша файлы, к которым не обращались дольше TTL."""
+    expired = time.time() - settings.SHOPPING_LIST_CACHE_TTL
+    with os.scandir(cache_dir) as entries:
+        for entry in entries:
+            try:
+                if entry.stat().st_mtime < expired:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+def get_shopping_list_pdf(ingredients):
+    """
+    Возвращает путь к PDF со списком покупок.
+
+    Готовый файл кэшируется на диске под хэшем агрегированного списка,
+    поэтому повторное скачивание неизменной корзины не рендерит PDF заново.
+    """
+    ingredients = list(ingredients)
+    cache_dir = settings.SHOPPING_LIST_CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f'{get_cache_key(ingredients)}.pdf')
+    try:
+        os.utime(path)
+        return path
+    except FileNotFoundError:
+        pass
+    _prune_cache(cache_dir)
+    with tempfile.NamedTemporaryFile(
+        dir=cache_dir, suffix='.tmp', delete=False
+    ) as file:
+        try:
+            draw_shopping_list(ingredients, file)
+        except Exception:
+            os.remove(file.name)
+            raise
+    os.replace(file.name, path)
+    return path
+
+
+def get_recipe_amounts(recipe):
+    """Количества ингредиентов рецепта: {id ингредиента: количество}."""
+    return dict(
+        IngredientRecipe.objects.filter(recipe=recipe).values_list(
+            'ingredient_id', 'amount'
+        )
+    )
+
+
+UPSERT_BATCH_SIZE = 300
+
+
+def _add_to_items(rows):
+    """
+    Прибавляет количества rows [(пользователь, ингредиент, количество)]
+    к строкам списков покупок одним INSERT ... ON CONFLICT DO UPDATE:
+    строку, которую параллельно вставил другой запрос, это не роняет.
+    """
+    table = ShoppingListItem._meta.db_table
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
+            cursor.execute(
+                f'INSERT INTO {table} (user_id, ingredient_id, total) '
+                f'VALUES {", ".join(["(%s, %s, %s)"] * len(batch))} '
+                f'ON CONFLICT (user_id, ingredient_id) '
+                f'DO UPDATE SET total = {table}.total + excluded.total',
+                [value for row in batch for value in row]
+            )
+
+
+def apply_shopping_list_delta(user_ids, delta):
+    """
+    Прибавляет delta ({id ингредиента: изменение}) к спискам покупок
+    пользователей user_ids.
+    """
+    delta = {ingredient: change for ingredient, change in delta.items()
+             if change}
+    if not delta:
+        return
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    removed = {
+        ingredient: change for ingredient, change in delta.items()
+        if change < 0
+    }
+    with transaction.atomic():
+        _add_to_items([
+            (user, ingredient, change)
+            for user in user_ids
+            for ingredient, change in delta.items()
+            if change > 0
+        ])
+        if not removed:
+            return
+        items = ShoppingListItem.objects.filter(
+            user_id__in=user_ids, ingredient_id__in=removed
+        )
+        items.update(total=Greatest(
+            F('total') + Case(
+                *(When(ingredient_id=ingredient, then=Value(change))
+                  for ingredient, change in removed.items()),
+                default=Value(0),
+                output_field=IntegerField()
+            ),
+            Value(0)
+        ))
+        items.filter(total=0).delete()
+
+
+def _explicit_recipes():
+    if not hasattr(_explicit, 'recipes'):
+        _explicit.recipes = set()
+    return _explicit.recipes
+
+
+@contextmanager
+def updated_explicitly(recipe_id):
+    """
+    Внутри блока сигналы корзин и ингредиентов рецепта recipe_id не
+    меняют списки покупок: вызывающий код переносит изменения сам,
+    одной дельтой на все корзины.
+    """
+    recipes = _explicit_recipes()
+    added = recipe_id not in recipes
+    recipes.add(recipe_id)
+    try:
+        yield
+    finally:
+        if added:
+            recipes.discard(recipe_id)
+
+
+def is_updated_explicitly(recipe_id):
+    return recipe_id in _explicit_recipes()
+
+
+def add_to_shopping_list(user_id, recipe):
+    """Добавляет ингредиенты рецепта в список покупок пользователя."""
+    apply_shopping_list_delta((user_id,), get_recipe_amounts(recipe))
+
+
+def remove_from_shopping_list(user_id, recipe):
+    """Вычитает ингредиенты рецепта из списка покупок пользователя."""
+    apply_shopping_list_delta(
+        (user_id,),
+        {ingredient: -amount
+         for ingredient, amount in get_recipe_amounts(recipe).items()}
+    )
+
+
+def update_shopping_lists(recipe, old_amounts, new_amounts=None):
+    """
+    Переносит изменение ингредиентов рецепта в списки покупок всех
+    пользователей, у которых он лежит в корзине. Если new_amounts
+    не переданы, они читаются из базы.
+    """
+    if new_amounts is None:
+        new_amounts = get_recipe_amounts(recipe)
+    delta = {
+        ingredient: new_amounts.get(ingredient, 0) - old_amounts.get(
+            ingredient, 0
+        )
+        for ingredient in old_amounts.keys() | new_amounts.keys()
+    }
+    apply_recipe_delta(recipe, delta)
+
+
+def apply_recipe_delta(recipe, delta):
+    """
+    Прибавляет delta ({id ингредиента: изменение}) к спискам покупок
+    всех пользователей, у которых рецепт лежит в корзине.
+    """
+    apply_shopping_list_delta(
+        ShoppingCart.objects.filter(recipe=recipe).values_list(
+            'user_id', flat=True
+        ),
+        delta
+    )
+
+
+def get_expected_shopping_lists():
+    """Списки покупок, посчитанные заново по корзинам и рецептам."""
+    return IngredientRecipe.objects.filter(
+        recipe__shopping_cart__isnull=False
+    ).values_list(
+        'recipe__shopping_cart__user', 'ingredient'
+    ).annotate(total=Sum('amount')).order_by()
+
+
+def rebuild_shopping_lists(batch_size=1000):
+    """Пересобирает все списки покупок с нуля."""
+    with transaction.atomic():
+        ShoppingListItem.objects.all().delete()
+        ShoppingListItem.objects.bulk_create(
+            (
+                ShoppingListItem(user_id=user, ingredient_id=ingredient,
+                                 total=total)
+                for user, ingredient, total in
+                get_expected_shopping_lists().iterator()
+            ),
+            batch_size=batch_size
+        )
+
+
+def verify_shopping_lists():
+    """
+    Сравнивает сохранённые списки покупок с посчитанными заново.
+
+    Возвращает словарь расхождений
+    {(id пользователя, id ингредиента): (сохранено, ожидается)}.
+    """
+    expected = {
+        (user, ingredient): total
+        for user, ingredient, total in
+        get_expected_shopping_lists().iterator()
+    }
+    stored = {
+        (user, ingredient): total
+        for user, ingredient, total in
+        ShoppingListItem.objects.values_list(
+            'user_id', 'ingredient_id', 'total'
+        ).iterator()
+    }
+    return {
+        key: (stored.get(key), expected.get(key))
+        for key in stored.keys() | expected.keys()
+        if stored.get(key) != expected.get(key)
+    }
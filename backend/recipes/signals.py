@@ -0,0 +1,213 @@
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from recipes.autocomplete import invalidate_index
+from recipes.caching import bump_catalog_version, bump_generation
+from recipes.cookable import schedule_cookable_update
+from recipes.counters import change_counter
+from recipes.images import acquire_image, release_image, schedule_variants
+from recipes.models import (
+    Favorite,
+    Follow,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    Tag,
+    TagRecipe,
+)
+from recipes.search import schedule_search_update
+from recipes.shopping_list import (
+    add_to_shopping_list,
+    apply_recipe_delta,
+    is_updated_explicitly,
+    remove_from_shopping_list,
+)
+from users.models import CustomUser as User
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(**kwargs):
+    """Сбрасывает индекс автодополнения и кэш при изменении ингредиентов."""
+    invalidate_index()
+    bump_catalog_version('ingredients')
+    bump_generation('ingredients', 'recipes')
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_renamed(instance, created, **kwargs):
+    """Обновляет поисковый индекс рецептов с этим ингредиентом."""
+    if not created:
+        schedule_search_update(IngredientRecipe.objects.filter(
+            ingredient=instance
+        ).values_list('recipe', flat=True))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(**kwargs):
+    """Сбрасывает кэш тэгов и рецептов."""
+    bump_catalog_version('tags')
+    bump_generation('tags', 'recipes')
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=TagRecipe)
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+@receiver(m2m_changed, sender=TagRecipe)
+@receiver(m2m_changed, sender=IngredientRecipe)
+def recipe_changed(**kwargs):
+    """Сбрасывает кэш рецептов."""
+    bump_generation('recipes')
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_stored(instance, **kwargs):
+    """Запоминает сохранённые в базе изображение и автора рецепта."""
+    stored = Recipe.objects.filter(pk=instance.pk).values_list(
+        'image', 'author_id'
+    ).first() if instance.pk else None
+    instance._stored_image, instance._stored_author = stored or (None, None)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(instance, **kwargs):
+    """
+    Учитывает ссылки на старое и новое изображение рецепта и строит
+    уменьшенные копии. До их построения у рецепта с новым
+    изображением отдаются адреса исходного файла.
+    """
+    stored_image = getattr(instance, '_stored_image', None)
+    if stored_image != instance.image.name:
+        acquire_image(instance.image.name)
+        release_image(stored_image)
+        if instance.image_variants_ready:
+            instance.image_variants_ready = False
+            Recipe.objects.filter(pk=instance.pk).update(
+                image_variants_ready=False
+            )
+    if not instance.image_variants_ready:
+        schedule_variants(instance.image)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    """Снимает ссылку удалённого рецепта на изображение."""
+    release_image(instance.image.name)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_text_changed(instance, **kwargs):
+    """
+    Обновляет поисковый индекс рецепта и индекс «что приготовить»:
+    ингредиенты через API сохраняются bulk_create, без сигналов.
+    """
+    schedule_search_update((instance.pk,))
+    schedule_cookable_update((instance.pk,))
+
+
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+def recipe_ingredients_changed(instance, **kwargs):
+    """
+    Обновляет поисковый индекс и индекс «что приготовить» при смене
+    ингредиентов рецепта.
+    """
+    schedule_search_update((instance.recipe_id,))
+    schedule_cookable_update((instance.recipe_id,))
+
+
+@receiver((post_save, post_delete), sender=User)
+def author_changed(update_fields=None, **kwargs):
+    """Сбрасывает кэш рецептов, в которых показываются данные автора."""
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    bump_generation('recipes')
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_author_counted(instance, created, **kwargs):
+    """Обновляет счётчики рецептов у нового и прежнего автора."""
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+        return
+    stored_author = getattr(instance, '_stored_author', None)
+    if stored_author != instance.author_id:
+        change_counter(User, stored_author, 'recipes_count', -1)
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_author_uncounted(instance, **kwargs):
+    """Уменьшает счётчик рецептов автора удалённого рецепта."""
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+def favorite_counted(signal, instance, created=False, **kwargs):
+    """Обновляет счётчик добавлений рецепта в избранное."""
+    if created or signal is post_delete:
+        change_counter(
+            Recipe, instance.recipe_id, 'favorites_count',
+            1 if created else -1
+        )
+
+
+@receiver((post_save, post_delete), sender=Follow)
+def follow_counted(signal, instance, created=False, **kwargs):
+    """Обновляет счётчик подписчиков автора."""
+    if created or signal is post_delete:
+        change_counter(
+            User, instance.author_id, 'followers_count',
+            1 if created else -1
+        )
+
+
+@receiver(pre_save, sender=IngredientRecipe)
+def remember_stored_amount(instance, **kwargs):
+    """Запоминает ингредиент и количество строки до сохранения."""
+    if instance.pk is None or is_updated_explicitly(instance.recipe_id):
+        return
+    instance._stored_amount = IngredientRecipe.objects.filter(
+        pk=instance.pk
+    ).values_list('ingredient_id', 'amount').first()
+
+
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+def ingredient_amount_changed(signal, instance, **kwargs):
+    """
+    Переносит изменение строки ингредиентов в списки покупок
+    пользователей, у которых рецепт в корзине: так списки не
+    расходятся и при правке рецепта через админку.
+    """
+    if is_updated_explicitly(instance.recipe_id):
+        return
+    delta = {}
+    if signal is post_save:
+        delta[instance.ingredient_id] = instance.amount
+    stored = (
+        (instance.ingredient_id, instance.amount)
+        if signal is post_delete
+        else getattr(instance, '_stored_amount', None)
+    )
+    if stored is not None:
+        ingredient_id, amount = stored
+        delta[ingredient_id] = delta.get(ingredient_id, 0) - amount
+    apply_recipe_delta(instance.recipe_id, delta)
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def shopping_cart_changed(signal, instance, created=False, **kwargs):
+    """
+    Добавляет рецепт в список покупок или вычитает из него. Удаление
+    корзины каскадом от рецепта или пользователя тоже учитывается.
+    """
+    if is_updated_explicitly(instance.recipe_id):
+        return
+    if created:
+        add_to_shopping_list(instance.user_id, instance.recipe_id)
+    elif signal is post_delete:
+        remove_from_shopping_list(instance.user_id, instance.recipe_id)
@@ -0,0 +1,50 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище, в котором имя файла — хэш его содержимого.
+
+    Файл recipes/images/photo.jpg сохраняется как
+    recipes/images/ab/abcdef….jpg. Одинаковые файлы хранятся один раз:
+    если файл с таким содержимым уже есть, повторно он не пишется.
+    Файл по имени никогда не меняется, поэтому его можно кэшировать
+    навсегда. Ссылки на файлы считает модель ImageBlob, неиспользуемые
+    файлы удаляет команда collectimages.
+
+    Перед повторным использованием файла хранилище продлевает его
+    жизнь (recipes.images.touch_image) и проверяет, что файл не удалила
+    параллельная сборка; удалённый файл записывается заново.
+    """
+
+    def get_hashed_name(self, name, content):
+        sha256 = hashlib.sha256()
+        for chunk in content.chunks():
+            sha256.update(chunk)
+        digest = sha256.hexdigest()
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(directory, digest[:2], f'{digest}{extension}')
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.get_hashed_name(name, content)
+        if self.exists(name):
+            from recipes.images import touch_image
+            touch_image(name)
+            if self.exists(name):
+                return name
+        return self._save(name, content)
+
+    def save_named(self, name, content, max_length=None):
+        """Сохраняет файл под переданным именем, без хэширования."""
+        return super().save(name, content, max_length)
@@ -0,0 +1,1560 @@
+import base64
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import ValidationError
+from rest_framework.test import APITestCase
+
+from foodgram.compression import brotli
+from foodgram.nplusone import detect_n_plus_one
+from recipes.autocomplete import invalidate_index
+from recipes.cookable import search_cookable
+from recipes.images import (
+    StreamingBase64ImageField,
+    collect_images,
+    get_image_storage,
+)
+from recipes.models import (
+    Favorite,
+    Follow,
+    ImageBlob,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+)
+from recipes.renderers import msgpack
+from recipes.search import rebuild_search_index, uses_fts5
+from recipes.shopping_list import verify_shopping_lists
+from users.models import CustomUser as User
+
+
+class RecipeTestCase(APITestCase):
+    """Общие данные: авторы, тэги, ингредиенты и рецепты."""
+    RECIPE_COUNT = 25
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = [
+            User.objects.create(
+                username=f'author{number}',
+                email=f'author{number}@foodgram.ru',
+                first_name='Имя',
+                last_name='Фамилия'
+            )
+            for number in range(3)
+        ]
+        cls.user = User.objects.create(
+            username='reader',
+            email='reader@foodgram.ru',
+            first_name='Имя',
+            last_name='Фамилия'
+        )
+        cls.tags = [
+            Tag.objects.create(
+                name=f'тэг {number}', slug=f'tag-{number}', color='#FF0000'
+            )
+            for number in range(3)
+        ]
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {number:02d}', measurement_unit='г')
+            for number in range(60)
+        )
+        cls.ingredients = list(Ingredient.objects.order_by('id'))
+        cls.recipes = []
+        for number in range(cls.RECIPE_COUNT):
+            recipe = Recipe.objects.create(
+                author=cls.authors[number % len(cls.authors)],
+                name=f'рецепт {number:02d}',
+                text='Описание',
+                cooking_time=10,
+                image='recipes/images/recipe.png'
+            )
+            recipe.tags.set(cls.tags[:2])
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=index + 1
+                )
+                for index, ingredient in enumerate(cls.ingredients[:3])
+            )
+            cls.recipes.append(recipe)
+        Favorite.objects.create(user=cls.user, recipe=cls.recipes[0])
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.recipes[1])
+        Follow.objects.create(user=cls.user, author=cls.authors[1])
+
+    def setUp(self):
+        cache.clear()
+
+
+class RecipeListQueriesTest(RecipeTestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+    LIST_QUERIES = 5
+
+    def test_list_queries(self):
+        for fast in (True, False):
+            for user in (None, self.user):
+                for limit in (2, 20):
+                    with self.subTest(fast=fast, user=user, limit=limit):
+                        cache.clear()
+                        self.client.force_authenticate(user)
+                        with override_settings(
+                            RECIPE_FAST_SERIALIZATION=fast
+                        ), self.assertNumQueries(
+                            self.LIST_QUERIES
+                        ), detect_n_plus_one():
+                            response = self.client.get(
+                                f'/api/recipes/?limit={limit}'
+                            )
+                        self.assertEqual(response.status_code, 200)
+                        self.assertEqual(
+                            len(response.data['results']), limit
+                        )
+
+
+class RecipeListSerializerTest(RecipeTestCase):
+    """
+    Быстрый сериализатор списка рецептов отдаёт те же байты, что и
+    RecipeReadSerializer.
+    """
+
+    def test_same_bytes(self):
+        Recipe.objects.filter(pk=self.recipes[2].pk).update(
+            image_variants_ready=True
+        )
+        Recipe.objects.create(
+            author=None,
+            name='рецепт без автора',
+            text='Описание',
+            cooking_time=5,
+            image='recipes/images/other.png'
+        )
+        for user in (None, self.user):
+            for query in ('', '?limit=100', '?tags=tag-0&limit=3'):
+                with self.subTest(user=user, query=query):
+                    self.client.force_authenticate(user)
+                    contents = []
+                    for fast in (True, False):
+                        cache.clear()
+                        with override_settings(
+                            RECIPE_FAST_SERIALIZATION=fast
+                        ):
+                            response = self.client.get(
+                                f'/api/recipes/{query}'
+                            )
+                        self.assertEqual(response.status_code, 200)
+                        contents.append(response.content)
+                    self.assertEqual(contents[0], contents[1])
+        results = {
+            recipe['id']: recipe for recipe in self.client.get(
+                '/api/recipes/?limit=100'
+            ).data['results']
+        }
+        self.assertTrue(results[self.recipes[0].pk]['is_favorited'])
+        self.assertTrue(results[self.recipes[1].pk]['is_in_shopping_cart'])
+        self.assertTrue(
+            results[self.recipes[1].pk]['author']['is_subscribed']
+        )
+
+
+class CachedListTest(RecipeTestCase):
+    """Кэш списков сбрасывается сменой поколения группы."""
+
+    def get_names(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        data = response.data
+        if isinstance(data, dict):
+            data = data['results']
+        return [item['name'] for item in data]
+
+    def test_anonymous_list_is_cached(self):
+        names = self.get_names('/api/recipes/')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_names('/api/recipes/'), names)
+        recipe = self.recipes[0]
+        # Копии изображения уже построены, сохранение их не перестраивает.
+        Recipe.objects.filter(pk=recipe.pk).update(image_variants_ready=True)
+        recipe.refresh_from_db()
+        recipe.name = 'рецепт 00 изменён'
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.save()
+        self.assertEqual(
+            self.get_names('/api/recipes/')[0], 'рецепт 00 изменён'
+        )
+
+    def test_authenticated_list_is_not_cached(self):
+        self.client.force_authenticate(self.user)
+        self.get_names('/api/recipes/')
+        with self.assertNumQueries(5):
+            self.get_names('/api/recipes/')
+
+    def test_query_order_does_not_matter(self):
+        self.get_names('/api/recipes/?limit=2&page=2')
+        with self.assertNumQueries(0):
+            self.get_names('/api/recipes/?page=2&limit=2')
+
+    def test_related_changes(self):
+        self.get_names('/api/recipes/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tags[0].name = 'новый тэг'
+            self.tags[0].save()
+        tags = self.client.get('/api/recipes/').data['results'][0]['tags']
+        self.assertEqual(tags[0]['name'], 'новый тэг')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.authors[0].first_name = 'Новое имя'
+            self.authors[0].save()
+        author = self.client.get('/api/recipes/').data['results'][0]['author']
+        self.assertEqual(author['first_name'], 'Новое имя')
+
+    def test_tags_list(self):
+        self.assertEqual(len(self.get_names('/api/tags/')), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='тэг 3', slug='tag-3', color='#00FF00')
+        self.assertEqual(len(self.get_names('/api/tags/')), 4)
+
+
+class ConditionalGetTest(RecipeTestCase):
+    """Ответы 304 на условные запросы справочников и рецепта."""
+
+    def test_catalog_etag(self):
+        response = self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='тэг 3', slug='tag-3', color='#00FF00')
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.data), 4)
+
+    def test_catalog_last_modified(self):
+        last_modified = self.client.get('/api/tags/')['Last-Modified']
+        response = self.client.get(
+            '/api/tags/', HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_recipe_anonymous(self):
+        url = f'/api/recipes/{self.recipes[0].pk}/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        for header, value in (
+            ('HTTP_IF_NONE_MATCH', response['ETag']),
+            ('HTTP_IF_MODIFIED_SINCE', response['Last-Modified']),
+        ):
+            with self.subTest(header=header):
+                self.assertEqual(
+                    self.client.get(url, **{header: value}).status_code, 304
+                )
+        Recipe.objects.filter(pk=self.recipes[0].pk).update(
+            updated_at=timezone.now() + timedelta(seconds=5)
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_recipe_user_flags(self):
+        self.client.force_authenticate(self.user)
+        url = f'/api/recipes/{self.recipes[2].pk}/'
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        Favorite.objects.create(user=self.user, recipe=self.recipes[2])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['is_favorited'])
+
+    def test_missing_recipe(self):
+        self.assertEqual(self.client.get('/api/recipes/0/').status_code, 404)
+
+
+class SearchTest(APITestCase):
+    """Полнотекстовый поиск рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        beet = Ingredient.objects.create(name='свёкла', measurement_unit='г')
+        cabbage = Ingredient.objects.create(
+            name='капуста', measurement_unit='г'
+        )
+        cls.recipes = {}
+        for name, ingredient, text in (
+            ('Салат', cabbage, 'Сверху тёртая свёкла.'),
+            ('Винегрет', beet, 'Нарезать кубиками.'),
+            ('Свёкла печёная', cabbage, 'Запечь в духовке.'),
+            ('Щи', cabbage, 'Варить час.'),
+        ):
+            recipe = Recipe.objects.create(
+                name=name,
+                text=text,
+                cooking_time=10,
+                image='recipes/images/recipe.png'
+            )
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=1
+            )
+            cls.recipes[name] = recipe
+        rebuild_search_index()
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query):
+        response = self.client.get('/api/recipes/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['name'] for recipe in response.data['results']]
+
+    def test_ranking(self):
+        self.assertEqual(
+            self.search('свекла'), ['Свёкла печёная', 'Винегрет', 'Салат']
+        )
+
+    def test_all_words_required(self):
+        self.assertEqual(self.search('свёкла печёная'), ['Свёкла печёная'])
+        self.assertEqual(self.search('свекла щи'), [])
+
+    def test_blank_query(self):
+        self.assertEqual(len(self.search(' ')), 4)
+        self.assertEqual(len(self.search('!?')), 4)
+
+    def test_index_follows_changes(self):
+        recipe = self.recipes['Щи']
+        with self.captureOnCommitCallbacks(execute=True):
+            IngredientRecipe.objects.create(
+                recipe=recipe,
+                ingredient=Ingredient.objects.get(name='свёкла'),
+                amount=1
+            )
+        self.assertIn('Щи', self.search('свекла'))
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        self.assertNotIn('Щи', self.search('свекла'))
+
+
+class CookableTest(APITestCase):
+    """Рецепты, которые можно приготовить из имеющихся ингредиентов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('мука', 'яйца', 'молоко', 'сахар')
+        ]
+        cls.recipes = {}
+        for name, ingredients in (
+            ('Лапша', cls.ingredients[:2]),
+            ('Блины', cls.ingredients[:3]),
+            ('Сладкое молоко', cls.ingredients[2:]),
+        ):
+            recipe = Recipe.objects.create(
+                name=name,
+                text='Описание',
+                cooking_time=10,
+                image='recipes/images/recipe.png'
+            )
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=1
+                )
+                for ingredient in ingredients
+            )
+            cls.recipes[name] = recipe
+
+    def setUp(self):
+        # Индекс строится заново по данным этого теста.
+        with override_settings(COOKABLE_INDEX_TTL=0):
+            search_cookable(())
+
+    def cookable(self, ingredients, **params):
+        response = self.client.get('/api/recipes/cookable/', {
+            'ingredients': ','.join(
+                str(ingredient.id) for ingredient in ingredients
+            ),
+            **params,
+        })
+        self.assertEqual(response.status_code, 200)
+        return [
+            (recipe['name'], recipe['missing_count'])
+            for recipe in response.data['results']
+        ]
+
+    def test_ranking(self):
+        self.assertEqual(
+            self.cookable(self.ingredients[:2]),
+            [('Лапша', 0), ('Блины', 1)]
+        )
+        self.assertEqual(
+            self.cookable(self.ingredients[:2], max_missing=0),
+            [('Лапша', 0)]
+        )
+
+    def test_index_follows_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            IngredientRecipe.objects.create(
+                recipe=self.recipes['Сладкое молоко'],
+                ingredient=self.ingredients[0],
+                amount=1
+            )
+        self.assertEqual(
+            self.cookable(self.ingredients[:1]),
+            [('Лапша', 1), ('Блины', 2), ('Сладкое молоко', 2)]
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipes['Лапша'].delete()
+        self.assertEqual(
+            self.cookable(self.ingredients[:1]),
+            [('Блины', 2), ('Сладкое молоко', 2)]
+        )
+
+    def test_invalid_params(self):
+        for params in (
+            {},
+            {'ingredients': ''},
+            {'ingredients': 'мука'},
+            {'ingredients': '1', 'max_missing': 'много'},
+        ):
+            with self.subTest(params=params):
+                response = self.client.get('/api/recipes/cookable/', params)
+                self.assertEqual(response.status_code, 400)
+
+
+class TagsFilterTest(RecipeTestCase):
+    """Фильтр рецептов по слагам тэгов."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        self.recipes[0].tags.add(self.tags[2])
+        self.recipes[1].tags.set(self.tags[2:])
+
+    def filter(self, query):
+        response = self.client.get(f'/api/recipes/?limit=100&{query}')
+        self.assertEqual(response.status_code, 200)
+        ids = [recipe['id'] for recipe in response.data['results']]
+        self.assertEqual(response.data['count'], len(ids))
+        self.assertEqual(len(set(ids)), len(ids))
+        return set(ids)
+
+    def test_any(self):
+        self.assertEqual(
+            self.filter('tags=tag-2'),
+            {self.recipes[0].pk, self.recipes[1].pk}
+        )
+        self.assertEqual(
+            self.filter('tags=tag-0&tags=tag-2'),
+            {recipe.pk for recipe in self.recipes}
+        )
+
+    def test_all(self):
+        self.assertEqual(
+            self.filter('tags=tag-0&tags=tag-2&tags_mode=all'),
+            {self.recipes[0].pk}
+        )
+        self.assertEqual(
+            self.filter('tags=tag-2&tags=tag-2&tags_mode=all'),
+            {self.recipes[0].pk, self.recipes[1].pk}
+        )
+
+    def test_unknown_slugs_are_skipped(self):
+        self.assertEqual(self.filter('tags=unknown'), set())
+        self.assertEqual(
+            self.filter('tags=tag-2&tags=unknown'),
+            {self.recipes[0].pk, self.recipes[1].pk}
+        )
+        self.assertEqual(
+            self.filter('tags=tag-2&tags=unknown&tags_mode=all'), set()
+        )
+
+    def test_new_tag(self):
+        self.assertEqual(self.filter('tags=tag-3'), set())
+        with self.captureOnCommitCallbacks(execute=True):
+            tag = Tag.objects.create(
+                name='тэг 3', slug='tag-3', color='#00FF00'
+            )
+        self.recipes[2].tags.add(tag)
+        self.assertEqual(self.filter('tags=tag-3'), {self.recipes[2].pk})
+
+
+@override_settings(REQUEST_METRICS=True)
+class RequestMetricsTest(RecipeTestCase):
+    """Замеры запросов в Server-Timing, логе и /api/metrics/."""
+
+    def test_server_timing(self):
+        with self.assertLogs('foodgram.metrics', 'INFO') as logs:
+            response = self.client.get('/api/recipes/?limit=2')
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^db;dur=[\d.]+;desc="5 queries", serialize;dur=[\d.]+, '
+            r'app;dur=-?[\d.]+, total;dur=[\d.]+$'
+        )
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(record['view'], 'recipes:recipes-list')
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['queries'], 5)
+
+    def test_metrics_permissions(self):
+        with self.assertLogs('foodgram.metrics', 'INFO'):
+            self.client.get('/api/recipes/?limit=2')
+            for user, status_code in (
+                (None, 401),
+                (self.user, 403),
+                (User(username='admin', is_staff=True), 200),
+            ):
+                with self.subTest(user=user):
+                    self.client.force_authenticate(user)
+                    response = self.client.get('/api/metrics/')
+                    self.assertEqual(response.status_code, status_code)
+        self.assertEqual(
+            response['Content-Type'],
+            'text/plain; version=0.0.4; charset=utf-8'
+        )
+        self.assertIn(
+            'foodgram_requests_total{view="recipes:recipes-list",'
+            'method="GET",status="200"}',
+            response.content.decode()
+        )
+
+    @override_settings(REQUEST_METRICS=False)
+    def test_disabled(self):
+        response = self.client.get('/api/recipes/?limit=2')
+        self.assertNotIn('Server-Timing', response)
+
+
+class RenderersTest(RecipeTestCase):
+    """Быстрый JSON и MessagePack по заголовку Accept."""
+    URLS = (
+        '/api/recipes/?limit=10',
+        '/api/tags/',
+        '/api/ingredients/',
+        '/api/users/',
+    )
+
+    def test_json_matches_stock_renderer(self):
+        urls = (*self.URLS, f'/api/recipes/{self.recipes[0].pk}/')
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response['Content-Type'], 'application/json')
+                self.assertEqual(
+                    response.content, JSONRenderer().render(response.data)
+                )
+
+    @skipUnless(msgpack, 'msgpack не установлен')
+    def test_msgpack_response(self):
+        for url in self.URLS:
+            with self.subTest(url=url):
+                cache.clear()
+                response = self.client.get(
+                    url, HTTP_ACCEPT='application/msgpack'
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    response['Content-Type'], 'application/msgpack'
+                )
+                self.assertEqual(
+                    msgpack.unpackb(response.content),
+                    json.loads(self.client.get(url).content)
+                )
+
+    @skipUnless(msgpack, 'msgpack не установлен')
+    def test_msgpack_request(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post(
+            '/api/tags/',
+            msgpack.packb(
+                {'name': 'тэг 3', 'slug': 'tag-3', 'color': '#00FF00'}
+            ),
+            content_type='application/msgpack'
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertTrue(Tag.objects.filter(slug='tag-3').exists())
+        response = self.client.post(
+            '/api/tags/', b'\xc1', content_type='application/msgpack'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_shopping_list_errors(self):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?format=json'
+        )
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(
+            response.content, JSONRenderer().render(response.data)
+        )
+
+
+@override_settings(RESPONSE_COMPRESSION=True)
+class CompressionTest(RecipeTestCase):
+    """Сжатие ответов и кэш сжатых справочников."""
+
+    def get(self, url, encoding='gzip', **headers):
+        return self.client.get(url, HTTP_ACCEPT_ENCODING=encoding, **headers)
+
+    def test_threshold(self):
+        response = self.get('/api/tags/')
+        self.assertLess(
+            len(response.content), settings.RESPONSE_COMPRESSION_MIN_SIZE
+        )
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', response['Vary'])
+        response = self.get('/api/recipes/?limit=20')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(
+            int(response['Content-Length']), len(response.content)
+        )
+        self.assertEqual(
+            json.loads(gzip.decompress(response.content)),
+            json.loads(self.client.get('/api/recipes/?limit=20').content)
+        )
+        with override_settings(RESPONSE_COMPRESSION_MIN_SIZE=0):
+            response = self.get('/api/tags/')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_encoding_negotiation(self):
+        url = '/api/recipes/?limit=20'
+        for header, expected in (
+            ('', None),
+            ('identity', None),
+            ('gzip;q=0, *', 'br' if brotli else None),
+            ('gzip;q=0.5, br', 'br' if brotli else 'gzip'),
+            ('br;q=0, gzip', 'gzip'),
+        ):
+            with self.subTest(header=header):
+                response = self.get(url, header)
+                self.assertEqual(response.get('Content-Encoding'), expected)
+
+    def test_streaming_is_not_compressed(self):
+        self.client.force_authenticate(self.user)
+        response = self.get('/api/recipes/download_shopping_cart/?format=txt')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        response.close()
+
+    def test_precompressed_catalog(self):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'продукт {number:03d}', measurement_unit='г')
+            for number in range(100)
+        )
+        invalidate_index()
+        first = self.get('/api/ingredients/')
+        self.assertEqual(first['Content-Encoding'], 'gzip')
+        self.assertTrue(first['ETag'].startswith('W/'))
+        with self.assertNumQueries(1):
+            second = self.get('/api/ingredients/')
+        self.assertEqual(second.content, first.content)
+        for header in ('Content-Type', 'ETag', 'Allow', 'Content-Length'):
+            self.assertEqual(second[header], first[header])
+        self.assertEqual(
+            set(second['Vary'].split(', ')), {'Accept', 'Accept-Encoding'}
+        )
+        indented = self.get(
+            '/api/ingredients/', HTTP_ACCEPT='application/json; indent=4'
+        )
+        self.assertIn(b'\n    ', gzip.decompress(indented.content))
+        if msgpack:
+            response = self.get(
+                '/api/ingredients/', HTTP_ACCEPT='application/msgpack'
+            )
+            self.assertEqual(response['Content-Type'], 'application/msgpack')
+            self.assertEqual(
+                msgpack.unpackb(gzip.decompress(response.content)),
+                json.loads(gzip.decompress(first.content))
+            )
+
+
+class KeysetPaginationTest(RecipeTestCase):
+    """Пагинация рецептов по ключу (name, id)."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        for _ in range(3):
+            Recipe.objects.create(
+                author=self.authors[0],
+                name='рецепт 05',
+                text='Описание',
+                cooking_time=10,
+                image='recipes/images/recipe.png'
+            )
+        self.expected = list(
+            Recipe.objects.order_by('name', 'id').values_list('id', flat=True)
+        )
+
+    def walk(self, url, link):
+        """Страницы по ссылкам link и адрес последней из них."""
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['count'], len(self.expected))
+            pages.append(
+                [recipe['id'] for recipe in response.data['results']]
+            )
+            last_url, url = url, response.data[link]
+        return pages, last_url
+
+    def test_forward_and_back(self):
+        pages, last_url = self.walk('/api/recipes/?cursor=&limit=4', 'next')
+        self.assertEqual(sum(pages, []), self.expected)
+        self.assertTrue(all(len(page) == 4 for page in pages[:-1]))
+        previous = self.client.get(last_url).data['previous']
+        pages_back, _ = self.walk(previous, 'previous')
+        self.assertEqual(pages_back[::-1], pages[:-1])
+
+    def test_first_page_has_no_previous(self):
+        response = self.client.get('/api/recipes/?cursor=&limit=4')
+        self.assertIsNone(response.data['previous'])
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            self.expected[:4]
+        )
+
+    def test_invalid_cursor(self):
+        for cursor in ('!', 'bm90IGpzb24=', 'eyJwIjogWzFdLCAiciI6IDB9'):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(f'/api/recipes/?cursor={cursor}')
+                self.assertEqual(response.status_code, 404)
+
+
+class ShoppingListTest(RecipeTestCase):
+    """Скачивание списка покупок."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.cache_dir = tempfile.mkdtemp()
+        cls.shopping_list_cache = override_settings(
+            SHOPPING_LIST_CACHE_DIR=cls.cache_dir
+        )
+        cls.shopping_list_cache.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.shopping_list_cache.disable()
+        shutil.rmtree(cls.cache_dir, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def download(self, file_format=None):
+        query = f'?format={file_format}' if file_format else ''
+        response = self.client.get(
+            f'/api/recipes/download_shopping_cart/{query}'
+        )
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content)
+        response.close()
+        return response, content
+
+    def test_pdf_is_cached(self):
+        response, content = self.download()
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(content.startswith(b'%PDF'))
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        path = os.path.join(self.cache_dir, os.listdir(self.cache_dir)[0])
+        os.utime(path, (0, 0))
+        self.assertEqual(self.download('pdf')[1], content)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        self.assertGreater(os.stat(path).st_mtime, 0)
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipes[2])
+        self.assertNotEqual(self.download()[1], content)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_text_formats(self):
+        for file_format, content_type, expected in (
+            (
+                'txt',
+                'text/plain; charset=utf-8',
+                'Список покупок\n\n'
+                'ингредиент 00 (г) - 1\n'
+                'ингредиент 01 (г) - 2\n'
+                'ингредиент 02 (г) - 3\n'
+            ),
+            (
+                'csv',
+                'text/csv; charset=utf-8',
+                'name,measurement_unit,amount\r\n'
+                'ингредиент 00,г,1\r\n'
+                'ингредиент 01,г,2\r\n'
+                'ингредиент 02,г,3\r\n'
+            ),
+            (
+                'json',
+                'application/json',
+                '[{"name": "ингредиент 00", "measurement_unit": "г", '
+                '"amount": 1},'
+                '{"name": "ингредиент 01", "measurement_unit": "г", '
+                '"amount": 2},'
+                '{"name": "ингредиент 02", "measurement_unit": "г", '
+                '"amount": 3}]'
+            ),
+        ):
+            with self.subTest(file_format=file_format):
+                response, content = self.download(file_format)
+                self.assertEqual(response['Content-Type'], content_type)
+                self.assertEqual(
+                    response['Content-Disposition'],
+                    f'attachment; filename="shopping_cart.{file_format}"'
+                )
+                self.assertEqual(content.decode(), expected)
+
+    def test_accept_header(self):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/', HTTP_ACCEPT='text/csv'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        response.close()
+
+    def test_empty_json(self):
+        ShoppingCart.objects.filter(user=self.user).delete()
+        self.assertEqual(self.download('json')[1], b'[]')
+
+    def test_anonymous(self):
+        self.client.force_authenticate(None)
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+
+class IngredientSearchTest(APITestCase):
+    """Автодополнение ингредиентов по индексу в памяти."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in (
+            'сок яблочный',
+            'Яблоко',
+            'зелёное яблоко',
+            'яблочный уксус',
+            'Свёкла',
+            'груша',
+        ):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def setUp(self):
+        cache.clear()
+        invalidate_index()
+
+    def search(self, query):
+        response = self.client.get('/api/ingredients/', {'name': query})
+        self.assertEqual(response.status_code, 200)
+        return [ingredient['name'] for ingredient in response.data]
+
+    def test_prefix_matches_first(self):
+        self.assertEqual(self.search('ябл'), [
+            'Яблоко', 'яблочный уксус', 'зелёное яблоко', 'сок яблочный'
+        ])
+
+    def test_normalization(self):
+        for query in ('СВЁК', 'свек', '  свек '):
+            with self.subTest(query=query):
+                self.assertEqual(self.search(query), ['Свёкла'])
+        self.assertEqual(self.search('зеленое'), ['зелёное яблоко'])
+
+    @override_settings(INGREDIENT_SEARCH_LIMIT=3)
+    def test_limit(self):
+        self.assertEqual(
+            self.search('ябл'),
+            ['Яблоко', 'яблочный уксус', 'зелёное яблоко']
+        )
+
+    def test_new_ingredient(self):
+        self.assertEqual(self.search('гру'), ['груша'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='Грунт', measurement_unit='г')
+        self.assertEqual(self.search('гру'), ['Грунт', 'груша'])
+
+
+def make_image(color='red'):
+    """Небольшое PNG-изображение в base64, как его присылает клиент."""
+    buffer = io.BytesIO()
+    Image.new('RGB', (20, 20), color).save(buffer, 'PNG')
+    return (
+        'data:image/png;base64,'
+        + base64.b64encode(buffer.getvalue()).decode()
+    )
+
+
+class MediaRootMixin:
+    """Файлы изображений пишутся во временный каталог."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media = override_settings(
+            MEDIA_ROOT=cls.media_root, RECIPE_IMAGE_WORKERS=0
+        )
+        cls.media.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        shutil.rmtree(self.media_root)
+        os.mkdir(self.media_root)
+
+
+class RecipeWriteQueriesTest(MediaRootMixin, RecipeTestCase):
+    """
+    Создание и изменение рецепта с 50 ингредиентами выполняется
+    постоянным числом запросов, а не запросом на ингредиент.
+
+    Считаются и запросы после фиксации транзакции: обновление
+    поискового индекса и индекса «что приготовить» и отметка о
+    построенных копиях изображения. При изменении рецепта то же
+    изображение загружается повторно, и хранилище продлевает жизнь
+    его файла. Число запросов указано для PostgreSQL, на SQLite поиск
+    через FTS5 добавляет два.
+    """
+    INGREDIENT_COUNT = 50
+    CREATE_QUERIES = 20
+    UPDATE_QUERIES = 25
+    FTS5_EXTRA_QUERIES = 2
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.authors[0])
+        # Индекс «что приготовить» уже построен, как в рабочем процессе.
+        search_cookable(())
+
+    def assertWriteQueries(self, queries):
+        if uses_fts5():
+            queries += self.FTS5_EXTRA_QUERIES
+        return self.assertNumQueries(queries)
+
+    def get_payload(self, ingredients):
+        return {
+            'tags': [tag.id for tag in self.tags[:2]],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient, amount in ingredients
+            ],
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 15,
+            'image': make_image(),
+        }
+
+    def create_recipe(self):
+        response = self.client.post(
+            '/api/recipes/',
+            self.get_payload(
+                (ingredient, 10)
+                for ingredient in self.ingredients[:self.INGREDIENT_COUNT]
+            ),
+            format='json'
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        return response
+
+    def test_create_queries(self):
+        with self.assertWriteQueries(self.CREATE_QUERIES), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.create_recipe()
+        self.assertEqual(
+            len(response.data['ingredients']), self.INGREDIENT_COUNT
+        )
+
+    def test_update_queries(self):
+        recipe_id = self.create_recipe().data['id']
+        ingredients = (
+            [(ingredient, 10) for ingredient in self.ingredients[:40]]
+            + [(ingredient, 20) for ingredient in self.ingredients[40:45]]
+            + [(ingredient, 5) for ingredient in self.ingredients[50:55]]
+        )
+        with self.assertWriteQueries(self.UPDATE_QUERIES), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/recipes/{recipe_id}/',
+                self.get_payload(ingredients),
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            dict(IngredientRecipe.objects.filter(
+                recipe_id=recipe_id
+            ).values_list('ingredient_id', 'amount')),
+            {ingredient.id: amount for ingredient, amount in ingredients}
+        )
+
+    def test_invalid_ingredients(self):
+        ingredient = self.ingredients[0]
+        missing_id = self.ingredients[-1].id + 1
+        cases = {
+            'duplicate': [(ingredient.id, 1), (ingredient.id, 2)],
+            'unknown id': [(ingredient.id, 1), (missing_id, 1)],
+            'zero amount': [(ingredient.id, 0)],
+        }
+        for case, ingredients in cases.items():
+            with self.subTest(case):
+                payload = self.get_payload(())
+                payload['ingredients'] = [
+                    {'id': ingredient_id, 'amount': amount}
+                    for ingredient_id, amount in ingredients
+                ]
+                response = self.client.post(
+                    '/api/recipes/', payload, format='json'
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('ingredients', response.data)
+        self.assertEqual(Recipe.objects.count(), self.RECIPE_COUNT)
+
+
+class ShoppingListItemTest(MediaRootMixin, RecipeTestCase):
+    """Суммы списка покупок обновляются дельтами при любых изменениях."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def assertTotals(self, totals):
+        self.assertEqual(
+            dict(ShoppingListItem.objects.filter(user=self.user).values_list(
+                'ingredient__name', 'total'
+            )),
+            totals
+        )
+        self.assertEqual(verify_shopping_lists(), {})
+
+    def test_cart(self):
+        url = f'/api/recipes/{self.recipes[2].pk}/shopping_cart/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertTotals({
+            'ингредиент 00': 2, 'ингредиент 01': 4, 'ингредиент 02': 6
+        })
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertTotals({
+            'ингредиент 00': 1, 'ингредиент 01': 2, 'ингредиент 02': 3
+        })
+
+    def test_recipe_update(self):
+        self.client.force_authenticate(self.authors[1])
+        response = self.client.patch(
+            f'/api/recipes/{self.recipes[1].pk}/',
+            {
+                'tags': [self.tags[0].id],
+                'ingredients': [
+                    {'id': self.ingredients[0].id, 'amount': 4},
+                    {'id': self.ingredients[3].id, 'amount': 5},
+                ],
+                'name': 'рецепт 01',
+                'text': 'Описание',
+                'cooking_time': 10,
+                'image': make_image(),
+            },
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertTotals({'ингредиент 00': 4, 'ингредиент 03': 5})
+
+    def test_ingredient_rows(self):
+        row = IngredientRecipe.objects.create(
+            recipe=self.recipes[1], ingredient=self.ingredients[3], amount=5
+        )
+        self.assertTotals({
+            'ингредиент 00': 1, 'ингредиент 01': 2, 'ингредиент 02': 3,
+            'ингредиент 03': 5,
+        })
+        row.ingredient = self.ingredients[4]
+        row.amount = 7
+        row.save()
+        self.assertTotals({
+            'ингредиент 00': 1, 'ингредиент 01': 2, 'ингредиент 02': 3,
+            'ингредиент 04': 7,
+        })
+        row.delete()
+        self.assertTotals({
+            'ингредиент 00': 1, 'ингредиент 01': 2, 'ингредиент 02': 3
+        })
+
+    def test_recipe_delete(self):
+        self.client.force_authenticate(self.authors[1])
+        response = self.client.delete(f'/api/recipes/{self.recipes[1].pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertTotals({})
+
+    def test_verify(self):
+        ShoppingListItem.objects.filter(user=self.user).update(total=100)
+        with self.assertRaises(CommandError):
+            call_command(
+                'rebuildshoppinglists', '--verify', stdout=io.StringIO()
+            )
+        call_command('rebuildshoppinglists', stdout=io.StringIO())
+        self.assertTotals({
+            'ингредиент 00': 1, 'ингредиент 01': 2, 'ингредиент 02': 3
+        })
+
+
+class CountersTest(RecipeTestCase):
+    """Счётчики обновляются сигналами и сверяются reconcilecounters."""
+
+    def reconcile(self, *args):
+        output = io.StringIO()
+        call_command('reconcilecounters', *args, stdout=output)
+        return output.getvalue()
+
+    def test_signals(self):
+        recipe, author = self.recipes[2], self.authors[2]
+        self.client.force_authenticate(self.user)
+        url = f'/api/recipes/{recipe.pk}/favorite/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+        response = self.client.post(f'/api/users/{author.pk}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+        author.refresh_from_db()
+        self.assertEqual(author.followers_count, 1)
+        recipes_count = author.recipes_count
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        recipe.delete()
+        author.refresh_from_db()
+        self.assertEqual(author.recipes_count, recipes_count - 1)
+        self.reconcile('--dry-run')
+
+    def test_save_keeps_counters(self):
+        author = User.objects.get(pk=self.authors[1].pk)
+        Follow.objects.create(user=self.authors[0], author=author)
+        author.first_name = 'Другое'
+        author.save()
+        author.refresh_from_db()
+        self.assertEqual(author.first_name, 'Другое')
+        self.assertEqual(author.followers_count, 2)
+
+    def test_save_deferred_fields(self):
+        author = User.objects.only('first_name').get(pk=self.authors[1].pk)
+        author.first_name = 'Другое'
+        with self.assertNumQueries(1):
+            author.save()
+        author.refresh_from_db()
+        self.assertEqual(author.first_name, 'Другое')
+        self.assertEqual(author.last_name, 'Фамилия')
+
+    def test_reconcile(self):
+        Recipe.objects.filter(pk=self.recipes[0].pk).update(
+            favorites_count=5
+        )
+        User.objects.filter(pk=self.authors[1].pk).update(
+            recipes_count=0, followers_count=3
+        )
+        with self.assertRaises(CommandError):
+            self.reconcile('--dry-run')
+        self.assertIn('Исправлено счётчиков: 3', self.reconcile())
+        self.assertIn('Расхождений нет', self.reconcile('--dry-run'))
+        self.assertEqual(
+            Recipe.objects.get(pk=self.recipes[0].pk).favorites_count, 1
+        )
+        author = User.objects.get(pk=self.authors[1].pk)
+        self.assertEqual(
+            author.recipes_count,
+            Recipe.objects.filter(author=author).count()
+        )
+        self.assertEqual(author.followers_count, 1)
+
+
+class ImportCsvTest(APITestCase):
+    """importcsv загружает справочники пачками и не создаёт дублей."""
+
+    def setUp(self):
+        cache.clear()
+        invalidate_index()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def import_csv(self, *args):
+        output, errors = io.StringIO(), io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command(
+                'importcsv', *args, '--batch-size', '2',
+                stdout=output, stderr=errors
+            )
+        return output.getvalue(), errors.getvalue()
+
+    def get_ingredients(self):
+        return sorted(
+            Ingredient.objects.values_list('name', 'measurement_unit')
+        )
+
+    def test_import(self):
+        ingredients = self.write(
+            'ingredients.csv',
+            'name;measurement_unit\n'
+            'Мука;г\nСахар;г\nмука;г\nМолоко;мл\nмука;кг\n'
+        )
+        tags = self.write(
+            'tags.json',
+            json.dumps([
+                {'name': 'Завтрак', 'slug': 'breakfast'},
+                {'name': 'Обед', 'slug': 'lunch'},
+                {'name': 'Ужин'},
+            ])
+        )
+        self.assertEqual(
+            self.client.get('/api/ingredients/?name=му').data, []
+        )
+        output, errors = self.import_csv(
+            '--ingredients-file', ingredients, '--tags-file', tags
+        )
+        self.assertIn('ingredients: прочитано 5, создано 4', output)
+        self.assertIn('tags: прочитано 3, создано 2', output)
+        self.assertIn('tags: пропущено строк: 1', errors)
+        expected = [
+            ('молоко', 'мл'), ('мука', 'г'), ('мука', 'кг'), ('сахар', 'г')
+        ]
+        self.assertEqual(self.get_ingredients(), expected)
+        self.assertEqual(
+            [
+                ingredient['name'] for ingredient in
+                self.client.get('/api/ingredients/?name=му').data
+            ],
+            ['мука', 'мука']
+        )
+        self.assertEqual(
+            {tag['slug'] for tag in self.client.get('/api/tags/').data},
+            {'breakfast', 'lunch'}
+        )
+        output, errors = self.import_csv(
+            'ingredients', '--ingredients-file', ingredients
+        )
+        self.assertIn('ingredients: прочитано 5, создано 0', output)
+        self.assertEqual(self.get_ingredients(), expected)
+
+    def test_unknown_base(self):
+        with self.assertRaises(CommandError):
+            call_command('importcsv', 'units', stdout=io.StringIO())
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY есть в PostgreSQL')
+    def test_copy_in_transaction(self):
+        ingredients = self.write(
+            'ingredients.csv',
+            'name;measurement_unit\n'
+            + ''.join(f'ингредиент {number};г\n' for number in range(5))
+        )
+        with transaction.atomic():
+            self.import_csv('ingredients', '--ingredients-file', ingredients)
+            self.import_csv('ingredients', '--ingredients-file', ingredients)
+        self.assertEqual(Ingredient.objects.count(), 5)
+
+
+class ExportImportRecipesTest(RecipeTestCase):
+    """Рецепты, выгруженные exportrecipes, загружаются importrecipes."""
+
+    def setUp(self):
+        super().setUp()
+        handle, self.path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+        call_command(
+            'exportrecipes', self.path,
+            stdout=io.StringIO(), stderr=io.StringIO()
+        )
+
+    def get_recipes(self):
+        return sorted(
+            (
+                recipe.author.email,
+                recipe.name,
+                recipe.text,
+                recipe.cooking_time,
+                recipe.image.name,
+                tuple(recipe.tags.order_by('slug').values_list(
+                    'slug', flat=True
+                )),
+                tuple(recipe.ingrs_recipes.order_by(
+                    'ingredient__name'
+                ).values_list(
+                    'ingredient__name', 'ingredient__measurement_unit',
+                    'amount'
+                )),
+            )
+            for recipe in Recipe.objects.select_related('author')
+        )
+
+    def clear(self):
+        Recipe.objects.all().delete()
+        User.objects.filter(
+            pk__in=[author.pk for author in self.authors]
+        ).delete()
+
+    def import_recipes(self):
+        errors = io.StringIO()
+        call_command(
+            'importrecipes', self.path, stdout=io.StringIO(), stderr=errors
+        )
+        return errors.getvalue()
+
+    def test_round_trip(self):
+        expected = self.get_recipes()
+        self.clear()
+        self.assertEqual(self.import_recipes(), '')
+        self.assertEqual(self.get_recipes(), expected)
+        author = User.objects.get(email=self.authors[0].email)
+        self.assertEqual(
+            author.recipes_count, Recipe.objects.filter(author=author).count()
+        )
+        self.import_recipes()
+        self.assertEqual(Recipe.objects.count(), len(expected))
+
+    def test_taken_username(self):
+        """
+        Автор с username, занятым пользователем с другим email, не
+        создаётся, а его рецепты пропускаются, а не теряют автора.
+        """
+        clashing = self.authors[0]
+        expected = [
+            recipe for recipe in self.get_recipes()
+            if recipe[0] != clashing.email
+        ]
+        self.clear()
+        User.objects.create(
+            username=clashing.username,
+            email='other@foodgram.ru',
+            first_name='Имя',
+            last_name='Фамилия'
+        )
+        errors = self.import_recipes()
+        self.assertIn(clashing.email, errors)
+        self.assertEqual(self.get_recipes(), expected)
+        self.assertFalse(Recipe.objects.filter(author__isnull=True).exists())
+
+
+class GenerateDataTest(MediaRootMixin, APITestCase):
+    """Синтетические данные не задевают настоящих пользователей."""
+
+    def generate(self, *args):
+        output = io.StringIO()
+        call_command(
+            'generatedata', '--users', '5', '--recipes', '10',
+            '--follows', '2', '--favorites', '2', '--cart', '2', *args,
+            stdout=output
+        )
+        return output.getvalue()
+
+    def test_generate(self):
+        User.objects.create(
+            username='synthetic0',
+            email='synthetic0@example.com',
+            first_name='Имя',
+            last_name='Фамилия'
+        )
+        output = self.generate('--password', 'secret-password')
+        self.assertNotIn('secret-password', output)
+        self.generate()
+        generated = User.objects.exclude(username='synthetic0')
+        self.assertEqual(generated.count(), 10)
+        self.assertFalse(
+            generated.exclude(username__startswith='synthetic-').exists()
+        )
+        self.assertEqual(Recipe.objects.count(), 20)
+        self.assertEqual(verify_shopping_lists(), {})
+        call_command(
+            'reconcilecounters', '--dry-run', stdout=io.StringIO()
+        )
+
+    def test_loadtest_token(self):
+        self.generate()
+        user, other = User.objects.all()[:2]
+        Token.objects.create(user=user)
+        for email in (user.email, other.email):
+            call_command(
+                'loadtest', 'tags', 'subscriptions', '--requests', '2',
+                '--warmup', '0', '--user', email, stdout=io.StringIO()
+            )
+        self.assertEqual(
+            list(Token.objects.values_list('user', flat=True)), [user.pk]
+        )
+
+
+class StreamingBase64ImageFieldTest(SimpleTestCase):
+    """Изображение в base64 декодируется частями без потерь."""
+
+    def setUp(self):
+        buffer = io.BytesIO()
+        Image.frombytes('RGB', (200, 200), os.urandom(200 * 200 * 3)).save(
+            buffer, 'PNG'
+        )
+        self.content = buffer.getvalue()
+
+    def decode(self, payload):
+        file = StreamingBase64ImageField().to_internal_value(
+            'data:image/png;base64,' + payload
+        )
+        file.seek(0)
+        return file.read()
+
+    def test_payload_longer_than_chunk(self):
+        payload = base64.b64encode(self.content).decode()
+        self.assertGreater(len(payload), StreamingBase64ImageField.CHUNK_SIZE)
+        self.assertEqual(self.decode(payload), self.content)
+
+    def test_wrapped_payload(self):
+        """base64 в формате MIME: строки по 76 символов."""
+        for newline in ('\n', '\r\n'):
+            with self.subTest(newline=newline):
+                payload = base64.encodebytes(self.content).decode().replace(
+                    '\n', newline
+                )
+                self.assertEqual(self.decode(payload), self.content)
+
+    def test_invalid_payload(self):
+        with self.assertRaises(ValidationError):
+            self.decode(base64.b64encode(b'not an image').decode())
+
+
+class ImageVariantsTest(MediaRootMixin, RecipeTestCase):
+    """
+    Адреса копий отдаются, только когда копии построены, до этого —
+    адреса исходного изображения.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.authors[0])
+
+    def create_recipe(self, image):
+        response = self.client.post('/api/recipes/', {
+            'tags': [self.tags[0].id],
+            'ingredients': [{'id': self.ingredients[0].id, 'amount': 1}],
+            'name': 'Рецепт с изображением',
+            'text': 'Описание',
+            'cooking_time': 5,
+            'image': image,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return Recipe.objects.get(pk=response.data['id'])
+
+    def get_variants(self, recipe):
+        """Адреса копий в карточке рецепта и в обоих вариантах списка."""
+        variants = [
+            self.client.get(f'/api/recipes/{recipe.id}/').data[
+                'image_variants'
+            ]
+        ]
+        for fast in (True, False):
+            cache.clear()
+            with override_settings(RECIPE_FAST_SERIALIZATION=fast):
+                results = self.client.get(
+                    '/api/recipes/?limit=100'
+                ).data['results']
+            variants.extend(
+                result['image_variants'] for result in results
+                if result['id'] == recipe.id
+            )
+        return variants
+
+    def test_variants_ready(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            recipe = self.create_recipe(make_image())
+        self.assertFalse(recipe.image_variants_ready)
+        image_url = self.client.get(f'/api/recipes/{recipe.id}/').data[
+            'image'
+        ]
+        for variants in self.get_variants(recipe):
+            self.assertEqual(set(variants.values()), {image_url})
+        etag = self.client.get(f'/api/recipes/{recipe.id}/')['ETag']
+        for callback in callbacks:
+            callback()
+        recipe.refresh_from_db()
+        self.assertTrue(recipe.image_variants_ready)
+        for variants in self.get_variants(recipe):
+            self.assertNotIn(image_url, variants.values())
+            for url in variants.values():
+                path = url.partition('/media/')[2]
+                self.assertTrue(
+                    os.path.exists(os.path.join(self.media_root, path))
+                )
+        response = self.client.get(
+            f'/api/recipes/{recipe.id}/', HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_variants_failed(self):
+        """Если копии построить не удалось, остаются адреса исходного."""
+        with self.captureOnCommitCallbacks() as callbacks:
+            recipe = self.create_recipe(make_image('blue'))
+        os.remove(recipe.image.path)
+        with self.assertLogs('recipes.images', 'ERROR'):
+            for callback in callbacks:
+                callback()
+        recipe.refresh_from_db()
+        self.assertFalse(recipe.image_variants_ready)
+        image_url = self.client.get(f'/api/recipes/{recipe.id}/').data[
+            'image'
+        ]
+        for variants in self.get_variants(recipe):
+            self.assertEqual(set(variants.values()), {image_url})
+
+
+class CollectImagesTest(MediaRootMixin, TestCase):
+    """collectimages удаляет только файлы без ссылок старше задержки."""
+    GRACE = 60
+
+    def save_unused(self, content):
+        storage = get_image_storage()
+        name = storage.save('recipes/images/photo.png', ContentFile(content))
+        ImageBlob.objects.create(name=name)
+        ImageBlob.objects.filter(name=name).update(
+            updated_at=timezone.now() - timedelta(seconds=self.GRACE * 2)
+        )
+        return storage, name
+
+    def test_collect(self):
+        storage, name = self.save_unused(b'unused')
+        self.assertEqual(collect_images(self.GRACE, dry_run=True), [name])
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(collect_images(self.GRACE), [name])
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(ImageBlob.objects.filter(name=name).exists())
+        self.assertEqual(
+            storage.save('recipes/images/photo.png', ContentFile(b'unused')),
+            name
+        )
+        self.assertTrue(storage.exists(name))
+
+    def test_reuploaded_file_is_kept(self):
+        """Повторная загрузка того же содержимого продлевает жизнь файла."""
+        storage, name = self.save_unused(b'reused')
+        self.assertEqual(
+            storage.save('recipes/images/photo.png', ContentFile(b'reused')),
+            name
+        )
+        self.assertEqual(collect_images(self.GRACE), [])
+        self.assertTrue(storage.exists(name))
@@ -1,124 +1,257 @@
 from django.conf import settings
-from django.db.models import Sum
-from django.http.response import HttpResponse
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Prefetch, Value
+from django.http.response import FileResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 
 from django_filters.rest_framework import DjangoFilterBackend
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
-
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import (
     IsAuthenticated,
     IsAuthenticatedOrReadOnly,
 )
 from rest_framework.response import Response
 
+from recipes.caching import (
+    CachedListMixin,
+    ConditionalCatalogMixin,
+    get_catalog_versions,
+    get_not_modified,
+    make_etag,
+    set_validators,
+)
+from recipes.cookable import search_cookable
 from recipes.filters import IngredientsFilter, RecipesFilter
 from recipes.models import (
     Favorite,
+    Follow,
     Ingredient,
     IngredientRecipe,
     Recipe,
     ShoppingCart,
+    ShoppingListItem,
     Tag,
 )
 from recipes.permissions import IsAuthorOrAdminOrReadOnly
+from recipes.renderers import (
+    CSVRenderer,
+    FastJSONRenderer,
+    PDFRenderer,
+    PlainTextRenderer,
+)
 from recipes.serializers import (
+    CookableRecipeSerializer,
     FavoriteSerializer,
     IngredientsSerializer,
     RecipeCreateSerializer,
+    RecipeListSerializer,
     RecipeReadSerializer,
     ShoppingCartSerializer,
     TagSerializer,
 )
+from recipes.shopping_list import (
+    WRITERS,
+    get_recipe_amounts,
+    get_shopping_list_pdf,
+    update_shopping_lists,
+    updated_explicitly,
+)
+from users.models import CustomUser as User
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(
+    ConditionalCatalogMixin, CachedListMixin, viewsets.ModelViewSet
+):
     """Вьюсет тэгов."""
     queryset = Tag.objects.all()
+    cache_group = 'tags'
+    catalog_name = 'tags'
     serializer_class = TagSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
     pagination_class = None
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(CachedListMixin, viewsets.ModelViewSet):
     """Вьюсет рецептов."""
     queryset = Recipe.objects.all()
+    cache_group = 'recipes'
+    cache_anonymous_only = True
     permission_classes = (IsAuthorOrAdminOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipesFilter
 
+    @property
+    def cursor_ordering(self):
+        """Поля ключа для пагинации рецептов по курсору."""
+        return None if self.action == 'cookable' else ('name', 'id')
+
+    def get_user_flags(self, author):
+        """
+        Выражения для флагов избранного, списка покупок и подписки
+        на автора, на которого ссылается author.
+        """
+        user = self.request.user
+        if not user.is_authenticated:
+            return dict.fromkeys(
+                ('is_favorited', 'is_in_shopping_cart', 'is_subscribed'),
+                Value(False)
+            )
+        return {
+            'is_favorited': Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            'is_in_shopping_cart': Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            'is_subscribed': Exists(Follow.objects.filter(
+                user=user, author=OuterRef(author)
+            )),
+        }
+
+    def get_queryset(self):
+        """
+        Рецепты с флагами избранного, списка покупок и подписки на автора,
+        вычисленными одним запросом, и предзагруженными тэгами
+        и ингредиентами.
+        """
+        flags = self.get_user_flags('pk')
+        return Recipe.objects.annotate(
+            is_favorited=flags['is_favorited'],
+            is_in_shopping_cart=flags['is_in_shopping_cart'],
+        ).prefetch_related(
+            Prefetch(
+                'author',
+                queryset=User.objects.annotate(
+                    is_subscribed=flags['is_subscribed']
+                )
+            ),
+            Prefetch('tags', queryset=Tag.objects.order_by('id')),
+            Prefetch(
+                'ingrs_recipes',
+                queryset=IngredientRecipe.objects.select_related(
+                    'ingredient'
+                ).order_by('id')
+            ),
+        )
+
+    @property
+    def fast_list(self):
+        """Список рецептов сериализуется из строк, без экземпляров модели."""
+        return (
+            self.action == 'list' and settings.RECIPE_FAST_SERIALIZATION
+        )
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.fast_list:
+            return RecipeListSerializer.get_rows(queryset)
+        return queryset
+
+    def get_recipe_stamp(self, pk):
+        """
+        Всё, от чего зависит ответ retrieve, кроме справочников: дата
+        изменения рецепта, данные автора и флаги текущего пользователя.
+        """
+        try:
+            return Recipe.objects.filter(pk=pk).annotate(
+                **self.get_user_flags('author')
+            ).values(
+                'updated_at',
+                'author__email',
+                'author__username',
+                'author__first_name',
+                'author__last_name',
+                'is_favorited',
+                'is_in_shopping_cart',
+                'is_subscribed',
+            ).first()
+        except (TypeError, ValueError):
+            return None
+
+    def retrieve(self, request, *args, **kwargs):
+        """Рецепт, или ответ 304, если он не менялся с прошлого запроса."""
+        stamp = self.get_recipe_stamp(kwargs[self.lookup_field])
+        if stamp is None:
+            return super().retrieve(request, *args, **kwargs)
+        versions = get_catalog_versions()
+        etag = make_etag(
+            request, stamp, versions.get('tags'), versions.get('ingredients')
+        )
+        last_modified = None
+        if not request.user.is_authenticated:
+            last_modified = max(
+                updated_at for updated_at in (
+                    stamp['updated_at'],
+                    *(updated_at for _, updated_at in versions.values())
+                )
+            )
+        not_modified = get_not_modified(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        return set_validators(
+            super().retrieve(request, *args, **kwargs), etag, last_modified
+        )
+
     def get_serializer_class(self):
+        if self.fast_list:
+            return RecipeListSerializer
         if self.request.method == 'GET':
             return RecipeReadSerializer
         return RecipeCreateSerializer
 
-    @staticmethod
-    def get_shopping_cart(ingredients):
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = ('attachment;'
-                                           'filename="shopping_cart.pdf"')
-        shopping_cart = canvas.Canvas(response)
-        pdfmetrics.registerFont(TTFont('FreeSans', 'FreeSans.ttf'))
-        shopping_cart.setFont('FreeSans', settings.BIG_FONT)
-        shopping_cart.drawString(
-            settings.PADDING_START_TEXT,
-            settings.PADDING_BOTTOM_FIRST_ROW,
-            "Список покупок"
-        )
-        page_count = 1
-        step = settings.PADDING_BOTTOM_ROWS
-        shopping_cart.setFont('FreeSans', settings.SMALL_FONT)
-        shopping_cart.drawString(
-            settings.PADDING_START_NUMBER,
-            settings.PADDING_BOTTOM_FIRST_ROW,
-            str(page_count)
-        )
-        for ingredient in ingredients:
-            shopping_cart.drawString(
-                settings.PADDING_START_TEXT,
-                step,
-                f"{ingredient['ingredient__name']} "
-                f"({ingredient['ingredient__measurement_unit']}) - "
-                f"{ingredient['amount']}"
-            )
-            if step <= settings.SIZE_BETWEEN_ROW:
-                page_count += 1
-                step = settings.PADDING_BOTTOM_ROWS
-                shopping_cart.showPage()
-                shopping_cart.setFont('FreeSans', settings.BIG_FONT)
-                shopping_cart.drawString(
-                    settings.PADDING_START_TEXT,
-                    settings.PADDING_BOTTOM_FIRST_ROW,
-                    "Список покупок"
-                )
-                shopping_cart.setFont('FreeSans', settings.SMALL_FONT)
-                shopping_cart.drawString(
-                    settings.PADDING_START_NUMBER,
-                    settings.PADDING_BOTTOM_FIRST_ROW,
-                    str(page_count)
-                )
-            else:
-                step -= settings.SIZE_BETWEEN_ROW
-        shopping_cart.showPage()
-        shopping_cart.save()
-        return response
+    def perform_create(self, serializer):
+        serializer.save(author=self.request.user)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        """
+        Удаляет рецепт и вычитает его из списков покупок одной дельтой,
+        а не по сигналу на каждую корзину и строку ингредиентов.
+        """
+        with updated_explicitly(instance.pk):
+            update_shopping_lists(instance, get_recipe_amounts(instance), {})
+            instance.delete()
 
     @action(
         detail=False,
         methods=('GET',),
-        permission_classes=(IsAuthenticated,))
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(
+            PDFRenderer, PlainTextRenderer, CSVRenderer, FastJSONRenderer
+        ))
     def download_shopping_cart(self, request):
-        """Скачивание файла со списком покупок."""
-        ingredients = IngredientRecipe.objects.filter(
-            recipe__shopping_cart__user=request.user
+        """
+        Скачивание файла со списком покупок.
+
+        Формат выбирается по заголовку Accept или параметру ?format=
+        (pdf, txt, csv, json), по умолчанию PDF.
+        """
+        ingredients = ShoppingListItem.objects.filter(
+            user=request.user
         ).order_by('ingredient__name').values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(amount=Sum('quantity'))
-        return self.get_shopping_cart(ingredients)
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            amount=F('total'),
+        )
+        file_format = request.accepted_renderer.format
+        if file_format == PDFRenderer.format:
+            return FileResponse(
+                open(get_shopping_list_pdf(ingredients), 'rb'),
+                as_attachment=True,
+                filename='shopping_cart.pdf',
+                content_type='application/pdf',
+            )
+        writer, content_type = WRITERS[file_format]
+        response = StreamingHttpResponse(
+            writer(ingredients.iterator()),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_cart.{file_format}"'
+        )
+        return response
 
     @staticmethod
     def create_object(serializer_class, user, recipe):
@@ -133,6 +266,47 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer.save()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @staticmethod
+    def get_int_params(request, name):
+        """Целые числа из параметра name: через запятую или повторами."""
+        try:
+            return [
+                int(value)
+                for values in request.query_params.getlist(name)
+                for value in values.split(',') if value.strip()
+            ]
+        except ValueError:
+            raise ValidationError({name: 'Ожидаются целые числа.'})
+
+    @action(detail=False, methods=('GET',))
+    def cookable(self, request):
+        """
+        Рецепты из ингредиентов ingredients: сначала те, для которых есть
+        всё, затем те, где не хватает одного, и так далее. max_missing
+        ограничивает число недостающих ингредиентов.
+        """
+        ingredient_ids = self.get_int_params(request, 'ingredients')
+        if not ingredient_ids:
+            raise ValidationError({'ingredients': 'Укажите ингредиенты.'})
+        max_missing = self.get_int_params(request, 'max_missing')
+        ranking = search_cookable(
+            ingredient_ids, max_missing[0] if max_missing else None
+        )
+        page = self.paginate_queryset(ranking)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for _, recipe_id in page]
+        )
+        result = []
+        for missing_count, recipe_id in page:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.missing_count = missing_count
+                result.append(recipe)
+        serializer = CookableRecipeSerializer(
+            result, many=True, context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
+
     @action(
         detail=True,
         methods=('POST',),
@@ -141,18 +315,20 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Добавление рецепта в список покупок и удаление рецепта из него."""
         user = request.user
         recipe = get_object_or_404(Recipe, id=pk)
-        return self.create_object(
-            ShoppingCartSerializer,
-            user,
-            recipe
-        )
+        with transaction.atomic():
+            return self.create_object(
+                ShoppingCartSerializer,
+                user,
+                recipe
+            )
 
     @shopping_cart.mapping.delete
     def delete_shopping_cart(self, request, pk):
+        recipe = get_object_or_404(Recipe, id=pk)
         get_object_or_404(
             ShoppingCart,
             user=request.user.id,
-            recipe=get_object_or_404(Recipe, id=pk)
+            recipe=recipe
         ).delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -181,11 +357,14 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class IngredientsViewSet(viewsets.ModelViewSet):
+class IngredientsViewSet(
+    ConditionalCatalogMixin, CachedListMixin, viewsets.ModelViewSet
+):
     """Вьюсет ингредиентов."""
     queryset = Ingredient.objects.all()
+    cache_group = 'ingredients'
+    catalog_name = 'ingredients'
     serializer_class = IngredientsSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
     pagination_class = None
-    search_fields = ('^name', )
     filter_backends = (IngredientsFilter,)
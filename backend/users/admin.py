@@ -1,9 +1,13 @@
 from django.contrib import admin
+from recipes.pagination import EstimatedCountPaginator
 from users.models import CustomUser
 
 
 class UserAdmin(admin.ModelAdmin):
-    """Модель пользователя для админки с поиском по почте и юзернейму."""
+    """
+    Модель пользователя для админки с поиском по почте и юзернейму.
+    На PostgreSQL поиск идёт по триграммным индексам.
+    """
     list_display = (
         'username',
         'pk',
@@ -16,14 +20,18 @@ class UserAdmin(admin.ModelAdmin):
     )
     search_fields = ('email', 'username',)
     ordering = ('username',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
     get_recipes_count.short_description = 'Рецепты'
+    get_recipes_count.admin_order_field = 'recipes_count'
 
     def get_followers_count(self, obj):
-        return obj.user.count()
+        return obj.followers_count
     get_followers_count.short_description = 'Подписчики'
+    get_followers_count.admin_order_field = 'followers_count'
 
 
 # admin.site.unregister(CustomUser)
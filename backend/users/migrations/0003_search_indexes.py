@@ -0,0 +1,31 @@
+# Generated by Django 3.2.16 on 2026-10-18 03:48
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.operations
+import django.db.models.functions.text
+import foodgram.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Триграммные GIN-индексы для поиска icontains в админке на
+    PostgreSQL. Расширение pg_trgm создаёт суперпользователь или, начиная
+    с PostgreSQL 13, владелец базы; иначе его нужно создать заранее.
+    """
+
+    dependencies = [
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        django.contrib.postgres.operations.TrigramExtension(),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=foodgram.indexes.PostgresGinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('email'), name='gin_trgm_ops'), name='user_email_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=foodgram.indexes.PostgresGinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('username'), name='gin_trgm_ops'), name='user_username_trgm_idx'),
+        ),
+    ]
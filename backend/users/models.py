@@ -1,9 +1,40 @@
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import OpClass
 from django.db import models
+from django.db.models.functions import Upper
 
+from foodgram.indexes import PostgresGinIndex
 
-class CustomUser(AbstractUser):
+
+class CounterFieldsMixin:
+    """
+    Модель со счётчиками counter_fields, которые меняются только
+    через F() (recipes.counters) или другими запросами update().
+    save() существующей строки их не записывает, чтобы не затереть
+    параллельные изменения значениями, прочитанными раньше. Как и
+    обычный save(), отложенные поля (only()/defer()) не записываются.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            not args
+            and not self._state.adding
+            and kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert')
+        ):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
+class CustomUser(CounterFieldsMixin, AbstractUser):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name')
 
@@ -25,9 +56,31 @@ class CustomUser(AbstractUser):
         verbose_name='last_name',
         max_length=settings.USER_STRING_FIELD_LENGTH
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Рецепты',
+        default=0,
+        editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Подписчики',
+        default=0,
+        editable=False
+    )
+
+    counter_fields = ('recipes_count', 'followers_count')
 
     class Meta:
         ordering = ('username',)
+        indexes = [
+            PostgresGinIndex(
+                OpClass(Upper('email'), name='gin_trgm_ops'),
+                name='user_email_trgm_idx'
+            ),
+            PostgresGinIndex(
+                OpClass(Upper('username'), name='gin_trgm_ops'),
+                name='user_username_trgm_idx'
+            ),
+        ]
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
 
@@ -0,0 +1,81 @@
+from django.core.cache import cache
+from rest_framework.test import APITestCase
+
+from foodgram.nplusone import detect_n_plus_one
+from recipes.models import Follow, Recipe
+from users.models import CustomUser as User
+
+
+class UserListTest(APITestCase):
+    """Списки пользователей и подписок выполняются без N+1."""
+    AUTHOR_COUNT = 12
+    RECIPES_PER_AUTHOR = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='reader',
+            email='reader@foodgram.ru',
+            first_name='Имя',
+            last_name='Фамилия'
+        )
+        cls.authors = []
+        for number in range(cls.AUTHOR_COUNT):
+            author = User.objects.create(
+                username=f'author{number:02d}',
+                email=f'author{number:02d}@foodgram.ru',
+                first_name='Имя',
+                last_name='Фамилия'
+            )
+            for recipe_number in range(cls.RECIPES_PER_AUTHOR):
+                Recipe.objects.create(
+                    author=author,
+                    name=f'рецепт {number:02d}-{recipe_number}',
+                    text='Описание',
+                    cooking_time=10,
+                    image='recipes/images/recipe.png'
+                )
+            Follow.objects.create(user=cls.user, author=author)
+            cls.authors.append(author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_user_list(self):
+        for user in (None, self.user):
+            with self.subTest(user=user):
+                self.client.force_authenticate(user)
+                with detect_n_plus_one():
+                    response = self.client.get('/api/users/?limit=10')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), 10)
+
+    def test_subscriptions(self):
+        self.client.force_authenticate(self.user)
+        for recipes_limit, recipe_count in (
+            ('', self.RECIPES_PER_AUTHOR),
+            ('&recipes_limit=2', 2),
+        ):
+            with self.subTest(recipes_limit=recipes_limit):
+                with detect_n_plus_one():
+                    response = self.client.get(
+                        f'/api/users/subscriptions/?limit=10{recipes_limit}'
+                    )
+                self.assertEqual(response.status_code, 200)
+                results = response.data['results']
+                self.assertEqual(len(results), 10)
+                for author in results:
+                    self.assertEqual(len(author['recipes']), recipe_count)
+                    self.assertTrue(author['is_subscribed'])
+
+    def test_subscriptions_keyset(self):
+        self.client.force_authenticate(self.user)
+        url = '/api/users/subscriptions/?cursor=&limit=5'
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['count'], self.AUTHOR_COUNT)
+            ids.extend(author['id'] for author in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(ids, [author.id for author in self.authors])
@@ -1,6 +1,7 @@
+from django.db.models import Exists, OuterRef, Prefetch, Subquery, Value
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
-from recipes.models import Follow
+from recipes.models import Follow, Recipe
 from recipes.serializers import SubscribeSerializer, SubscriptionsSerializer
 from rest_framework import status
 from rest_framework.decorators import action
@@ -15,6 +16,22 @@ class UserViewSet(UserViewSet):
     """Вьюсет пользователей."""
     queryset = User.objects.all()
 
+    @property
+    def cursor_ordering(self):
+        """Поля ключа для пагинации подписок по курсору."""
+        return ('id',) if self.action == 'subscriptions' else None
+
+    def get_queryset(self):
+        """Пользователи с флагом подписки, вычисленным в том же запросе."""
+        user = self.request.user
+        if not user.is_authenticated:
+            is_subscribed = Value(False)
+        else:
+            is_subscribed = Exists(Follow.objects.filter(
+                user=user, author=OuterRef('pk')
+            ))
+        return super().get_queryset().annotate(is_subscribed=is_subscribed)
+
     @action(
         detail=True,
         methods=['POST', 'DELETE'],
@@ -44,7 +61,19 @@ class UserViewSet(UserViewSet):
     def subscriptions(self, request):
         """Список авторов, на которых подписан пользователь."""
         user = request.user
-        queryset = Follow.objects.filter(user=user)
+        recipes = Recipe.objects.all()
+        limit = SubscriptionsSerializer.get_recipes_limit(request)
+        if limit is not None:
+            recipes = recipes.filter(id__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).values('id')[:limit]
+            ))
+        queryset = Follow.objects.filter(user=user).select_related(
+            'author'
+        ).prefetch_related(
+            Prefetch('author__recipes', recipes, to_attr='recipes_preview')
+        ).order_by('id')
         pages = self.paginate_queryset(queryset)
         serializer = SubscriptionsSerializer(
             pages, many=True, context={'request': request}